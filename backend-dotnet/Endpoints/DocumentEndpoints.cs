@@ -5,21 +5,21 @@ using Microsoft.AspNetCore.Http;
 using Microsoft.EntityFrameworkCore;
 using System.Collections.Generic;
 using System.IO;
+using System.Net.Http.Headers;
 using System.Net.Http.Json;
 using System.Text.Json;
 using System.Text.Json.Serialization;
 
 namespace backend_dotnet.Endpoints;
 
-// Helper classes to model the JSON response from the Python service
-public record AnalysisResponse(
-    [property: JsonPropertyName("results")] List<AnalysisResult> Results
-);
-
-public record AnalysisResult(
-    [property: JsonPropertyName("file")] string File,
-    [property: JsonPropertyName("status")] string Status,
-    [property: JsonPropertyName("data")] JsonElement Data
+// Helper class to model one line of the streamed (NDJSON) response from the Python service:
+// "result" / "error" per file as soon as it is done, then a final "summary"
+public record AnalysisEvent(
+    [property: JsonPropertyName("event")] string Event,
+    [property: JsonPropertyName("file")] string? File,
+    [property: JsonPropertyName("status")] string? Status,
+    [property: JsonPropertyName("data")] JsonElement Data,
+    [property: JsonPropertyName("error")] string? Error
 );
 
 // DTO for API responses to shape the output correctly
@@ -50,7 +50,8 @@ public static class DocumentEndpoints
             Directory.CreateDirectory(uploadsDir);
 
             var documents = new List<MedicalDocument>();
-            var absoluteFilePaths = new List<string>();
+            var documentsByUploadName = new Dictionary<string, MedicalDocument>();
+            var uploads = new List<(IFormFile File, string UploadName)>();
 
             // Step A & B: Save each file and create a corresponding database record
             foreach (var file in files)
@@ -71,56 +72,68 @@ public static class DocumentEndpoints
                     UploadedAt = DateTime.UtcNow
                 };
                 documents.Add(document);
-                absoluteFilePaths.Add(absoluteFilePath);
+                documentsByUploadName[uniqueFileName] = document;
+                uploads.Add((file, uniqueFileName));
             }
 
             await db.Documents.AddRangeAsync(documents);
             await db.SaveChangesAsync();
 
-            // Step C: Call the Python analysis service with a list of file paths
+            // Step C: Send the file contents to the Python analysis service (no shared uploads directory needed)
             var httpClient = httpClientFactory.CreateClient();
-            var analysisServiceUrl = "http://localhost:8088/analyze";
-            var normalizedPaths = absoluteFilePaths.Select(p => p.Replace('\\', '/')).ToList();
+            var analysisServiceUrl = "http://localhost:8088/analyze/upload";
 
             try
             {
-                var response = await httpClient.PostAsJsonAsync(analysisServiceUrl, new { file_paths = normalizedPaths });
+                using var form = new MultipartFormDataContent();
+                foreach (var (file, uploadName) in uploads)
+                {
+                    var fileContent = new StreamContent(file.OpenReadStream());
+                    fileContent.Headers.ContentType = new MediaTypeHeaderValue(
+                        string.IsNullOrEmpty(file.ContentType) ? "application/pdf" : file.ContentType);
+                    form.Add(fileContent, "files", uploadName);
+                }
+
+                // ?stream=ndjson: one JSON line per file as soon as it is done, then a final summary line
+                using var request = new HttpRequestMessage(HttpMethod.Post, analysisServiceUrl + "?stream=ndjson") { Content = form };
+                using var response = await httpClient.SendAsync(request, HttpCompletionOption.ResponseHeadersRead);
 
-                // Step D: Update database records based on the new response structure
+                // Step D: Update each database record as soon as its result arrives
                 if (response.IsSuccessStatusCode)
                 {
-                    var analysisResponse = await response.Content.ReadFromJsonAsync<AnalysisResponse>();
-                    if (analysisResponse?.Results != null)
+                    // Match results using the unique upload file name as the key
+                    var documentsByPath = new Dictionary<string, MedicalDocument>(documentsByUploadName);
+
+                    using var reader = new StreamReader(await response.Content.ReadAsStreamAsync());
+                    string? line;
+                    while ((line = await reader.ReadLineAsync()) != null)
                     {
-                        // Match results using the unique, absolute file path as the key
-                        var documentsByPath = documents.ToDictionary(doc => doc.FilePath.Replace('\\', '/'));
+                        if (string.IsNullOrWhiteSpace(line)) continue;
 
-                        foreach (var result in analysisResponse.Results)
+                        var analysisEvent = JsonSerializer.Deserialize<AnalysisEvent>(line);
+                        if (analysisEvent?.File == null || !documentsByPath.TryGetValue(analysisEvent.File, out var docToUpdate))
                         {
-                            // Normalize the path from the Python response
-                            var resultPath = result.File.Replace('\\', '/');
-
-                            if (documentsByPath.TryGetValue(resultPath, out var docToUpdate))
-                            {
-                                if (result.Status == "success")
-                                {
-                                    // Serialize the "data" object back to a compact JSON string (no indentation)
-                                    docToUpdate.AnalysisJson = JsonSerializer.Serialize(result.Data);
-                                    docToUpdate.Status = "Completed";
-                                }
-                                else
-                                {
-                                    docToUpdate.Status = "Error";
-                                }
-                                documentsByPath.Remove(resultPath); // Mark as processed
-                            }
+                            continue;
                         }
 
-                        // Any documents not found in the response are marked as errors
-                        foreach (var docWithoutResult in documentsByPath.Values)
+                        if (analysisEvent.Event == "result" && analysisEvent.Status == "success")
                         {
-                            docWithoutResult.Status = "Error";
+                            // Serialize the "data" object back to a compact JSON string (no indentation)
+                            docToUpdate.AnalysisJson = JsonSerializer.Serialize(analysisEvent.Data);
+                            docToUpdate.Status = "Completed";
                         }
+                        else
+                        {
+                            docToUpdate.Status = "Error";
+                        }
+                        documentsByPath.Remove(analysisEvent.File); // Mark as processed
+                        await db.SaveChangesAsync(); // Persist incrementally - the document list shows progress
+                    }
+
+                    // Any documents not found in the response are marked as errors
+                    foreach (var docWithoutResult in documentsByPath.Values)
+                    {
+                        docWithoutResult.Status = "Error";
                     }
                 }
                 else
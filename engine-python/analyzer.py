@@ -1,11 +1,22 @@
 import os
 import json
+import hashlib
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import typing_extensions as typing
 from dotenv import load_dotenv
 from google import genai
+from google.genai import errors as genai_errors
 from openai import OpenAI
 from openai.types.chat import ChatCompletionMessageParam
+from prompt_cache import GeminiPromptCache
+from rate_limiter import get_rate_limiter, is_rate_limit_error, retry_after_seconds, backoff_delay
+from provider_health import get_provider_stats
+from transport import Transport, cassette_key
+from json_stream import ExaminationStream
+from metrics import span, timings_like, LLM_REQUEST_SECONDS, LLM_ERRORS, LLM_RETRIES, LLM_FALLBACKS, BYTES_UPLOADED
 
 # Ładujemy zmienne środowiskowe
 load_dotenv()
@@ -55,8 +66,64 @@ MEDICAL_REPORT_SCHEMA = {
     "required": ["meta", "examinations"]
 }
 
+# Schemat odpowiedzi w trybie wsadowym: jeden raport MEDICAL_REPORT_SCHEMA na każdy dokument wejściowy
+BATCH_REPORT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "documents": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "document_id": {"type": "STRING"},
+                    "report": MEDICAL_REPORT_SCHEMA
+                },
+                "required": ["document_id", "report"]
+            }
+        }
+    },
+    "required": ["documents"]
+}
+
+PROVIDER_NAMES = {'gemini': 'Gemini', 'xai': 'xAI'}
+
 class MedicalAnalyzer:
-    def __init__(self):
+    # Nazwy modeli - wchodzą też w skład odcisku konfiguracji cache wyników
+    GEMINI_MODEL = 'gemini-2.0-flash-lite'
+    XAI_MODEL = 'grok-beta'
+    # Cache kontekstu Gemini dla stałych instrukcji (prompt systemowy wysyłany raz, nie przy każdym dokumencie)
+    GEMINI_CONTEXT_CACHE_ENABLED = True
+    GEMINI_CACHE_TTL_SECONDS = 3600
+    GEMINI_CACHE_RENEW_MARGIN_SECONDS = 300  # Przedłuż TTL, gdy do wygaśnięcia zostało mniej niż tyle sekund
+    PROMPT_CACHE_REGISTRY_PATH = "cache/prompt_cache.json"  # Lokalny rejestr uchwytów cache (względem engine-python)
+    # Limity dostawców (zapytania i tokeny na minutę) - ustaw zgodnie z quota projektu/konta
+    RATE_LIMITS = {
+        'gemini': {'requests_per_minute': 30, 'tokens_per_minute': 1_000_000},
+        'xai': {'requests_per_minute': 60, 'tokens_per_minute': 100_000},
+    }
+    RATE_LIMIT_RETRIES = 4  # Ile razy ponawiamy zapytanie po 429, zanim przełączymy dostawcę
+    RATE_LIMIT_BACKOFF_SECONDS = 2  # Bazowe opóźnienie (podwajane przy kolejnych próbach)
+    RATE_LIMIT_MAX_BACKOFF_SECONDS = 60
+    # Routing wg ruchomych statystyk: dostawca z serią błędów jest pomijany przez okres przerwy
+    PROVIDER_STATS_CONFIG = {'window': 50, 'cooldown_seconds': 120, 'max_consecutive_failures': 3,
+                             'max_error_rate': 0.5, 'min_samples': 10}
+    # Hedging: zapasowy dostawca startuje równolegle, gdy główny odpowiada dłużej niż percentyl jego czasów
+    HEDGING_ENABLED = False
+    HEDGE_LATENCY_PERCENTILE = 95
+    HEDGE_DEFAULT_DELAY_SECONDS = 20  # Próg, dopóki nie zebrano min_samples pomiarów
+    HEDGE_MAX_WORKERS = 8
+    # Tryb wsadowy: kilka krótkich dokumentów w jednym zapytaniu (mniej zapytań przy limicie RPM)
+    BATCH_MAX_DOCUMENTS = 8
+    BATCH_MAX_TOKENS = 12000  # Budżet (szacowanych) tokenów samych dokumentów w jednym zapytaniu
+    # Streaming: odpowiedź czytana kawałkami, zamknięte sekcje "examinations" trafiają dalej przed końcem odpowiedzi
+    LLM_STREAMING = True
+    RAW_RESPONSE_PRINT_LIMIT = 2000  # Ile znaków surowej odpowiedzi wypisujemy w logu (None = całość)
+    transport = Transport()  # Domyślnie zwykłe zapytania (bez nagrywania)
+
+    def __init__(self, transport=None):
+        # Nagrywanie/odtwarzanie odpowiedzi dostawców (transport.Transport)
+        if transport is not None:
+            self.transport = transport
         self.gemini_key = os.getenv("GEMINI_API_KEY")
         self.xai_key = os.getenv("XAI_API_KEY")
 
@@ -126,51 +193,342 @@ class MedicalAnalyzer:
         3. Nie modyfikuj sztucznie nazwy ("name") dopiskami w nawiasach - aplikacja rozróżni je po jednostce.
         """
 
-    def analyze_text(self, text, provider='gemini'):
+        # Dla xAI musimy dodać instrukcję JSON, bo usunęliśmy ją z głównego promptu.
+        # Prompt jest stały, więc xAI może go odczytać ze swojego cache prefiksów.
+        self.xai_system_prompt = self.system_prompt + "\n\nOUTPUT FORMAT: JSON matching {meta: {date_examination: str}, examinations: [{examination_name: str, code_icd: str, results: [{name: str, value: float, unit: str, range_min: float|null, range_max: float|null, flag: str|null}]}]}"
+        self.xai_conversation_id = "morfolog-" + hashlib.sha256(self.xai_system_prompt.encode("utf-8")).hexdigest()[:16]
+
+        # Instrukcje rejestrowane raz w cache kontekstu Gemini
+        self.gemini_prompt_cache = None
+        if self.gemini_client and self.GEMINI_CONTEXT_CACHE_ENABLED:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            self.gemini_prompt_cache = GeminiPromptCache(
+                self.gemini_client,
+                self.GEMINI_MODEL,
+                self.system_prompt,
+                os.path.join(current_dir, self.PROMPT_CACHE_REGISTRY_PATH),
+                ttl_seconds=self.GEMINI_CACHE_TTL_SECONDS,
+                renew_margin_seconds=self.GEMINI_CACHE_RENEW_MARGIN_SECONDS,
+            )
+
+        # Wątki dla równoległych (zabezpieczających) zapytań w trybie hedging
+        self._hedge_executor = ThreadPoolExecutor(max_workers=self.HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge") \
+            if self.HEDGING_ENABLED else None
+
+        # Statystyki tokenów promptu: ile przyszło z cache dostawcy (tokeny tańsze i szybsze)
+        self.token_usage = {
+            provider: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+            for provider in ("gemini", "xai")
+        }
+        self._usage_lock = threading.Lock()
+
+    def analyze_text(self, text, provider='gemini', timings=None, on_section=None):
         """
         Główna funkcja analizująca.
-        provider: 'gemini' lub 'xai'.
-        Automatycznie przełącza się na drugiego dostawcę w przypadku błędu.
+        provider: 'gemini' lub 'xai' (dostawca preferowany).
+        timings: opcjonalna lista, do której trafiają czasy zapytań i parsowania (metrics.span).
+        on_section: opcjonalne on_section(indeks, sekcja, meta) wołane dla każdej sekcji "examinations"
+        zaraz po jej odebraniu (LLM_STREAMING). Po ponowieniu lub zmianie dostawcy sekcje przychodzą
+        jeszcze raz od indeksu 0 - rozstrzyga zwrócony wynik.
+        Automatycznie przełącza się na drugiego dostawcę w przypadku błędu, a dostawcę
+        w okresie przerwy po serii błędów pomija od razu.
         """
         if not text:
             return None
 
-        primary_func = self._query_gemini if provider == 'gemini' else self._query_xai
-        fallback_func = self._query_xai if provider == 'gemini' else self._query_gemini
-        fallback_name = 'xAI' if provider == 'gemini' else 'Gemini'
+        primary, secondary = self._route(provider)
+        if self.HEDGING_ENABLED:
+            return self._analyze_hedged(text, primary, secondary, timings, on_section)
 
         try:
-            print(f"   [AI] Próba analizy przez: {provider.upper()}...")
-            raw_json = primary_func(text)
-            return self._process_response(raw_json)
+            print(f"   [AI] Próba analizy przez: {primary.upper()}...")
+            return self._analyze_with(primary, text, timings, on_section)
         except Exception as e:
-            print(f"⚠️ Błąd dostawcy {provider.upper()}: {e}")
-            print(f"🔄 Przełączanie na: {fallback_name}...")
+            print(f"⚠️ Błąd dostawcy {primary.upper()}: {e}")
+            print(f"🔄 Przełączanie na: {PROVIDER_NAMES[secondary]}...")
+            LLM_FALLBACKS.inc(from_provider=primary, to_provider=secondary)
 
             try:
-                raw_json = fallback_func(text)
-                return self._process_response(raw_json)
+                return self._analyze_with(secondary, text, timings, on_section)
             except Exception as e2:
-                print(f"❌ Błąd zapasowego dostawcy {fallback_name}: {e2}")
+                print(f"❌ Błąd zapasowego dostawcy {PROVIDER_NAMES[secondary]}: {e2}")
                 return None
 
-    def _query_gemini(self, text):
+    def _provider_stats(self, provider):
+        return get_provider_stats(provider, **self.PROVIDER_STATS_CONFIG)
+
+    def _route(self, provider):
+        """Zwraca (główny, zapasowy); dostawca w okresie przerwy po serii błędów idzie na drugie miejsce."""
+        other = 'xai' if provider == 'gemini' else 'gemini'
+        if not self._provider_stats(provider).is_available() and self._provider_stats(other).is_available():
+            print(f"   [AI] {PROVIDER_NAMES[provider]} w przerwie po serii błędów - używam {PROVIDER_NAMES[other]}.")
+            return other, provider
+        return provider, other
+
+    def _analyze_with(self, provider, text, timings=None, on_section=None):
+        """Zapytanie do jednego dostawcy i sparsowanie odpowiedzi; niepoprawny JSON liczy się jako błąd dostawcy."""
+        stream = ExaminationStream(on_section) if on_section is not None and self.LLM_STREAMING else None
+        with span("llm", timings, provider=provider) as tags:
+            data = self._call_provider(provider, text, stream=stream,
+                                       parse=lambda raw_json: self._parse_timed(raw_json, provider, timings))
+            if stream is not None:
+                tags["sections"] = stream.section_count
+        return data
+
+    def _parse_timed(self, raw_json, provider, timings=None):
+        with span("parse_json", timings, provider=provider):
+            return self._process_response(raw_json)
+
+    def _analyze_hedged(self, text, primary, secondary, timings=None, on_section=None):
+        """
+        Tryb hedging: jeśli główny dostawca nie odpowie w czasie percentyla HEDGE_LATENCY_PERCENTILE
+        swoich ostatnich odpowiedzi (albo zwróci błąd), startuje zapytanie do zapasowego.
+        Wygrywa pierwszy poprawny wynik; wolniejsze zapytanie kończy się w tle (trafia do statystyk).
+        Równoległe próby mają własne czasy i bufor sekcji (_hedged_attempt) - do wywołującego trafiają
+        czasy prób zakończonych przed wynikiem i sekcje wyłącznie zwycięzcy, po rozstrzygnięciu.
+        """
+        hedge_delay = self._provider_stats(primary).latency_percentile(self.HEDGE_LATENCY_PERCENTILE)
+        if hedge_delay is None:
+            hedge_delay = self.HEDGE_DEFAULT_DELAY_SECONDS
+
+        print(f"   [AI] Próba analizy przez: {primary.upper()} (zapasowy {secondary.upper()} po {hedge_delay:.1f}s)...")
+        streaming = on_section is not None
+        futures = {self._hedge_executor.submit(self._hedged_attempt, primary, text, streaming, timings): primary}
+        done, pending = wait(futures, timeout=hedge_delay)
+        if not done:
+            print(f"⏱️ {PROVIDER_NAMES[primary]} odpowiada dłużej niż {hedge_delay:.1f}s - równoległe zapytanie do {PROVIDER_NAMES[secondary]}")
+            hedge = self._hedge_executor.submit(self._hedged_attempt, secondary, text, streaming, timings)
+            futures[hedge] = secondary
+            pending.add(hedge)
+
+        while done or pending:
+            for future in done:
+                provider = futures[future]
+                data, error, attempt_timings, sections = future.result()
+                if timings is not None:
+                    timings.extend(attempt_timings)
+                if error is not None:
+                    print(f"⚠️ Błąd dostawcy {provider.upper()}: {error}")
+                    if len(futures) == 1:
+                        # Główny zawiódł przed startem zapasowego - zwykłe przełączenie
+                        print(f"🔄 Przełączanie na: {PROVIDER_NAMES[secondary]}...")
+                        LLM_FALLBACKS.inc(from_provider=primary, to_provider=secondary)
+                        fallback = self._hedge_executor.submit(self._hedged_attempt, secondary, text, streaming, timings)
+                        futures[fallback] = secondary
+                        pending.add(fallback)
+                    continue
+                if data:
+                    if len(futures) > 1:
+                        print(f"   [AI] Szybszy wynik od: {PROVIDER_NAMES[provider]}")
+                    if on_section is not None:
+                        for index in sorted(sections):
+                            on_section(index, *sections[index])
+                    return data
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        print("❌ Żaden dostawca nie zwrócił poprawnego wyniku.")
+        return None
+
+    def _hedged_attempt(self, provider, text, streaming=False, parent_timings=None):
+        """
+        Jedna z równoległych prób hedging: zwraca (dane, błąd, czasy, sekcje) zamiast rzucać wyjątek.
+        Czasy próby trafiają do własnej listy (z tagami dokumentu z parent_timings), nie do listy wywołującego.
+        Sekcje strumienia są buforowane (indeks -> (sekcja, meta)); ponowienie nadpisuje te same indeksy.
+        """
+        timings, sections = timings_like(parent_timings), {}
+        on_section = (lambda index, section, meta: sections.__setitem__(index, (section, meta))) if streaming else None
+        try:
+            return self._analyze_with(provider, text, timings, on_section), None, timings, sections
+        except Exception as e:
+            return None, e, timings, sections
+
+    def analyze_batch(self, documents, provider='gemini', timings=None, document_timings=None):
+        """
+        Analiza wielu dokumentów w zapytaniach wsadowych.
+        documents: słownik {id dokumentu: zanonimizowany tekst}.
+        Zwraca słownik {id dokumentu: dane lub None}. Dokumenty, których nie udało się
+        odczytać z odpowiedzi wsadowej (lub cała porcja zakończona błędem), są analizowane pojedynczo.
+        timings: czasy zapytań wsadowych (każde zapytanie raz).
+        document_timings: opcjonalny słownik {id dokumentu: lista czasów dokumentu}. Dokument odczytany
+        z odpowiedzi wsadowej dostaje czasy zapytania oznaczone shared=True i batch_size (czas wspólny, nie
+        własny), a dokument analizowany pojedynczo - tylko czasy własnej analizy.
+        """
+        document_timings = document_timings or {}
+        results = {}
+        for batch_ids in self._pack_batches(documents):
+            if len(batch_ids) > 1:
+                batch_timings = []
+                try:
+                    results.update(self._analyze_batch_request({doc_id: documents[doc_id] for doc_id in batch_ids}, provider, batch_timings))
+                except Exception as e:
+                    print(f"⚠️ Błąd zapytania wsadowego ({len(batch_ids)} dok.): {e} - analiza pojedyncza.")
+                if timings is not None:
+                    timings.extend(batch_timings)
+                for doc_id in batch_ids:
+                    if results.get(doc_id) is not None and doc_id in document_timings:
+                        doc_tags = getattr(document_timings[doc_id], "tags", {})
+                        document_timings[doc_id].extend(dict(entry, shared=True, batch_size=len(batch_ids), **doc_tags)
+                                                        for entry in batch_timings)
+
+            for doc_id in batch_ids:
+                if results.get(doc_id) is None:
+                    results[doc_id] = self.analyze_text(documents[doc_id], provider=provider,
+                                                        timings=document_timings.get(doc_id, timings))
+        return results
+
+    def _pack_batches(self, documents):
+        """Dzieli dokumenty na porcje mieszczące się w BATCH_MAX_DOCUMENTS i BATCH_MAX_TOKENS."""
+        batches = []
+        current, current_tokens = [], 0
+        for doc_id, text in documents.items():
+            if not text:
+                continue
+            tokens = len(text) // 3
+            if current and (len(current) >= self.BATCH_MAX_DOCUMENTS or current_tokens + tokens > self.BATCH_MAX_TOKENS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(doc_id)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _analyze_batch_request(self, documents, provider, timings=None):
+        """Jedno zapytanie dla kilku dokumentów; zwraca {id: raport} dla poprawnie zwróconych dokumentów."""
+        primary, _ = self._route(provider)
+        parts = [
+            f"Poniżej znajduje się {len(documents)} NIEZALEŻNYCH dokumentów. Przeanalizuj każdy osobno "
+            "według powyższych zasad (nie mieszaj wyników między dokumentami).",
+            'OUTPUT FORMAT: JSON {"documents": [{"document_id": str, "report": <raport jak wyżej>}]} '
+            "- dokładnie jeden wpis dla każdego identyfikatora dokumentu.",
+        ]
+        for doc_id, text in documents.items():
+            parts.append(f"=== DOKUMENT {doc_id} ===\n{text}\n=== KONIEC DOKUMENTU {doc_id} ===")
+
+        print(f"   [AI] Zapytanie wsadowe: {len(documents)} dokumentów przez {primary.upper()}...")
+        with span("llm_batch", timings, provider=primary, documents=len(documents)):
+            data = self._call_provider(primary, "\n\n".join(parts), response_schema=BATCH_REPORT_SCHEMA,
+                                       parse=lambda raw_json: self._parse_timed(raw_json, primary, timings))
+
+        reports = {}
+        for entry in data.get("documents", []) if isinstance(data, dict) else []:
+            doc_id = str(entry.get("document_id"))
+            report = entry.get("report")
+            if doc_id in documents and isinstance(report, dict) and isinstance(report.get("examinations"), list):
+                reports[doc_id] = report
+        missing = len(documents) - len(reports)
+        if missing:
+            print(f"⚠️ Odpowiedź wsadowa bez {missing} dokumentów - zostaną przeanalizowane pojedynczo.")
+        return reports
+
+    def _estimate_tokens(self, text):
+        """Zgrubne oszacowanie tokenów zapytania (instrukcje + dokument) na potrzeby limitu TPM."""
+        return (len(self.system_prompt) + len(text)) // 3
+
+    def _call_provider(self, provider, text, stream=None, parse=None, **query_kwargs):
+        """
+        Wysyła zapytanie do dostawcy w ramach wspólnego limitu RPM/TPM.
+        Po 429 (limit/quota) czeka z wykładniczym opóźnieniem i ponawia u tego samego dostawcy.
+        stream: opcjonalny json_stream.ExaminationStream - odpowiedź czytana strumieniem trafia do niego kawałkami.
+        parse: opcjonalna funkcja parsująca odpowiedź; zwracany jest jej wynik, a jej błąd (np. niepoprawny JSON)
+        liczy się jako błąd dostawcy. Wynik zapytania trafia do statystyk dostawcy raz, po parsowaniu.
+        query_kwargs trafiają do _query_gemini/_query_xai (np. response_schema w trybie wsadowym).
+        """
+        parse = parse or (lambda raw_json: raw_json)
+        key = self._cassette_key(provider, text, query_kwargs.get('response_schema')) if self.transport.active else None
+        if self.transport.replaying:
+            # Odpowiedź z kasety: bez sieci, limitera i statystyk dostawcy
+            raw_json = self.transport.replay(provider, key).decode("utf-8")
+            if stream is not None:
+                stream.finish(raw_json)
+            return parse(raw_json)
+        if stream is not None:
+            query_kwargs['on_chunk'] = stream.feed
+
+        query_func = self._query_gemini if provider == 'gemini' else self._query_xai
+        limiter = get_rate_limiter(provider, **self.RATE_LIMITS[provider])
+        estimated_tokens = self._estimate_tokens(text)
+
+        stats = self._provider_stats(provider)
+        payload_bytes = len(text.encode("utf-8"))
+
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+            limiter.acquire(estimated_tokens)
+            # Czas mierzony bez oczekiwania w limiterze - to opóźnienie dostawcy, nie nasze
+            started = time.monotonic()
+            BYTES_UPLOADED.inc(payload_bytes, target=provider)
+            if stream is not None:
+                stream.reset()
+            try:
+                raw_json = query_func(text, **query_kwargs)
+                if stream is not None:
+                    stream.finish(raw_json)
+                latency = time.monotonic() - started
+                LLM_REQUEST_SECONDS.observe(latency, provider=provider)
+                self.transport.record(provider, key, raw_json.encode("utf-8"), latency)
+                result = parse(raw_json)
+                stats.record_success(latency)
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.RATE_LIMIT_RETRIES:
+                    stats.record_failure()
+                    LLM_ERRORS.inc(provider=provider)
+                    raise
+                LLM_RETRIES.inc(provider=provider)
+                delay = backoff_delay(attempt, self.RATE_LIMIT_BACKOFF_SECONDS, self.RATE_LIMIT_MAX_BACKOFF_SECONDS,
+                                      retry_after=retry_after_seconds(e))
+                # Przerwa dotyczy wszystkich wątków - limit jest wspólny dla dostawcy
+                limiter.pause(delay)
+                print(f"⏳ Limit zapytań {provider.upper()} (429) - ponowienie za {delay:.1f}s "
+                      f"(próba {attempt + 1}/{self.RATE_LIMIT_RETRIES})")
+
+    def _cassette_key(self, provider, text, response_schema=None):
+        """Klucz nagrania: dostawca, model, instrukcje, schemat i tekst dokumentu."""
+        if provider == 'gemini':
+            model, prompt = self.GEMINI_MODEL, self.system_prompt
+            response_schema = response_schema or MEDICAL_REPORT_SCHEMA
+        else:
+            model, prompt = self.XAI_MODEL, self.xai_system_prompt
+        return cassette_key(provider, model, prompt, json.dumps(response_schema, sort_keys=True), text)
+
+    def _query_gemini(self, text, response_schema=MEDICAL_REPORT_SCHEMA, on_chunk=None):
+        """on_chunk: przy streamingu wołane z każdym kawałkiem tekstu odpowiedzi (generate_content_stream)."""
         if not self.gemini_client:
             raise Exception("Klient Gemini nie jest skonfigurowany.")
         
-        model_name = 'gemini-2.0-flash-lite'
+        model_name = self.GEMINI_MODEL
         print(f"   [AI] Wysyłanie zapytania do modelu: {model_name}...")
         
-        response = self.gemini_client.models.generate_content(
-            model=model_name,
-            contents=f"{self.system_prompt}\n{text}",
-            config={
-                'response_mime_type': 'application/json',
-                'response_schema': MEDICAL_REPORT_SCHEMA,
-                'temperature': 0.0,
-            }
-        )
-        
+        config = {
+            'response_mime_type': 'application/json',
+            'response_schema': response_schema,
+            'temperature': 0.0,
+        }
+        # Instrukcje z cache kontekstu - w zapytaniu wysyłamy tylko tekst dokumentu
+        cache_name = self.gemini_prompt_cache.get_name() if self.gemini_prompt_cache else None
+        if cache_name:
+            config['cached_content'] = cache_name
+        else:
+            config['system_instruction'] = self.system_prompt
+
+        try:
+            response, raw_text = self._generate_gemini(model_name, text, config, on_chunk)
+        except genai_errors.ClientError as e:
+            if not cache_name or e.code not in (403, 404):
+                raise
+            # Cache wygasł lub został usunięty po stronie API - ponów z instrukcjami w zapytaniu
+            print(f"⚠️ Cache instrukcji niedostępny ({e.code}) - ponawiam bez cache.")
+            self.gemini_prompt_cache.invalidate()
+            del config['cached_content']
+            config['system_instruction'] = self.system_prompt
+            response, raw_text = self._generate_gemini(model_name, text, config, on_chunk)
+
+        usage = response.usage_metadata
+        if usage is not None:
+            self._record_usage('gemini', usage.prompt_token_count, usage.cached_content_token_count)
+
         if not response.candidates:
             feedback = getattr(response, 'prompt_feedback', 'Brak szczegółów.')
             raise Exception(f"Odpowiedź zablokowana (brak kandydatów). Powód: {feedback}")
@@ -179,29 +537,85 @@ class MedicalAnalyzer:
         if candidate.finish_reason != 'STOP':
             raise Exception(f"Generowanie odpowiedzi przerwane. Powód: '{candidate.finish_reason}'. Safety ratings: {candidate.safety_ratings}")
 
-        return response.text
+        return raw_text
 
-    def _query_xai(self, text):
+    def _generate_gemini(self, model_name, text, config, on_chunk=None):
+        """
+        Zwraca (odpowiedź, tekst). Przy on_chunk odpowiedź czytana strumieniem - ostatni kawałek
+        niesie usage_metadata i finish_reason, więc to on jest zwracany jako odpowiedź.
+        """
+        if on_chunk is None:
+            response = self.gemini_client.models.generate_content(model=model_name, contents=text, config=config)
+            return response, response.text
+
+        response, parts = None, []
+        for response in self.gemini_client.models.generate_content_stream(model=model_name, contents=text, config=config):
+            chunk = response.text if response.candidates else None
+            if chunk:
+                parts.append(chunk)
+                on_chunk(chunk)
+        if response is None:
+            raise Exception("Pusta odpowiedź strumieniowa Gemini.")
+        return response, "".join(parts)
+
+    def _query_xai(self, text, response_schema=None, on_chunk=None):
+        # xAI nie dostaje schematu - format odpowiedzi opisuje prompt (także w trybie wsadowym)
         if not self.xai_client:
             raise Exception("Klient xAI nie jest skonfigurowany.")
 
-        # Dla xAI musimy dodać instrukcję JSON, bo usunęliśmy ją z głównego promptu
-        xai_prompt = self.system_prompt + "\n\nOUTPUT FORMAT: JSON matching {meta: {date_examination: str}, examinations: [{examination_name: str, code_icd: str, results: [{name: str, value: float, unit: str, range_min: float|null, range_max: float|null, flag: str|null}]}]}"
-
         messages: list[ChatCompletionMessageParam] = [
-            {"role": "system", "content": xai_prompt},
+            {"role": "system", "content": self.xai_system_prompt},
             {"role": "user", "content": text},
         ]
+        request = {
+            "model": self.XAI_MODEL,
+            "messages": messages,
+            # xAI cache'uje wspólny prefiks promptu automatycznie; stały identyfikator kieruje
+            # zapytania z tym samym promptem systemowym na ten sam serwer (wyższy współczynnik trafień)
+            "extra_headers": {"x-grok-conv-id": self.xai_conversation_id},
+        }
+
+        if on_chunk is None:
+            response = self.xai_client.chat.completions.create(**request)
+            self._record_xai_usage(response.usage)
+            return response.choices[0].message.content
+
+        # Streaming: zużycie tokenów przychodzi w ostatnim kawałku (include_usage)
+        parts, usage = [], None
+        for chunk in self.xai_client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True}):
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                on_chunk(chunk.choices[0].delta.content)
+        self._record_xai_usage(usage)
+        return "".join(parts)
+
+    def _record_xai_usage(self, usage):
+        if usage is not None:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            self._record_usage('xai', usage.prompt_tokens, getattr(details, 'cached_tokens', None))
 
-        response = self.xai_client.chat.completions.create(
-            model="grok-beta",
-            messages=messages
-        )
-        return response.choices[0].message.content
+    def _record_usage(self, provider, prompt_tokens, cached_tokens):
+        """Zlicza tokeny promptu i wypisuje, ile z nich dostawca odczytał z cache."""
+        prompt_tokens = prompt_tokens or 0
+        cached_tokens = cached_tokens or 0
+        with self._usage_lock:
+            stats = self.token_usage[provider]
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            total_cached, total_requests = stats["cached_tokens"], stats["requests"]
+        print(f"   [AI] Tokeny promptu: {prompt_tokens}, z cache: {cached_tokens} "
+              f"(łącznie zaoszczędzono {total_cached} w {total_requests} zapytaniach {provider.upper()})")
 
     def _process_response(self, raw_text):
         """Czyści markdown i zwraca sparsowany obiekt JSON."""
-        print(f"--- SUROWA ODPOWIEDŹ Z API ---\n{raw_text}\n-----------------------------")
+        preview = raw_text
+        if self.RAW_RESPONSE_PRINT_LIMIT is not None and len(raw_text) > self.RAW_RESPONSE_PRINT_LIMIT:
+            # Długie raporty nie zalewają logu - sparsowany wynik i tak trafia do magazynu artefaktów
+            preview = f"{raw_text[:self.RAW_RESPONSE_PRINT_LIMIT]}\n... (pominięto {len(raw_text) - self.RAW_RESPONSE_PRINT_LIMIT} znaków)"
+        print(f"--- SUROWA ODPOWIEDŹ Z API ---\n{preview}\n-----------------------------")
         clean_json = re.sub(r'```json|```', '', raw_text).strip()
         if not clean_json:
             raise json.JSONDecodeError("Otrzymano pustą odpowiedź z API po oczyszczeniu.", "", 0)
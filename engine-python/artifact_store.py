@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from metrics import span
+
+# Rodzaje artefaktów dokumentu
+ARTIFACT_RAW_OCR = "raw_ocr"  # Surowy tekst stron (OCR / warstwa tekstowa PDF)
+ARTIFACT_CLEANED = "cleaned"  # Tekst po anonimizacji
+ARTIFACT_RESULT = "result"  # Końcowy JSON z wynikami
+INTERMEDIATE_ARTIFACTS = (ARTIFACT_RAW_OCR, ARTIFACT_CLEANED)
+
+ARTIFACT_EXTENSIONS = {ARTIFACT_RAW_OCR: ".txt", ARTIFACT_CLEANED: ".txt", ARTIFACT_RESULT: ".json"}
+
+_STOP = object()
+
+
+class ArtifactStore:
+    """
+    Artefakty dokumentów (surowy OCR, tekst zanonimizowany, wynik JSON) adresowane identyfikatorem
+    dokumentu (SHA-256 treści) i rodzajem artefaktu.
+    Zapis nie blokuje potoku: put() tylko kolejkuje rekord, a wątek zapisujący zapisuje porcje
+    (do batch_size rekordów albo po flush_interval s) jednym wywołaniem backendu.
+    Rekordy czekające w kolejce są widoczne dla get() od razu po put().
+    Backend implementuje _write_batch(rekordy) i _read(document_id, rodzaj).
+    """
+    def __init__(self, batch_size=64, flush_interval=0.5, save_intermediate=True):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.save_intermediate = save_intermediate
+        self._queue = queue.Queue()
+        self._pending = {}  # (document_id, rodzaj) -> rekord jeszcze niezapisany
+        self._pending_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="artifact-writer", daemon=True)
+        self._writer.start()
+
+    def put(self, document_id, kind, name, payload):
+        """
+        Kolejkuje zapis artefaktu (bajty). name to nazwa pliku źródłowego - tylko informacyjnie.
+        Artefakty pośrednie są pomijane przy save_intermediate=False.
+        """
+        if not self.accepts(kind):
+            return
+        record = (document_id, kind, name, payload, time.time())
+        with self._pending_lock:
+            self._pending[(document_id, kind)] = record
+        self._queue.put(record)
+
+    def accepts(self, kind):
+        """Czy artefakt tego rodzaju jest zapisywany (pośrednie można wyłączyć)."""
+        return self.save_intermediate or kind not in INTERMEDIATE_ARTIFACTS
+
+    def put_text(self, document_id, kind, name, text):
+        self.put(document_id, kind, name, text.encode("utf-8"))
+
+    def put_json(self, document_id, kind, name, data):
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        self.put(document_id, kind, name, payload.encode("utf-8"))
+
+    def get(self, document_id, kind):
+        """Zwraca bajty artefaktu albo None."""
+        with self._pending_lock:
+            record = self._pending.get((document_id, kind))
+        if record is not None:
+            return record[3]
+        return self._read(document_id, kind)
+
+    def get_text(self, document_id, kind):
+        payload = self.get(document_id, kind)
+        return None if payload is None else payload.decode("utf-8")
+
+    def get_json(self, document_id, kind):
+        payload = self.get(document_id, kind)
+        return None if payload is None else json.loads(payload)
+
+    def flush(self):
+        """Czeka, aż wszystkie zakolejkowane artefakty zostaną zapisane."""
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    def _next_batch(self):
+        """Porcja rekordów z kolejki; (porcja, czy zatrzymać wątek)."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                record = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _STOP:
+                self._queue.task_done()
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def _write_loop(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self._next_batch()
+            if not batch:
+                self._queue.task_done()
+                break
+            try:
+                with span("artifact_write", records=len(batch)):
+                    self._write_batch(batch)
+            except Exception as e:
+                print(f"❌ [ARTEFAKTY] Nie udało się zapisać {len(batch)} artefaktów: {e}")
+            finally:
+                with self._pending_lock:
+                    for record in batch:
+                        key = (record[0], record[1])
+                        # Nowszy put() tego samego artefaktu czeka jeszcze w kolejce - zostaw go
+                        if self._pending.get(key) is record:
+                            del self._pending[key]
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def _read(self, document_id, kind):
+        raise NotImplementedError
+
+
+class SqliteArtifactStore(ArtifactStore):
+    """Artefakty jako skompresowane (zlib) bloby w jednej bazie SQLite - porcja zapisywana jedną transakcją."""
+    def __init__(self, db_path, **kwargs):
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    document_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    name TEXT,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (document_id, kind)
+                )
+            """)
+        super().__init__(**kwargs)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _write_batch(self, records):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                [(document_id, kind, name, zlib.compress(payload), len(payload), created_at)
+                 for document_id, kind, name, payload, created_at in records],
+            )
+
+    def _read(self, document_id, kind):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload FROM artifacts WHERE document_id = ? AND kind = ?", (document_id, kind)
+            ).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+
+class FileArtifactStore(ArtifactStore):
+    """
+    Artefakty jako zwykłe pliki: <katalog>/<rodzaj>/<2 pierwsze znaki id>/<id>.<rozszerzenie>.
+    Bez kompresji - do podglądu wyników przy debugowaniu; podkatalogi ograniczają liczbę plików w katalogu.
+    """
+    def __init__(self, root_dir, **kwargs):
+        self.root_dir = root_dir
+        super().__init__(**kwargs)
+
+    def path_for(self, document_id, kind):
+        return os.path.join(self.root_dir, kind, document_id[:2], document_id + ARTIFACT_EXTENSIONS[kind])
+
+    def _write_batch(self, records):
+        for document_id, kind, _name, payload, _created_at in records:
+            path = self.path_for(document_id, kind)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+
+    def _read(self, document_id, kind):
+        try:
+            with open(self.path_for(document_id, kind), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,460 @@
+"""
+Benchmark end-to-end potoku bez zewnętrznych usług.
+Generuje syntetyczne, wielostronicowe PDF-y z wynikami badań (z warstwą tekstową i "skany"),
+a Google Vision i dostawców AI zastępuje lokalnymi atrapami z zadanym opóźnieniem i odsetkiem błędów.
+Mierzy process_single_file, endpoint /analyze i main(): dokumenty/s, p50/p95/p99 dokumentu
+i każdego etapu (metrics.span) oraz szczytowe RSS. Wynik w JSON - do porównania między commitami.
+
+Uruchomienie (z katalogu engine-python):
+    python benchmarks/bench_pipeline.py --documents 40 --output bench.json
+    python benchmarks/bench_pipeline.py --documents 40 --llm-error-rate 0.1 --compare bench.json
+"""
+import argparse
+import copy
+import datetime
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use("Agg")  # Benchmark działa bez wyświetlacza
+import numpy as np
+import pdfplumber
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+from PIL import Image, ImageDraw
+
+import main as pipeline_main
+import metrics
+from analyzer import MedicalAnalyzer, MEDICAL_REPORT_SCHEMA
+
+MODES = ("single", "analyze", "main")
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_TEMPLATE_PATH = os.path.join(ENGINE_DIR, "tests", "test_data", "expected-31_12_25_morfologia.json")
+
+
+# --- Syntetyczne dokumenty ---
+
+def _report_lines(report, page, pages):
+    """Wiersze tabeli wyników w układzie raportu laboratoryjnego (część wyników na każdą stronę)."""
+    lines = [f"Data pobrania: {report['meta']['date_examination']} 07:45", f"Strona {page + 1} z {pages}", ""]
+    for examination in report["examinations"]:
+        lines.append(f"{examination['examination_name']} (ICD-9: {examination['code_icd']})")
+        results = examination["results"]
+        per_page = math.ceil(len(results) / pages)
+        for result in results[page * per_page:(page + 1) * per_page]:
+            value = str(result["value"]).replace(".", ",")
+            norm = f"{result['range_min']} - {result['range_max']}" if result["range_max"] is not None else ""
+            lines.append(f"{result['name']} {value} {result['flag'] or ''} {result['unit']} {norm}")
+    return lines
+
+
+def make_lab_pdf(path, report, pages, scanned):
+    """PDF z tabelą wyników: z warstwą tekstową (matplotlib, fonty TrueType) albo same obrazy stron."""
+    if scanned:
+        images = []
+        for page in range(pages):
+            image = Image.new("L", (827, 1169), 255)
+            draw = ImageDraw.Draw(image)
+            for row, line in enumerate(_report_lines(report, page, pages)):
+                draw.text((60, 60 + row * 22), line, fill=0)
+            images.append(image)
+        images[0].save(path, "PDF", save_all=True, append_images=images[1:], resolution=100)
+        return
+
+    with matplotlib.rc_context({"pdf.fonttype": 42}), PdfPages(path) as pdf:
+        for page in range(pages):
+            fig = Figure(figsize=(8.27, 11.69))
+            for row, line in enumerate(_report_lines(report, page, pages)):
+                fig.text(0.07, 0.95 - row * 0.025, line, fontsize=9)
+            pdf.savefig(fig)
+
+
+def generate_documents(output_dir, count, pages, scanned_ratio, seed):
+    """Tworzy `count` raportów z różnymi datami; zwraca listę ścieżek."""
+    with open(REPORT_TEMPLATE_PATH, encoding="utf-8") as f:
+        template = json.load(f)
+
+    rng = random.Random(seed)
+    start = datetime.date(2020, 1, 1)
+    paths = []
+    for index in range(count):
+        report = copy.deepcopy(template)
+        report["meta"]["date_examination"] = (start + datetime.timedelta(days=7 * index)).isoformat()
+        for examination in report["examinations"]:
+            for result in examination["results"]:
+                if isinstance(result["value"], (int, float)):
+                    result["value"] = round(result["value"] * rng.uniform(0.8, 1.2), 2)
+        path = os.path.join(output_dir, f"wyniki-{index:04d}.pdf")
+        make_lab_pdf(path, report, pages, scanned=rng.random() < scanned_ratio)
+        paths.append(path)
+    return paths
+
+
+# --- Atrapy usług zewnętrznych ---
+
+class SimulatedProviderError(Exception):
+    pass
+
+
+class SimulatedRateLimitError(Exception):
+    code = 429
+
+
+def _delay(base_seconds, jitter):
+    if base_seconds > 0:
+        time.sleep(base_seconds * random.uniform(1 - jitter, 1 + jitter))
+
+
+class BenchVisionOCR:
+    """Zamiennik GoogleVisionOCR: rasteryzacja i OCR z opóźnieniem, tekst stron z warstwy PDF lub szablonu."""
+    def __init__(self, raster_latency, ocr_latency, error_rate, jitter, batch_size=4, max_concurrency=4, page_bytes=300_000):
+        self.raster_latency = raster_latency
+        self.ocr_latency = ocr_latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.page_bytes = page_bytes
+
+    def iter_page_images(self, file_path, pages=None, content=None):
+        if pages is None:
+            with pdfplumber.open(file_path if content is None else io.BytesIO(content)) as pdf:
+                pages = range(len(pdf.pages))
+        for page in pages:
+            _delay(self.raster_latency, self.jitter)
+            yield bytes(self.page_bytes)  # Bufor wielkości typowej strony JPEG
+
+    def ocr_images(self, contents):
+        contents = list(contents)
+        # Porcje po batch_size stron, najwyżej max_concurrency zapytań naraz - jak GoogleVisionOCR
+        rounds = math.ceil(math.ceil(len(contents) / self.batch_size) / self.max_concurrency)
+        for _ in range(rounds):
+            _delay(self.ocr_latency, self.jitter)
+        metrics.BYTES_UPLOADED.inc(sum(len(content) for content in contents), target="vision")
+        if random.random() < self.error_rate:
+            raise SimulatedProviderError("Symulowany błąd Vision API")
+        return [f"Morfologia krwi (ICD-9: C55)\nStrona zeskanowana {index + 1}" for index in range(len(contents))]
+
+
+class BenchAnalyzer(MedicalAnalyzer):
+    """
+    MedicalAnalyzer z zapytaniami do Gemini/xAI zastąpionymi atrapą. Routing, limiter,
+    ponowienia po 429, przełączanie dostawców i parsowanie odpowiedzi działają jak w produkcji.
+    """
+    GEMINI_CONTEXT_CACHE_ENABLED = False
+    RATE_LIMITS = {
+        'gemini': {'requests_per_minute': 100_000, 'tokens_per_minute': 10**9},
+        'xai': {'requests_per_minute': 100_000, 'tokens_per_minute': 10**9},
+    }
+    RATE_LIMIT_BACKOFF_SECONDS = 0.05
+    RATE_LIMIT_MAX_BACKOFF_SECONDS = 1
+
+    latency = {"gemini": 1.0, "xai": 1.5}
+    error_rate = 0.0
+    rate_limit_rate = 0.0
+    jitter = 0.3
+
+    def __init__(self, transport=None):
+        super().__init__(transport)
+        with open(REPORT_TEMPLATE_PATH, encoding="utf-8") as f:
+            self._template = json.load(f)
+
+    stream_chunk_chars = 256  # Streaming: odpowiedź oddawana kawałkami tej długości
+
+    def _fake_response(self, provider, text, on_chunk=None):
+        _delay(self.latency[provider], self.jitter)
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            raise SimulatedRateLimitError(f"Symulowany limit 429 ({provider})")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise SimulatedProviderError(f"Symulowany błąd dostawcy {provider}")
+
+        report = copy.deepcopy(self._template)
+        # Data z tekstu dokumentu (różne daty = osobne punkty serii w magazynie)
+        digest = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        report["meta"]["date_examination"] = (datetime.date(2000, 1, 1) + datetime.timedelta(days=digest % 9000)).isoformat()
+        self._record_usage(provider, len(text) // 3, 0)
+        raw_json = json.dumps(report, ensure_ascii=False)
+        if on_chunk is not None:
+            for start in range(0, len(raw_json), self.stream_chunk_chars):
+                on_chunk(raw_json[start:start + self.stream_chunk_chars])
+        return raw_json
+
+    def _query_gemini(self, text, response_schema=MEDICAL_REPORT_SCHEMA, on_chunk=None):
+        return self._fake_response("gemini", text, on_chunk)
+
+    def _query_xai(self, text, response_schema=None, on_chunk=None):
+        return self._fake_response("xai", text, on_chunk)
+
+
+# --- Pomiar ---
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4)}
+
+
+def peak_rss_mb():
+    """Szczytowe RSS procesu (MB) albo None, jeśli system go nie udostępnia."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux podaje KB, macOS bajty
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+class SpanCollector:
+    """Zbiera surowe czasy etapów (metrics.span) do liczenia percentyli."""
+    def __init__(self):
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name, seconds, tags):
+        with self._lock:
+            self.spans.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        with self._lock:
+            return {name: {**_percentiles(values), "total": round(sum(values), 4)} for name, values in sorted(self.spans.items())}
+
+
+def _counter_totals(counter):
+    # Odczyt po zakończeniu pomiaru - żaden wątek już nie zapisuje
+    return {"|".join(key) or "total": value for key, value in sorted(counter.values.items())}
+
+
+def configure(args, work_dir):
+    """Przestawia konfigurację main.py na katalog tymczasowy i atrapy usług."""
+    pipeline_main.RESULT_CACHE_PATH = os.path.join(work_dir, "cache", "results.sqlite")
+    pipeline_main.RESULTS_STORE_PATH = os.path.join(work_dir, "data", "lab_results.sqlite")
+    pipeline_main.INGEST_MANIFEST_PATH = os.path.join(work_dir, "data", "ingest_manifest.json")
+    pipeline_main.ARTIFACT_STORE_PATH = os.path.join(work_dir, "data", "artifacts.sqlite")
+    pipeline_main.ARTIFACT_FILES_DIR = os.path.join(work_dir, "data", "artifacts")
+    pipeline_main.CHARTS_DIR = os.path.join(work_dir, "data", "charts")
+    pipeline_main.CHART_MODE = "files"
+    pipeline_main.USE_GOOGLE_VISION = True
+    pipeline_main.LOCAL_PARSER_ENABLED = args.local_parser
+
+    BenchAnalyzer.latency = {"gemini": args.llm_latency, "xai": args.llm_latency * 1.5}
+    BenchAnalyzer.error_rate = args.llm_error_rate
+    BenchAnalyzer.rate_limit_rate = args.llm_429_rate
+    BenchAnalyzer.jitter = args.jitter
+
+    vision = BenchVisionOCR(args.raster_latency, args.vision_latency, args.vision_error_rate, args.jitter)
+    # main() tworzy własne instancje - podmieniamy fabryki
+    key_path = os.path.join(work_dir, "gcp_key.json")
+    open(key_path, "w").close()
+    pipeline_main.GCP_KEY_PATH = key_path
+    pipeline_main.create_vision_ocr = lambda _key_path: vision
+    pipeline_main.MedicalAnalyzer = BenchAnalyzer
+    return vision
+
+
+def run_single(paths, vision):
+    """process_single_file dla każdego pliku po kolei (ścieżka /jobs i pojedynczych wywołań)."""
+    analyzer = BenchAnalyzer()
+    results_store = pipeline_main.create_results_store()
+    latencies, errors = [], 0
+    for path in paths:
+        started = time.perf_counter()
+        try:
+            data = pipeline_main.process_single_file(path, vision, analyzer, None, results_store)
+        except Exception:
+            data = None
+        latencies.append(time.perf_counter() - started)
+        errors += data is None
+    return latencies, errors
+
+
+def run_analyze(paths, vision, request_size):
+    """POST /analyze (TestClient, ta sama aplikacja co server.py) w porcjach po request_size plików."""
+    from fastapi.testclient import TestClient
+    import server
+
+    latencies, errors = [], 0
+    with TestClient(server.app) as client:
+        server.vision_ocr = vision
+        server.analyzer = BenchAnalyzer()
+        server.result_cache = None
+        for start in range(0, len(paths), request_size):
+            chunk = paths[start:start + request_size]
+            response = client.post("/analyze", json={"file_paths": chunk})
+            body = response.json()
+            # Czas dokumentu w potoku (z oczekiwaniem w kolejkach) z rozbicia zwracanego przez /analyze
+            for entry in body["results"] + body["errors"]:
+                if "timings" in entry:
+                    latencies.append(entry["timings"]["total_seconds"])
+            errors += body["error_count"]
+    return latencies, errors
+
+
+def run_main(paths):
+    """main() na katalogu z plikami: manifest, potok, magazyn wyników i wykresy do plików."""
+    pipeline_main.main(uploads_dir=os.path.dirname(paths[0]))
+    # main() nie zwraca wyników ani czasów dokumentów - liczba błędów z licznika dokumentów
+    errors = metrics.DOCUMENTS.value(status="error") + metrics.DOCUMENTS.value(status="empty")
+    return None, errors
+
+
+def run_mode(mode, args):
+    """Jeden tryb w bieżącym procesie (osobny proces na tryb = osobny pomiar szczytowego RSS)."""
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory(prefix="morfolog-bench-") as work_dir:
+        uploads_dir = os.path.join(work_dir, "uploads")
+        os.makedirs(uploads_dir)
+        paths = generate_documents(uploads_dir, args.documents, args.pages, args.scanned_ratio, args.seed)
+        vision = configure(args, work_dir)
+
+        collector = SpanCollector()
+        metrics.add_span_listener(collector)
+        started = time.perf_counter()
+        if mode == "single":
+            latencies, errors = run_single(paths, vision)
+        elif mode == "analyze":
+            latencies, errors = run_analyze(paths, vision, args.request_size)
+        else:
+            latencies, errors = run_main(paths)
+        # Artefakty zapisywane w tle - pomiar obejmuje dokończenie zapisu (i musi się skończyć przed usunięciem katalogu)
+        artifact_store = pipeline_main.get_artifact_store()
+        if artifact_store is not None:
+            artifact_store.close()
+        wall = time.perf_counter() - started
+        metrics.remove_span_listener(collector)
+
+    return {
+        "documents": len(paths),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "docs_per_sec": round(len(paths) / wall, 3) if wall else None,
+        "document_seconds": _percentiles(latencies) if latencies is not None else None,
+        "stages": collector.summary(),
+        "counters": {
+            "llm_fallbacks": _counter_totals(metrics.LLM_FALLBACKS),
+            "llm_retries": _counter_totals(metrics.LLM_RETRIES),
+            "llm_errors": _counter_totals(metrics.LLM_ERRORS),
+            "uploaded_bytes": _counter_totals(metrics.BYTES_UPLOADED),
+            "pages": _counter_totals(metrics.PAGES),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ENGINE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Zmiana przepustowości (dodatnia = szybciej) i p95 etapów (dodatnia = wolniej) względem poprzedniego wyniku."""
+    lines = [f"Porównanie z {baseline.get('commit')} -> {current.get('commit')}:"]
+    for mode, result in current["modes"].items():
+        base = baseline.get("modes", {}).get(mode)
+        if not base or not base.get("docs_per_sec"):
+            continue
+        change = (result["docs_per_sec"] / base["docs_per_sec"] - 1) * 100
+        lines.append(f"  {mode}: {base['docs_per_sec']} -> {result['docs_per_sec']} dok/s ({change:+.1f}%), "
+                     f"RSS {base['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        for stage, stats in result["stages"].items():
+            base_p95 = base["stages"].get(stage, {}).get("p95")
+            if base_p95 and stats["p95"] is not None:
+                lines.append(f"    {stage:<14} p95 {base_p95:.4f}s -> {stats['p95']:.4f}s ({(stats['p95'] / base_p95 - 1) * 100:+.1f}%)")
+    return "\n".join(lines)
+
+
+def _forward_args(args):
+    """Opcje pomiaru przekazywane do procesu potomnego."""
+    forwarded = []
+    for key, value in vars(args).items():
+        if key in ("modes", "output", "compare", "in_process"):
+            continue
+        option = "--" + key.replace("_", "-")
+        if isinstance(value, bool):
+            forwarded += [option] if value else []
+        else:
+            forwarded += [option, str(value)]
+    return forwarded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3, help="Liczba stron każdego dokumentu")
+    parser.add_argument("--scanned-ratio", type=float, default=0.5, help="Udział dokumentów bez warstwy tekstowej (ścieżka OCR)")
+    parser.add_argument("--raster-latency", type=float, default=0.05, help="Opóźnienie rasteryzacji strony (s)")
+    parser.add_argument("--vision-latency", type=float, default=0.4, help="Opóźnienie zapytania Vision (s)")
+    parser.add_argument("--vision-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Opóźnienie Gemini (s); xAI = 1.5x")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Odsetek błędów dostawcy (przełączenie na zapasowego)")
+    parser.add_argument("--llm-429-rate", type=float, default=0.0, help="Odsetek odpowiedzi 429 (ponowienie z backoffem)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Rozrzut opóźnień: +/- ten ułamek")
+    parser.add_argument("--request-size", type=int, default=4, help="Plików w jednym zapytaniu /analyze")
+    parser.add_argument("--local-parser", action="store_true", help="Włącz parser lokalny (domyślnie wszystko idzie przez atrapę AI)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Zapisz wynik JSON do pliku")
+    parser.add_argument("--compare", help="Plik JSON z poprzedniego uruchomienia do porównania")
+    parser.add_argument("--in-process", action="store_true", help=argparse.SUPPRESS)  # Tryb procesu potomnego
+    args = parser.parse_args()
+
+    if args.in_process:
+        # Proces potomny: jeden tryb, wynik jako ostatnia linia stdout
+        result = run_mode(args.modes[0], args)
+        print("\n" + json.dumps(result))
+        return
+
+    results = {}
+    for mode in args.modes:
+        # Każdy tryb w osobnym procesie - szczytowe RSS i liczniki metryk nie mieszają się między trybami
+        command = [sys.executable, os.path.abspath(__file__), "--in-process", "--modes", mode] + _forward_args(args)
+        completed = subprocess.run(command, cwd=ENGINE_DIR, capture_output=True, text=True, encoding="utf-8")
+        if completed.returncode != 0:
+            print(completed.stdout[-2000:], completed.stderr[-4000:], file=sys.stderr)
+            raise SystemExit(f"Tryb {mode} zakończył się błędem.")
+        results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{mode}: {results[mode]['docs_per_sec']} dok/s, peak RSS {results[mode]['peak_rss_mb']} MB", file=sys.stderr)
+
+    report = {
+        "benchmark": "pipeline",
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "in_process")},
+        "modes": results,
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
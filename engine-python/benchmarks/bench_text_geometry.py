@@ -0,0 +1,117 @@
+"""
+Mikro-benchmark rekonstrukcji wierszy z geometrii słów (Google Vision).
+Porównuje pierwotną implementację (słownik na słowo, pętla po słowach)
+z wersją wektorową NumPy na syntetycznych, gęstych stronach tabel laboratoryjnych.
+
+Uruchomienie (z katalogu engine-python):
+    python benchmarks/bench_text_geometry.py --words 3000 --repeat 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google_vision_ocr import GoogleVisionOCR
+from text_geometry import _words_to_lines_py, words_to_lines
+
+
+def make_dense_page(word_count, columns=8, seed=0):
+    """Buduje obiekt o strukturze odpowiedzi Vision: gęsta tabela z lekko "pływającymi" wierszami."""
+    rng = random.Random(seed)
+    words = []
+    rows = max(1, word_count // columns)
+    for row in range(rows):
+        base_y = 40 + row * 28
+        for col in range(columns):
+            height = rng.randint(14, 22)
+            top = base_y + rng.randint(-4, 4)
+            left = 60 + col * 180 + rng.randint(-6, 6)
+            width = rng.randint(30, 150)
+            text = rng.choice(["Leukocyty", "5,53", "tys/ul", "4,00", "10,00", "H", "L", "MCV", "%"])
+            vertices = [
+                SimpleNamespace(x=left, y=top),
+                SimpleNamespace(x=left + width, y=top),
+                SimpleNamespace(x=left + width, y=top + height),
+                SimpleNamespace(x=left, y=top + height),
+            ]
+            words.append(SimpleNamespace(
+                symbols=[SimpleNamespace(text=ch) for ch in text],
+                bounding_box=SimpleNamespace(vertices=vertices),
+            ))
+    # Vision zwraca słowa pogrupowane w bloki w kolejności "czytania", nie po Y
+    rng.shuffle(words)
+    paragraph = SimpleNamespace(words=words)
+    page = SimpleNamespace(blocks=[SimpleNamespace(paragraphs=[paragraph])])
+    return SimpleNamespace(full_text_annotation=SimpleNamespace(pages=[page]))
+
+
+def extract_word_dicts(response):
+    """Pierwotna ekstrakcja: słownik na słowo."""
+    words = []
+    for page in response.full_text_annotation.pages:
+        for block in page.blocks:
+            for paragraph in block.paragraphs:
+                for word in paragraph.words:
+                    word_text = "".join([symbol.text for symbol in word.symbols])
+                    vs = word.bounding_box.vertices
+                    ys = [v.y for v in vs if v.y is not None]
+                    xs = [v.x for v in vs if v.x is not None]
+                    if not ys or not xs: continue
+                    min_y, max_y = min(ys), max(ys)
+                    words.append({"text": word_text, "y": (min_y + max_y) / 2, "x": min(xs), "height": max_y - min_y})
+    return words
+
+
+def reconstruct_reference(response, y_tolerance=10):
+    """Pierwotna ścieżka: słownik na słowo + pętla grupowania w Pythonie."""
+    return _words_to_lines_py(extract_word_dicts(response), y_tolerance=y_tolerance)
+
+
+def _best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--words", type=int, nargs="+", default=[500, 3000, 10000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    ocr = GoogleVisionOCR.__new__(GoogleVisionOCR)  # bez klienta API - liczymy tylko CPU
+    results = []
+    for word_count in args.words:
+        response = make_dense_page(word_count)
+        ref_time, ref_text = _best_of(lambda: reconstruct_reference(response), args.repeat)
+        new_time, new_text = _best_of(lambda: ocr.reconstruct_text_from_geometry(response), args.repeat)
+
+        # Samo grupowanie wierszy (bez odczytu struktur odpowiedzi)
+        words = extract_word_dicts(response)
+        ref_group_time, _ = _best_of(lambda: _words_to_lines_py(words), args.repeat)
+        new_group_time, _ = _best_of(lambda: words_to_lines(words), args.repeat)
+
+        results.append({
+            "words": word_count,
+            "reference_ms": round(ref_time * 1000, 3),
+            "numpy_ms": round(new_time * 1000, 3),
+            "speedup": round(ref_time / new_time, 2) if new_time else None,
+            "clustering_reference_ms": round(ref_group_time * 1000, 3),
+            "clustering_numpy_ms": round(new_group_time * 1000, 3),
+            "clustering_speedup": round(ref_group_time / new_group_time, 2) if new_group_time else None,
+            "identical_output": ref_text == new_text,
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure  # Figure bez pyplot - renderowanie Agg, bez okna i bez wyświetlacza
+
+CHART_STYLE_VERSION = 1  # Zmiana wyglądu wykresu = zmiana wersji, aby nie serwować starych obrazów
+CHART_FORMATS = ("png", "svg")
+
+# Jedna pula procesów na cały proces serwera, tworzona przy pierwszym renderowaniu.
+# Kontekst "spawn": pula powstaje w wątku roboczym serwera, a fork przy trzymanych przez inne wątki
+# blokadach mógłby zakleszczyć proces potomny.
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool(workers):
+    """Zwraca współdzieloną pulę procesów renderujących (tworzy ją leniwie)."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _render_pool
+
+
+def shutdown_render_pool():
+    """Zamyka współdzieloną pulę (zamknięcie serwera); kolejne renderowanie utworzy nową."""
+    global _render_pool
+    with _render_pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def chart_slice(df, param):
+    """Wycinek tabeli potrzebny do wykresu parametru: data, wartość, zakres normy i flaga (tylko wiersze z wartością)."""
+    columns = ['Date', param] + [col for col in (f"{param}_min", f"{param}_max", f"{param}_flag") if col in df.columns]
+    return df[columns].dropna(subset=[param])
+
+
+def draw_parameter(ax, subset, param):
+    """Rysuje trend jednego parametru (wstęga normy, linia, punkty z flagami H/L) na osi `ax`."""
+    # --- RYSOWANIE ZAKRESU REFERENCYJNEGO (WSTĘGA) ---
+    min_col = f"{param}_min"
+    max_col = f"{param}_max"
+
+    if min_col in subset.columns and max_col in subset.columns:
+        # fillna(0) dla minimum obsługuje przypadki typu "< 5" (gdzie min to null)
+        vals_min = subset[min_col].fillna(0)
+        vals_max = subset[max_col]
+
+        # Rysujemy wstęgę tylko jeśli mamy dane o maksimum
+        if vals_max.notna().any():
+            ax.fill_between(subset['Date'], vals_min, vals_max, color='green', alpha=0.15, label='Zakres normy')
+
+    # Główna linia trendu łącząca wszystkie punkty
+    ax.plot(subset['Date'], subset[param], linestyle='-', color='gray', linewidth=1, zorder=1)
+
+    # Domyślne, zielone markery dla wszystkich punktów
+    ax.scatter(subset['Date'], subset[param], color='teal', zorder=2, label='W normie')
+
+    # Sprawdzenie i narysowanie punktów z flagami, które przykryją domyślne markery
+    flag_col_name = f"{param}_flag"
+    if flag_col_name in subset.columns:
+        high_points = subset[subset[flag_col_name] == 'H']
+        low_points = subset[subset[flag_col_name] == 'L']
+        ax.scatter(high_points['Date'], high_points[param], color='red', s=80, zorder=3, edgecolors='black', label='Powyżej normy (H)')
+        ax.scatter(low_points['Date'], low_points[param], color='blue', s=80, zorder=3, edgecolors='black', label='Poniżej normy (L)')
+
+    ax.set_title(f'Trend parametru: {param}', fontsize=12)
+    ax.set_ylabel('Wartość')
+    ax.grid(True, linestyle='--', alpha=0.6)
+    ax.tick_params(axis='x', rotation=30)
+    ax.legend()
+
+
+def _render_chart(param, subset, output_path, chart_format, dpi):
+    """Renderuje wykres jednego parametru do pliku (uruchamiane w procesie roboczym)."""
+    fig = Figure(figsize=(10, 4))
+    ax = fig.subplots()
+    draw_parameter(ax, subset, param)
+    fig.tight_layout()
+
+    # Zapis przez plik tymczasowy - serwer nigdy nie odda niekompletnego obrazu
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format=chart_format, dpi=dpi)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+class ChartRenderer:
+    """
+    Renderowanie wykresów bez wyświetlacza (Agg): jeden plik PNG/SVG na parametr, w puli procesów.
+    Nazwa pliku to skrót wycinka danych parametru, więc po dopisaniu nowych badań
+    renderowane są ponownie tylko wykresy, których dane się zmieniły.
+    """
+    def __init__(self, output_dir, workers=4, chart_format="png", dpi=100):
+        if chart_format not in CHART_FORMATS:
+            raise ValueError(f"Nieobsługiwany format wykresu: {chart_format}")
+        self.output_dir = output_dir
+        self.workers = workers
+        self.chart_format = chart_format
+        self.dpi = dpi
+        os.makedirs(output_dir, exist_ok=True)
+
+    def chart_name(self, param, subset):
+        """Nazwa pliku wykresu: skrót parametru, jego danych i wersji stylu."""
+        digest = hashlib.sha256()
+        digest.update(f"{CHART_STYLE_VERSION}|{self.chart_format}|{self.dpi}|{param}|".encode("utf-8"))
+        digest.update(subset.to_json(orient="split", date_format="iso", index=False).encode("utf-8"))
+        return f"{digest.hexdigest()[:32]}.{self.chart_format}"
+
+    def path_for(self, chart_name):
+        return os.path.join(self.output_dir, chart_name)
+
+    def render(self, df, parameters):
+        """
+        Zwraca słownik {parametr: nazwa pliku}. Wykresy, których plik już istnieje (te same dane),
+        nie są renderowane ponownie; brakujące renderuje pula procesów.
+        """
+        charts = {}
+        todo = []
+        for param in parameters:
+            subset = chart_slice(df, param)
+            if subset.empty:
+                continue
+            name = self.chart_name(param, subset)
+            charts[param] = name
+            if not os.path.exists(self.path_for(name)):
+                todo.append((param, subset, self.path_for(name)))
+
+        if not todo:
+            return charts
+
+        print(f"📈 [WYKRESY] Renderowanie {len(todo)} z {len(charts)} wykresów (pozostałe bez zmian).")
+        if self.workers <= 1 or len(todo) == 1:
+            # Pojedynczy wykres - start puli procesów kosztuje więcej niż samo renderowanie
+            for param, subset, output_path in todo:
+                _render_chart(param, subset, output_path, self.chart_format, self.dpi)
+            return charts
+
+        pool = get_render_pool(self.workers)
+        futures = [
+            pool.submit(_render_chart, param, subset, output_path, self.chart_format, self.dpi)
+            for param, subset, output_path in todo
+        ]
+        for future in futures:
+            future.result()
+        return charts
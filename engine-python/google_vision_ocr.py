@@ -1,126 +1,205 @@
 import os
-import io
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from google.cloud import vision
-from pdf2image import convert_from_path
 from collections import defaultdict
+from pdf_raster import DEFAULT_DPI, iter_pdf_pages, encode_page
+from text_geometry import lines_from_arrays
+from metrics import BYTES_UPLOADED
+from transport import Transport, cassette_key
+
+class PageOCRError(Exception):
+    """OCR nie powiódł się dla części stron. errors: {numer strony (od 0): komunikat}."""
+    def __init__(self, errors, pages_text):
+        self.errors = errors
+        self.pages_text = pages_text
+        pages = ", ".join(str(page + 1) for page in sorted(errors))
+        details = "; ".join(f"strona {page + 1}: {msg}" for page, msg in sorted(errors.items()))
+        super().__init__(f"Błąd OCR na stronach: {pages} ({details})")
 
 class GoogleVisionOCR:
-    def __init__(self, key_path, poppler_path=None):
+    transport = Transport()  # Domyślnie zwykłe zapytania (bez nagrywania)
+
+    def __init__(self, key_path, poppler_path=None, batch_size=4, max_concurrency=4,
+                 dpi=DEFAULT_DPI, grayscale=False, thread_count=1, transport=None):
         """
         Inicjalizuje klienta Google Vision API.
         :param key_path: Ścieżka do pliku JSON z kluczem konta serwisowego.
         :param poppler_path: Ścieżka do binariów Poppler (wymagane dla PDF).
+        :param batch_size: Ile stron wysyłamy w jednym zapytaniu batch_annotate_images (maks. 16).
+        :param max_concurrency: Maksymalna liczba równoległych zapytań do Vision API
+                                (wspólna dla wszystkich dokumentów - pilnuje limitów quota).
+        :param dpi: Rozdzielczość rasteryzacji stron PDF.
+        :param grayscale: Rasteryzacja w odcieniach szarości (mniejsze obrazy do wysłania).
+        :param thread_count: Ile stron pdftoppm renderuje równolegle (tyle też trzyma w pamięci).
+        :param transport: Nagrywanie/odtwarzanie odpowiedzi (transport.Transport); w trybie replay klucz nie jest potrzebny.
         """
-        self.client = vision.ImageAnnotatorClient.from_service_account_json(key_path)
+        if transport is not None:
+            self.transport = transport
+        self.client = None if self.transport.replaying else vision.ImageAnnotatorClient.from_service_account_json(key_path)
         self.poppler_path = poppler_path
+        self.batch_size = max(1, min(batch_size, 16))
+        self.max_concurrency = max(1, max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="vision-ocr")
+        self.dpi = dpi
+        self.grayscale = grayscale
+        self.thread_count = thread_count
 
     def extract_text(self, file_path):
         """
         Główna metoda: obsługuje pliki PDF i obrazy, zwraca listę stron (tekst).
+        Strony są rasteryzowane pojedynczo i wysyłane do OCR zaraz po zakodowaniu,
+        więc w pamięci nie trzyma się bitmap całego dokumentu.
+        """
+        try:
+            pages = self.iter_page_images(file_path)
+            if pages is None:
+                return None
+            return self.ocr_images(pages)
+
+        except Exception as e:
+            print(f"Błąd podczas przetwarzania Vision API: {e}")
+            return None
+
+    def iter_page_images(self, file_path, pages=None, content=None):
         """
-        if not os.path.exists(file_path):
+        Zwraca generator bajtów obrazów kolejnych stron albo None dla błędnego pliku.
+        Bitmapa strony jest zwalniana zaraz po zakodowaniu do JPEG.
+        Gdy podano content, dokument jest czytany z pamięci, a file_path służy tylko do rozpoznania formatu.
+        """
+        if content is None and not os.path.exists(file_path):
             print(f"Błąd: Nie znaleziono pliku {file_path}")
             return None
 
         file_ext = os.path.splitext(file_path)[1].lower()
-        pages_text = []
 
-        try:
-            if file_ext == '.pdf':
-                if not self.poppler_path:
-                    print("Ostrzeżenie: Brak ścieżki do Poppler. Obsługa PDF może nie działać.")
-                
-                # Konwersja PDF na obrazy
-                images = convert_from_path(file_path, poppler_path=self.poppler_path)
-                
-                for img in images:
-                    # Konwersja PIL Image na bytes
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG')
-                    content = img_byte_arr.getvalue()
-                    
-                    # Przetwarzanie obrazu
-                    text = self._process_image_content(content)
-                    pages_text.append(text)
-
-            elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-                with open(file_path, "rb") as image_file:
-                    content = image_file.read()
-                
-                text = self._process_image_content(content)
-                pages_text.append(text)
-            
-            else:
-                print(f"Błąd: Nieobsługiwany format pliku: {file_ext}")
-                return None
+        if file_ext == '.pdf':
+            if not self.poppler_path:
+                print("Ostrzeżenie: Brak ścieżki do Poppler. Obsługa PDF może nie działać.")
 
-            return pages_text
+            # Konwersja PDF na obrazy - strona po stronie
+            images = iter_pdf_pages(file_path if content is None else content, poppler_path=self.poppler_path, dpi=self.dpi,
+                                    grayscale=self.grayscale, thread_count=self.thread_count, pages=pages)
+            return (encode_page(img, format='JPEG') for _, img in images)
 
-        except Exception as e:
-            print(f"Błąd podczas przetwarzania Vision API: {e}")
+        elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
+            if content is not None:
+                return iter([content])
+            with open(file_path, "rb") as image_file:
+                return iter([image_file.read()])
+
+        else:
+            print(f"Błąd: Nieobsługiwany format pliku: {file_ext}")
             return None
 
-    def _process_image_content(self, image_content):
-        image = vision.Image(content=image_content)
+    def ocr_images(self, contents):
+        """
+        Wysyła obrazy stron do Vision API i zwraca listę tekstów (w kolejności stron).
+        contents może być listą lub generatorem - strony są grupowane po batch_size
+        w zapytania batch_annotate_images i wysyłane od razu, równolegle (maks. max_concurrency naraz).
+        Liczba oczekujących zapytań jest ograniczona, więc generator nie wyprzedza OCR.
+        Jeśli któraś strona się nie powiedzie, rzuca PageOCRError z numerami stron.
+        """
+        pages_text = {}
+        errors = {}
+        futures = {}
+        max_in_flight = self.max_concurrency * 2
+
+        def collect(done):
+            for future in done:
+                start, count = futures.pop(future)
+                try:
+                    responses = future.result()
+                except Exception as e:
+                    for page in range(start, start + count):
+                        errors[page] = str(e)
+                    continue
+
+                for offset, response in enumerate(responses):
+                    if response.error.message:
+                        errors[start + offset] = response.error.message
+                    else:
+                        # Używamy nowej funkcji rekonstrukcji geometrii
+                        pages_text[start + offset] = self.reconstruct_text_from_geometry(response)
+
+        page_count = 0
+        chunk = []
+        for content in contents:
+            chunk.append(content)
+            page_count += 1
+            if len(chunk) == self.batch_size:
+                futures[self.executor.submit(self._annotate_batch, chunk)] = (page_count - len(chunk), len(chunk))
+                chunk = []
+                if len(futures) >= max_in_flight:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    collect(done)
+        if chunk:
+            futures[self.executor.submit(self._annotate_batch, chunk)] = (page_count - len(chunk), len(chunk))
+
+        collect(wait(futures).done)
+
+        ordered = [pages_text.get(page) for page in range(page_count)]
+        if errors:
+            raise PageOCRError(errors, ordered)
+
+        return ordered
+
+    def _annotate_batch(self, chunk):
+        """Jedno zapytanie batch_annotate_images dla kilku stron."""
         # Używamy document_text_detection, bo zwraca gęstą strukturę
-        response = self.client.document_text_detection(image=image)
-        
-        if response.error.message:
-            raise Exception(f'{response.error.message}')
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        # Nagrania per strona (skrót bajtów obrazu) - odtwarzanie nie zależy od podziału na porcje
+        keys = [cassette_key(feature.type_.name, content) for content in chunk] if self.transport.active else []
+        if self.transport.replaying:
+            return [vision.AnnotateImageResponse.deserialize(payload)
+                    for payload in self.transport.replay_many("vision", keys)]
+
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+            for content in chunk
+        ]
+        BYTES_UPLOADED.inc(sum(len(content) for content in chunk), target="vision")
+        started = time.monotonic()
+        response = self.client.batch_annotate_images(requests=requests)
+        latency = time.monotonic() - started
 
-        # Używamy nowej funkcji rekonstrukcji geometrii
-        return self.reconstruct_text_from_geometry(response)
+        responses = list(response.responses)
+        for key, page_response in zip(keys, responses):
+            if not page_response.error.message:
+                self.transport.record("vision", key, vision.AnnotateImageResponse.serialize(page_response), latency)
+        return responses
 
     def reconstruct_text_from_geometry(self, response, y_tolerance=10):
         """
         Sortuje słowa po ich fizycznym położeniu (Y), ignorując "inteligentne"
         grupowanie bloków przez Google, które psuje tabele.
+        Współrzędne słów trafiają do tablic NumPy, a grupowanie wierszy jest wektorowe.
         """
-        words = []
-        
-        # 1. Wyciągnij wszystkie słowa ze struktur Google'a
+        texts = []
+        vertex_counts = []
+        vertices = []
+
+        # 1. Wyciągnij wszystkie słowa ze struktur Google'a (tylko odczyt, bez słowników na słowo)
         for page in response.full_text_annotation.pages:
             for block in page.blocks:
                 for paragraph in block.paragraphs:
                     for word in paragraph.words:
-                        word_text = "".join([symbol.text for symbol in word.symbols])
-                        
                         vs = word.bounding_box.vertices
-                        ys = [v.y for v in vs if v.y is not None]
-                        xs = [v.x for v in vs if v.x is not None]
-                        
-                        if not ys or not xs: continue
-                            
-                        min_y, max_y = min(ys), max(ys)
-                        min_x = min(xs)
-                        center_y = (min_y + max_y) / 2
-                        
-                        words.append({"text": word_text, "y": center_y, "x": min_x, "height": max_y - min_y})
-
-        if not words: return ""
-
-        # 2. Sortowanie zgrubne po Y
-        words.sort(key=lambda w: w["y"])
-
-        # 3. Grupowanie w wiersze (Line Clustering)
-        lines = []
-        current_line = []
-        if words:
-            current_line_y = words[0]["y"]
-            current_line.append(words[0])
-            
-        for word in words[1:]:
-            tolerance = max(10, word["height"] * 0.6) 
-            if abs(word["y"] - current_line_y) <= tolerance:
-                current_line.append(word)
-            else:
-                current_line.sort(key=lambda w: w["x"])
-                lines.append(" ".join([w["text"] for w in current_line]))
-                current_line = [word]
-                current_line_y = word["y"]
-        
-        if current_line:
-            current_line.sort(key=lambda w: w["x"])
-            lines.append(" ".join([w["text"] for w in current_line]))
-
-        return "\n".join(lines)
\ No newline at end of file
+                        if not vs: continue
+
+                        texts.append("".join([symbol.text for symbol in word.symbols]))
+                        vertex_counts.append(len(vs))
+                        vertices.extend([coord for v in vs for coord in (v.x, v.y)])
+
+        if not texts: return ""
+
+        # Min/max po wierzchołkach każdego słowa naraz (reduceat po segmentach)
+        offsets = np.concatenate(([0], np.cumsum(vertex_counts)[:-1]))
+        points = np.array(vertices, dtype=np.float64)
+        xs, ys = points[0::2], points[1::2]
+        min_x = np.minimum.reduceat(xs, offsets)
+        min_y = np.minimum.reduceat(ys, offsets)
+        max_y = np.maximum.reduceat(ys, offsets)
+
+        return lines_from_arrays(texts, min_x, (min_y + max_y) / 2, max_y - min_y, y_tolerance=y_tolerance)
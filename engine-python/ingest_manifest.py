@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+
+from result_cache import file_sha256
+
+MANIFEST_FORMAT_VERSION = 1
+
+STATUS_PENDING = "pending"  # Przetwarzanie rozpoczęte, ale niezakończone (np. przerwany proces)
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class IngestManifest:
+    """
+    Manifest przetworzonych plików wejściowych (JSON).
+    Dla każdego pliku: rozmiar, mtime, SHA-256, wersja potoku i opcjonalnie ścieżka wynikowego JSON
+    (bez ścieżki wynik jest w magazynie artefaktów pod SHA-256 pliku).
+    Plik jest pomijany, jeśli jego zawartość i wersja potoku się nie zmieniły, a wynik istnieje.
+    Zapis jest atomowy (plik tymczasowy + os.replace), a pliki w trakcie przetwarzania mają
+    status "pending" - po awarii lub przerwaniu są przetwarzane ponownie.
+    Zmiany są zapisywane porcjami: co flush_every zmian i przy flush() (koniec przebiegu).
+    Zmiany utracone przy awarii oznaczają tylko ponowne przetworzenie pliku - jak status "pending".
+    """
+    def __init__(self, path, pipeline_version, flush_every=50):
+        self.path = path
+        self.pipeline_version = pipeline_version
+        self.flush_every = max(1, flush_every)
+        self._lock = threading.Lock()
+        self._unsaved_changes = 0
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [MANIFEST] Nie udało się odczytać manifestu ({e}) - wszystkie pliki zostaną przetworzone.")
+            return {}
+        if payload.get("format") != MANIFEST_FORMAT_VERSION:
+            return {}
+        return payload.get("files", {})
+
+    def _changed(self):
+        """Rejestruje zmianę wpisu; manifest trafia na dysk co flush_every zmian (wywoływane pod blokadą)."""
+        self._unsaved_changes += 1
+        if self._unsaved_changes >= self.flush_every:
+            self._save()
+
+    def flush(self):
+        """Zapisuje niezapisane zmiany na dysk."""
+        with self._lock:
+            if self._unsaved_changes:
+                self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": MANIFEST_FORMAT_VERSION, "files": self.entries}, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._unsaved_changes = 0
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
+
+    def is_unchanged(self, file_path):
+        """
+        True, jeśli plik był już przetworzony tą samą wersją potoku i wskazany wynik JSON istnieje.
+        Najpierw porównuje rozmiar i mtime; skrót liczony jest tylko, gdy się różnią
+        (np. plik skopiowany ponownie bez zmian treści).
+        """
+        with self._lock:
+            entry = self.entries.get(self._key(file_path))
+        if not entry or entry["status"] != STATUS_DONE or entry["pipeline_version"] != self.pipeline_version:
+            return False
+        if entry.get("json_path") and not os.path.exists(entry["json_path"]):
+            return False
+
+        stat = os.stat(file_path)
+        if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        if stat.st_size != entry["size"] or file_sha256(file_path) != entry["sha256"]:
+            return False
+
+        # Ta sama treść, nowy mtime - zapamiętaj, aby następnym razem nie liczyć skrótu
+        with self._lock:
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._changed()
+        return True
+
+    def mark_pending(self, file_path):
+        """Zapisuje stan pliku przed przetwarzaniem; zwraca jego SHA-256."""
+        stat = os.stat(file_path)
+        sha256 = file_sha256(file_path)
+        with self._lock:
+            self.entries[self._key(file_path)] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+                "pipeline_version": self.pipeline_version,
+                "status": STATUS_PENDING,
+                "json_path": None,
+                "updated_at": time.time(),
+            }
+            self._changed()
+        return sha256
+
+    def mark_done(self, file_path, json_path=None):
+        self._set_status(file_path, STATUS_DONE, json_path=os.path.abspath(json_path) if json_path else None)
+
+    def mark_failed(self, file_path, error=None):
+        self._set_status(file_path, STATUS_FAILED, error=str(error) if error else None)
+
+    def _set_status(self, file_path, status, **fields):
+        with self._lock:
+            entry = self.entries.get(self._key(file_path))
+            if entry is None:
+                return
+            entry.update(fields, status=status, updated_at=time.time())
+            self._changed()
+
+    def load_result(self, file_path):
+        """Wczytuje wynik JSON niezmienionego pliku ze wskazanej ścieżki; None, jeśli ścieżki nie zapisano."""
+        with self._lock:
+            json_path = self.entries[self._key(file_path)]["json_path"]
+        if not json_path:
+            return None
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def document_id(self, file_path):
+        """SHA-256 pliku z manifestu - identyfikator dokumentu w magazynie artefaktów."""
+        with self._lock:
+            return self.entries[self._key(file_path)]["sha256"]
+
+    def pending_files(self):
+        """Pliki, których przetwarzanie zostało przerwane (np. awaria w poprzednim uruchomieniu)."""
+        with self._lock:
+            return [path for path, entry in self.entries.items() if entry["status"] == STATUS_PENDING]
@@ -0,0 +1,112 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFullError(Exception):
+    """Kolejka zadań jest pełna - klient powinien spróbować ponownie później."""
+
+
+class JobManager:
+    """
+    Rejestr zadań analizy uruchamianych w tle.
+    Każdy plik zadania trafia do ograniczonej puli wątków (poza pętlą zdarzeń serwera),
+    a stan zadania i wyniki poszczególnych plików można odpytywać po job_id.
+    """
+    def __init__(self, process_func, max_workers=2, max_pending_files=200, max_finished_jobs=500):
+        """
+        :param process_func: Funkcja (ścieżka) -> słownik wyniku {"file", "status", ...}.
+        :param max_workers: Liczba plików przetwarzanych równolegle.
+        :param max_pending_files: Limit plików czekających w kolejce (ochrona przed przeciążeniem).
+        :param max_finished_jobs: Ile zakończonych zadań trzymać w pamięci do odpytania.
+        """
+        self.process_func = process_func
+        self.max_pending_files = max_pending_files
+        self.max_finished_jobs = max_finished_jobs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self._jobs = OrderedDict()
+        self._pending_files = 0
+        self._lock = threading.Lock()
+
+    def submit(self, file_paths):
+        """
+        Rejestruje zadanie i zwraca jego identyfikator bez czekania na wyniki.
+        Puste zadanie jest odrzucane (ValueError) - nigdy nie doszłoby do stanu "completed".
+        """
+        file_paths = list(dict.fromkeys(file_paths))  # Usuń duplikaty, zachowując kolejność
+        if not file_paths:
+            raise ValueError("Zadanie musi zawierać co najmniej jeden plik.")
+        with self._lock:
+            if self._pending_files + len(file_paths) > self.max_pending_files:
+                raise JobQueueFullError(
+                    f"Kolejka pełna ({self._pending_files} plików oczekuje, limit {self.max_pending_files})."
+                )
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "finished_at": None,
+                "files": {path: {"file": path, "status": "pending"} for path in file_paths},
+            }
+            self._pending_files += len(file_paths)
+            self._prune_finished()
+
+        for path in file_paths:
+            self.executor.submit(self._run_file, job_id, path)
+        return job_id
+
+    def get(self, job_id):
+        """Zwraca migawkę stanu zadania albo None, jeśli zadanie nie istnieje."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            files = [dict(entry) for entry in job["files"].values()]
+
+            return {
+                "job_id": job_id,
+                "status": job["status"],
+                "created_at": job["created_at"],
+                "finished_at": job["finished_at"],
+                "total_count": len(files),
+                "processed_count": sum(1 for f in files if f["status"] == "success"),
+                "error_count": sum(1 for f in files if f["status"] == "error"),
+                "files": files,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_file(self, job_id, path):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                self._pending_files -= 1
+                return
+            job["status"] = "running"
+            job["files"][path]["status"] = "processing"
+
+        try:
+            result = self.process_func(path)
+        except Exception as e:
+            print(f"Błąd przy przetwarzaniu {path} (zadanie {job_id}): {str(e)}")
+            result = {"file": path, "status": "error", "error": str(e)}
+
+        with self._lock:
+            self._pending_files -= 1
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["files"][path] = result
+            if all(f["status"] in ("success", "error") for f in job["files"].values()):
+                job["status"] = "completed"
+                job["finished_at"] = time.time()
+
+    def _prune_finished(self):
+        """Usuwa najstarsze zakończone zadania ponad limit (wywoływane pod blokadą)."""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] == "completed"]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
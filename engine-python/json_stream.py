@@ -0,0 +1,113 @@
+import json
+
+
+class ExaminationStream:
+    """
+    Przyrostowy parser odpowiedzi MEDICAL_REPORT_SCHEMA czytanej kawałkami (streaming dostawcy).
+    Każda zamknięta sekcja tablicy "examinations" trafia do on_section(indeks, sekcja, meta) od razu,
+    bez czekania na koniec odpowiedzi (meta = obiekt "meta", o ile już go odebrano, inaczej None).
+    Parser śledzi tylko głębokość nawiasów i napisy - pełną walidację robi json.loads całej odpowiedzi.
+    """
+    def __init__(self, on_section=None):
+        self.on_section = on_section
+        self.reset()
+
+    def reset(self):
+        """Nowa odpowiedź (ponowienie zapytania) - sekcje przyjdą jeszcze raz od indeksu 0."""
+        self._chunks = []  # Odebrane kawałki - łączone dopiero w finish()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_parts = None  # Fragmenty napisu na poziomie obiektu głównego (kandydat na klucz)
+        self._last_key = None
+        self._array_key = None  # Klucz tablicy, w której jesteśmy (poziom 2)
+        self._capture_parts = None  # Fragmenty przechwytywanej sekcji / meta
+        self._capture_key = None
+        self.section_count = 0
+        self.meta = None
+
+    @property
+    def received(self):
+        """Dotychczas odebrany tekst odpowiedzi."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk):
+        """
+        Dopisuje kawałek odpowiedzi i zgłasza sekcje zamknięte w tym kawałku; zwraca ich liczbę.
+        Skanowany jest tylko nowy kawałek - otwarta sekcja i klucz są doklejane z fragmentów.
+        """
+        if not chunk:
+            return 0
+        self._chunks.append(chunk)
+        found = 0
+        # Początek otwartego napisu-klucza / sekcji w bieżącym kawałku (0 = trwa od poprzedniego)
+        key_from = 0 if self._key_parts is not None else None
+        capture_from = 0 if self._capture_parts is not None else None
+
+        for pos, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if key_from is not None:
+                        self._key_parts.append(chunk[key_from:pos])
+                        self._last_key = "".join(self._key_parts)
+                        self._key_parts, key_from = None, None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key_parts, key_from = [], pos + 1
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 2 and ch == '[':
+                    self._array_key = self._last_key
+                elif self._depth == 2 and self._last_key == "meta":
+                    self._capture_parts, capture_from, self._capture_key = [], pos, "meta"
+                elif self._depth == 3 and self._array_key == "examinations" and ch == '{':
+                    self._capture_parts, capture_from, self._capture_key = [], pos, "examinations"
+            elif ch in '}]':
+                closing_depth = self._depth
+                self._depth -= 1
+                if self._capture_parts is not None and closing_depth == (2 if self._capture_key == "meta" else 3):
+                    self._capture_parts.append(chunk[capture_from:pos + 1])
+                    found += self._emit("".join(self._capture_parts))
+                    self._capture_parts, capture_from = None, None
+                if self._depth == 1:
+                    self._array_key = None
+
+        if key_from is not None:
+            self._key_parts.append(chunk[key_from:])
+        if capture_from is not None:
+            self._capture_parts.append(chunk[capture_from:])
+        return found
+
+    def finish(self, full_text):
+        """
+        Domyka strumień pełną odpowiedzią: dopisuje brakujący koniec albo - gdy odpowiedź nie przyszła
+        strumieniem (replay z kasety, zapytanie bez streamingu) - parsuje ją całą.
+        """
+        received = self.received
+        if received and full_text.startswith(received):
+            self.feed(full_text[len(received):])
+        elif full_text != received:
+            self.reset()
+            self.feed(full_text)
+
+    def _emit(self, fragment):
+        try:
+            value = json.loads(fragment)
+        except ValueError:
+            return 0  # Uszkodzony fragment - o poprawności rozstrzyga parsowanie całej odpowiedzi
+        if self._capture_key == "meta":
+            self.meta = value
+            return 0
+        index = self.section_count
+        self.section_count += 1
+        if self.on_section:
+            self.on_section(index, value, self.meta)
+        return 1
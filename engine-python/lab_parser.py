@@ -0,0 +1,198 @@
+import re
+
+# Podbij przy zmianie reguł - wersja trafia do odcisku cache wyników
+LAB_PARSER_VERSION = 2
+
+# Nagłówek sekcji badania, np. "Morfologia krwi (ICD-9: C55)" lub "Morfologia krwi - kontynuacja (ICD-9: C55)"
+_SECTION_RE = re.compile(r'^(?P<name>.*?)\s*\(\s*ICD-9\s*:?\s*(?P<code>[A-Z0-9.]+)\s*\)', re.IGNORECASE)
+_CONTINUATION_RE = re.compile(r'[\s\-–(]*kontynuacja\)?', re.IGNORECASE)
+_FOOTNOTE_SUFFIX_RE = re.compile(r'\s+\d$')  # Odnośnik do stopki na końcu nazwy, np. "Glukoza 2"
+_PAGE_FOOTER_RE = re.compile(r'^Strona\s+\d+\s*(?:z|/)\s*\d+$', re.IGNORECASE)  # Numer strony wydruku, np. "Strona 1 z 2"
+
+_NUMBER = r'\d+(?:[.,]\d+)?'
+# Wiersz wyniku: nazwa, [odnośnik], [<>]wartość [flaga] jednostka [flaga] [norma]
+# np. "Leukocyty 5,53 tys/ul 4,00 10,00" albo "Neutrofile 39,6 L % 45,0 70,0"
+_RESULT_LINE_RE = re.compile(
+    rf'^(?P<name>[^\d\s<>].*?)\s+'
+    rf'(?:\d\s+)?'
+    rf'[<>]?\s*(?P<value>{_NUMBER})\s*'
+    rf'(?:(?P<flag>[HL↑↓])\s+)?'
+    rf'(?P<unit>\$[^$]*\$|\S+)'  # Jednostka jako wzór LaTeX z OCR może zawierać spacje
+    rf'(?P<rest>.*)$'
+)
+_RANGE_NUMBER_RE = re.compile(_NUMBER)
+_RANGE_FLAG_RE = re.compile(r'(?:^|\s)([HL↑↓])(?=\s|$)')
+
+_DATE_RE = re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b|\b(\d{2})\.(\d{2})\.(\d{4})\b')
+# Daty przy tych słowach opisują badanie (a nie np. wydruk)
+_EXAMINATION_DATE_HINT_RE = re.compile(r'pobrani|wykonani|przyjęci', re.IGNORECASE)
+
+# Jednostki po oczyszczeniu (małe litery, bez "$", "*", "^{}" i spacji) -> postać docelowa
+KNOWN_UNITS = {
+    "tys/ul": "tys/ul",
+    "mln/ul": "mln/ul",
+    "g/dl": "g/dl",
+    "mg/dl": "mg/dl",
+    "mg/l": "mg/l",
+    "g/l": "g/l",
+    "mmol/l": "mmol/l",
+    "umol/l": "umol/l",
+    "u/l": "U/l",
+    "iu/l": "IU/l",
+    "ng/ml": "ng/ml",
+    "pg/ml": "pg/ml",
+    "uiu/ml": "uIU/ml",
+    "%": "%",
+    "fl": "fl",
+    "pg": "pg",
+}
+
+# Typowe błędy OCR w nazwach parametrów
+NAME_ALIASES = {
+    "NRBC$": "NRBC #",
+    "NRBCH": "NRBC #",
+    "NRBC#": "NRBC #",
+    "NRBC%": "NRBC %",
+}
+
+_FLAG_MAP = {"H": "H", "L": "L", "↑": "H", "↓": "L"}
+
+
+def normalize_unit(raw_unit):
+    """Czyści artefakty OCR w jednostce (np. "$tys/\\mu l^{*}$" -> "tys/ul"). Zwraca None dla nieznanych jednostek."""
+    unit = raw_unit.replace("\\mu", "u").replace("µ", "u").replace("μ", "u")
+    unit = re.sub(r'[$*^{}\\\s]', '', unit).lower()
+    return KNOWN_UNITS.get(unit)
+
+
+def _to_float(text):
+    return float(text.replace(",", "."))
+
+
+def _parse_range(rest):
+    """Zwraca (min, max, flaga) z części wiersza za jednostką, np. "4,00 10,00", "4,00 - 10,00", "< 5" lub "H 0,0 5,0"."""
+    flag_match = _RANGE_FLAG_RE.search(rest)
+    flag = _FLAG_MAP[flag_match.group(1)] if flag_match else None
+
+    numbers = [_to_float(n) for n in _RANGE_NUMBER_RE.findall(rest)]
+    stripped = rest.strip()
+    if len(numbers) == 1 and stripped.startswith("<"):
+        return None, numbers[0], flag
+    if len(numbers) == 1 and stripped.startswith(">"):
+        return numbers[0], None, flag
+    if len(numbers) == 2:
+        return numbers[0], numbers[1], flag
+    return None, None, flag
+
+
+def _is_consistent(result):
+    """Kontrola spójności wiersza: norma rosnąca, a flaga zgodna z położeniem wyniku względem normy."""
+    value, low, high, flag = result["value"], result["range_min"], result["range_max"], result["flag"]
+    if low is not None and high is not None and low > high:
+        return False
+    below = low is not None and value < low
+    above = high is not None and value > high
+    if flag == "H":
+        return above
+    if flag == "L":
+        return below
+    return not (below or above)
+
+
+def parse_result_line(line):
+    """Parsuje pojedynczy wiersz wyniku. Zwraca słownik w formacie MEDICAL_REPORT_SCHEMA albo None."""
+    match = _RESULT_LINE_RE.match(line)
+    if not match:
+        return None
+
+    unit = normalize_unit(match.group("unit"))
+    if unit is None:
+        return None
+
+    range_min, range_max, range_flag = _parse_range(match.group("rest"))
+    flag = _FLAG_MAP[match.group("flag")] if match.group("flag") else range_flag
+
+    name = match.group("name").strip()
+    name = NAME_ALIASES.get(name.replace(" ", ""), name)
+
+    return {
+        "name": name,
+        "value": _to_float(match.group("value")),
+        "unit": unit,
+        "range_min": range_min,
+        "range_max": range_max,
+        "flag": flag,
+    }
+
+
+def _find_examination_date(lines):
+    """Szuka daty badania (YYYY-MM-DD); preferuje daty w wierszach o pobraniu/wykonaniu badania."""
+    first_date = None
+    for line in lines:
+        match = _DATE_RE.search(line)
+        if not match:
+            continue
+        if match.group(1):
+            date = f"{match.group(1)}-{match.group(2)}-{match.group(3)}"
+        else:
+            date = f"{match.group(6)}-{match.group(5)}-{match.group(4)}"
+        if _EXAMINATION_DATE_HINT_RE.search(line):
+            return date
+        first_date = first_date or date
+    return first_date
+
+
+def parse_lab_report(text):
+    """
+    Deterministyczna ekstrakcja wyników z tabel laboratoryjnych (np. "Morfologia krwi"),
+    bez zapytania do LLM. Zwraca (dane w formacie MEDICAL_REPORT_SCHEMA lub None, pewność 0..1).
+    Pewność to udział wierszy z liczbami w sekcjach badań, które udało się sparsować
+    i które przeszły kontrolę spójności; brak daty badania obniża ją o połowę.
+    """
+    lines = [" ".join(line.split()) for line in (text or "").split("\n")]
+    lines = [line for line in lines if line]
+
+    examinations = {}
+    current = None
+    candidate_lines = 0
+    consistent_results = 0
+
+    for line in lines:
+        section = _SECTION_RE.match(line)
+        if section:
+            # Nagłówek "kontynuacja" na kolejnej stronie to ta sama sekcja
+            name = _CONTINUATION_RE.sub("", section.group("name"))
+            name = _FOOTNOTE_SUFFIX_RE.sub("", name).strip(" -–:")
+            current = examinations.setdefault(name, {
+                "examination_name": name,
+                "code_icd": section.group("code").upper(),
+                "results": [],
+            })
+            continue
+
+        if (current is None or not re.search(r'\d', line) or _DATE_RE.search(line) or "[REDACTED" in line
+                or _PAGE_FOOTER_RE.match(line)):
+            continue
+
+        candidate_lines += 1
+        result = parse_result_line(line)
+        if result is None:
+            continue
+        current["results"].append(result)
+        if _is_consistent(result):
+            consistent_results += 1
+
+    examinations = [exam for exam in examinations.values() if exam["results"]]
+    if not examinations or candidate_lines == 0:
+        return None, 0.0
+
+    date = _find_examination_date(lines)
+    confidence = consistent_results / candidate_lines
+    if date is None:
+        confidence *= 0.5
+
+    data = {
+        "meta": {"date_examination": date or ""},
+        "examinations": examinations,
+    }
+    return data, round(confidence, 3)
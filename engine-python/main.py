@@ -1,18 +1,73 @@
 import pandas as pd  # Biblioteka do tabel
+import io
 import matplotlib.pyplot as plt
 import glob
 import os
 import time
 import json
 import re
-from analyzer import MedicalAnalyzer  # Import nowej klasy
-from ocr_cleaner import PrivacyGuard, USER_PROFILE, save_ocr_to_txt
+import functools
+import argparse
+import atexit
+import threading
+from analyzer import MedicalAnalyzer, MEDICAL_REPORT_SCHEMA  # Import nowej klasy
+from ocr_cleaner import get_privacy_guard, USER_PROFILES, ocr_pdf_pages
 from google_vision_ocr import GoogleVisionOCR
+from result_cache import ResultCache, file_sha256, content_sha256, pipeline_fingerprint
+from pipeline import Pipeline, Stage
+from pdf_text_layer import extract_text_layer
+from lab_parser import parse_lab_report, LAB_PARSER_VERSION
+from results_store import ResultsStore
+from ingest_manifest import IngestManifest
+from chart_renderer import ChartRenderer, chart_slice, draw_parameter
+from metrics import span, DocumentTimings, DOCUMENTS, PAGES
+from transport import Transport, CassetteStore, TRANSPORT_MODES, TRANSPORT_REPLAY
+from artifact_store import SqliteArtifactStore, FileArtifactStore, ARTIFACT_RAW_OCR, ARTIFACT_CLEANED, ARTIFACT_RESULT
 
 # --- KONFIGURACJA ---
-SAVE_JSON_ENABLED = True  # Ustaw na False, aby wyłączyć zapisywanie plików JSON
+SAVE_JSON_ENABLED = True  # Ustaw na False, aby wyłączyć zapisywanie wyniku JSON w magazynie artefaktów
 USE_GOOGLE_VISION = True  # True = Google Vision API, False = Tesseract (lokalny)
+USE_PDF_TEXT_LAYER = True  # Czytaj tekst z warstwy tekstowej PDF, OCR tylko dla stron zeskanowanych
 GCP_KEY_PATH = "gcp_key.json"  # Ścieżka do klucza Google Cloud (względem engine-python)
+POPPLER_PATH = r'C:\poppler-25.12.0\Library\bin'  # Binaria Poppler dla Google Vision
+VISION_BATCH_SIZE = 4  # Ile stron w jednym zapytaniu batch_annotate_images
+VISION_MAX_CONCURRENCY = 4  # Maksymalna liczba równoległych zapytań do Vision (limit quota)
+VISION_DPI = 200  # Rozdzielczość rasteryzacji stron wysyłanych do Vision
+VISION_GRAYSCALE = False  # Strony w odcieniach szarości - mniejsze obrazy do wysłania
+RASTER_THREAD_COUNT = 1  # Ile stron renderujemy naraz (tyle bitmap jest jednocześnie w pamięci)
+RESULT_CACHE_ENABLED = True  # Cache wyników po skrócie pliku - ponowny upload nie woła OCR ani AI
+RESULT_CACHE_PATH = "cache/results.sqlite"  # Ścieżka do bazy cache (względem engine-python)
+RESULT_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Limit rozmiaru cache, powyżej usuwane są najdawniej używane wpisy
+RESULTS_STORE_ENABLED = True  # Wyniki dopisywane do magazynu SQLite (format długi) zamiast liczenia tabeli od zera
+RESULTS_STORE_PATH = "data/lab_results.sqlite"  # Ścieżka do magazynu wyników (względem engine-python)
+REPORT_SERIES = None  # Lista serii do zestawienia i wykresów, np. ["Morfologia krwi - Leukocyty [tys/ul]"] (None = wszystkie)
+REPORT_DATE_FROM = None  # Zakres dat zestawienia "YYYY-MM-DD" (None = bez ograniczenia)
+REPORT_DATE_TO = None
+INGEST_MANIFEST_ENABLED = True  # Manifest przetworzonych plików - niezmienione pliki nie są przetwarzane ponownie
+INGEST_MANIFEST_PATH = "data/ingest_manifest.json"  # Ścieżka do manifestu (względem engine-python)
+INGEST_MANIFEST_FLUSH_EVERY = 50  # Manifest zapisywany co tyle zmian statusu (i na końcu przebiegu), nie po każdej
+WATCH_INTERVAL_SECONDS = 5  # Tryb --watch: co ile sekund sprawdzamy katalog uploads
+WATCH_SETTLE_SECONDS = 2  # Tryb --watch: pomijamy pliki zmienione przed chwilą (kopiowanie w toku)
+CHART_MODE = "window"  # "window" = jedno okno plt.show(), "files" = osobny obraz na parametr (bez wyświetlacza, np. serwer)
+CHARTS_DIR = "data/charts"  # Katalog wyrenderowanych wykresów (względem engine-python)
+CHART_FORMAT = "png"  # "png" lub "svg"
+CHART_WORKERS = 4  # Liczba procesów renderujących wykresy
+TRANSPORT_MODE = "live"  # "live", "record" (odpowiedzi Vision/AI zapisywane do kasety), "replay" (tylko z kasety, offline)
+CASSETTE_PATH = "cache/cassettes.sqlite"  # Kaseta nagrań (względem engine-python)
+REPLAY_SIMULATE_LATENCY = False  # Replay: czekaj tyle, ile trwała nagrana odpowiedź (False = pełna prędkość)
+ARTIFACT_STORE = "sqlite"  # Artefakty dokumentów: "sqlite" (skompresowane bloby), "files" (pliki wg id dokumentu), None = bez zapisu
+ARTIFACT_STORE_PATH = "data/artifacts.sqlite"  # Baza artefaktów dla "sqlite" (względem engine-python)
+ARTIFACT_FILES_DIR = "data/artifacts"  # Katalog artefaktów dla "files" (względem engine-python)
+SAVE_INTERMEDIATE_ARTIFACTS = True  # Surowy OCR i tekst zanonimizowany (False = tylko wynik JSON, np. na produkcji)
+ARTIFACT_WRITE_BATCH_SIZE = 64  # Ile artefaktów wątek zapisujący zapisuje naraz
+EXPORT_JSON_DIR = "json_results"  # main.py --export-json: wyniki jako <nazwa pliku>.json (względem engine-python)
+# Liczba wątków każdego etapu potoku (rasteryzacja, OCR, anonimizacja, AI)
+PIPELINE_WORKERS = {"rasterize": 2, "ocr": 4, "anonymize": 1, "analyze": 1}
+PIPELINE_QUEUE_SIZE = 4  # Ile dokumentów może czekać przed każdym etapem
+LOCAL_PARSER_ENABLED = True  # Znane tabele laboratoryjne (np. morfologia) parsowane regułami, bez zapytania AI
+LOCAL_PARSER_MIN_CONFIDENCE = 0.95  # Poniżej tej pewności parsera lokalnego dokument trafia do AI
+LLM_BATCH_SIZE = 1  # > 1 = tryb wsadowy: do tylu dokumentów w jednym zapytaniu AI (limit RPM)
+LLM_BATCH_WAIT_SECONDS = 2.0  # Ile najdłużej czekamy na skompletowanie porcji dokumentów
 
 # Mapa do normalizacji jednostek - standaryzuje popularne warianty i błędy OCR
 UNIT_NORMALIZATION_MAP = {
@@ -36,6 +91,65 @@ PARAMETER_NAME_NORMALIZATION_MAP = {
 }
 
 
+def _iter_lab_results(data: dict):
+    """
+    Generator znormalizowanych wyników badań w formacie długim - jeden słownik na parametr:
+    date, section, parameter, unit, series_key, value, range_min, range_max, flag.
+    series_key łączy sekcję, nazwę i jednostkę (np. "Morfologia krwi - Neutrofile [%]").
+    """
+    date = data.get('meta', {}).get('date_examination')
+
+    for section in data.get('examinations', []):
+        yield from _iter_section_results(section, date)
+
+def _iter_section_results(section: dict, date):
+    """Wiersze formatu długiego jednej sekcji badań (jak _iter_lab_results)."""
+    section_name = section.get('examination_name', 'Inne')
+    # Czyścimy nazwę sekcji z kodów ICD-9, aby tytuły wykresów były ładniejsze
+    clean_section_name = re.sub(r'\s*\(ICD-9:.*\)', '', section_name).strip()
+
+    for result in section.get('results', []):
+        if isinstance(result, dict) and 'name' in result and 'value' in result:
+            param_name = result['name']
+            
+            # --- NOWOŚĆ: Czyszczenie nazwy parametru z jednostek w nawiasach ---
+            # Usuwa: [%], (%), [#], (#), [tys/ul] itp. z końca nazwy
+            param_name = re.sub(r'\s*[\[\(].*?[\]\)]$', '', param_name).strip()
+
+            # Normalizacja nazwy parametru
+            normalized_param_name = PARAMETER_NAME_NORMALIZATION_MAP.get(param_name, param_name)
+
+            param_unit = result.get('unit')
+            param_flag = result.get('flag')
+            if param_flag:
+                param_flag = param_flag.strip()
+
+            # Czyszczenie jednostki z artefaktów OCR przed normalizacją
+            cleaned_unit = None
+            if param_unit:
+                cleaned_unit = re.sub(r'[\*$\s]', '', param_unit)  # Usuwa znaki *, $ i białe znaki
+
+            # Normalizacja jednostki
+            normalized_unit = UNIT_NORMALIZATION_MAP.get(cleaned_unit, cleaned_unit)
+
+            # Tworzenie unikalnego klucza, aby uniknąć nadpisywania (np. "Neutrofile [%]").
+            # To kluczowe dla parametrów o tej samej nazwie ale różnych jednostkach.
+            # Dodajemy nazwę sekcji dla lepszej czytelności na wykresach.
+            base_key = f"{clean_section_name} - {normalized_param_name}"
+            unique_key = f"{base_key} [{normalized_unit}]" if normalized_unit else base_key
+
+            yield {
+                'date': date,
+                'section': clean_section_name,
+                'parameter': normalized_param_name,
+                'unit': normalized_unit,
+                'series_key': unique_key,
+                'value': result['value'],
+                'range_min': result.get('range_min'),
+                'range_max': result.get('range_max'),
+                'flag': param_flag or None,
+            }
+
 def _flatten_lab_results(data: dict) -> dict | None:
     """
     Spłaszcza zagnieżdżoną strukturę JSON z wynikami badań do płaskiego słownika.
@@ -49,121 +163,604 @@ def _flatten_lab_results(data: dict) -> dict | None:
     # Pobierz datę z zagnieżdżonego obiektu 'meta'
     flat_data = {'Date': data.get('meta', {}).get('date_examination')}
 
-    for section in data.get('examinations', []):
-        section_name = section.get('examination_name', 'Inne')
-        # Czyścimy nazwę sekcji z kodów ICD-9, aby tytuły wykresów były ładniejsze
-        clean_section_name = re.sub(r'\s*\(ICD-9:.*\)', '', section_name).strip()
-
-        for result in section.get('results', []):
-            if isinstance(result, dict) and 'name' in result and 'value' in result:
-                param_name = result['name']
-                
-                # --- NOWOŚĆ: Czyszczenie nazwy parametru z jednostek w nawiasach ---
-                # Usuwa: [%], (%), [#], (#), [tys/ul] itp. z końca nazwy
-                param_name = re.sub(r'\s*[\[\(].*?[\]\)]$', '', param_name).strip()
-
-                # Normalizacja nazwy parametru
-                normalized_param_name = PARAMETER_NAME_NORMALIZATION_MAP.get(param_name, param_name)
-
-                param_value = result['value']
-                param_unit = result.get('unit')
-                param_flag = result.get('flag')
-                param_min = result.get('range_min')
-                param_max = result.get('range_max')
-                if param_flag:
-                    param_flag = param_flag.strip()
-
-                # Czyszczenie jednostki z artefaktów OCR przed normalizacją
-                cleaned_unit = None
-                if param_unit:
-                    cleaned_unit = re.sub(r'[\*$\s]', '', param_unit)  # Usuwa znaki *, $ i białe znaki
-
-                # Normalizacja jednostki
-                normalized_unit = UNIT_NORMALIZATION_MAP.get(cleaned_unit, cleaned_unit)
-
-                # Tworzenie unikalnego klucza, aby uniknąć nadpisywania (np. "Neutrofile [%]").
-                # To kluczowe dla parametrów o tej samej nazwie ale różnych jednostkach.
-                # Dodajemy nazwę sekcji dla lepszej czytelności na wykresach.
-                base_key = f"{clean_section_name} - {normalized_param_name}"
-                unique_key = f"{base_key} [{normalized_unit}]" if normalized_unit else base_key
-                flat_data[unique_key] = param_value
-                if param_flag:
-                    flat_data[f"{unique_key}_flag"] = param_flag
-                if param_min is not None:
-                    flat_data[f"{unique_key}_min"] = param_min
-                if param_max is not None:
-                    flat_data[f"{unique_key}_max"] = param_max
+    for row in _iter_lab_results(data):
+        unique_key = row['series_key']
+        flat_data[unique_key] = row['value']
+        if row['flag']:
+            flat_data[f"{unique_key}_flag"] = row['flag']
+        if row['range_min'] is not None:
+            flat_data[f"{unique_key}_min"] = row['range_min']
+        if row['range_max'] is not None:
+            flat_data[f"{unique_key}_max"] = row['range_max']
 
     return flat_data
 
-def process_single_file(file_path, vision_ocr_client, analyzer_instance):
-    """
-    Przetwarza pojedynczy plik: OCR -> Anonimizacja -> Analiza AI.
-    Zwraca surowy JSON z wynikami (nie spłaszczony).
-    """
-    page_texts = []
-    
-    # Krok 1: Wykonaj OCR (Vision lub Tesseract)
+@functools.lru_cache(maxsize=None)
+def create_transport():
+    """Wspólny transport (nagrywanie/odtwarzanie) dla Vision i dostawców AI wg TRANSPORT_MODE."""
+    if TRANSPORT_MODE not in TRANSPORT_MODES:
+        raise ValueError(f"Nieznany TRANSPORT_MODE: {TRANSPORT_MODE}")
+    store = None
+    if TRANSPORT_MODE != "live":
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        store = CassetteStore(os.path.join(current_dir, CASSETTE_PATH))
+        print(f"📼 [TRANSPORT] Tryb {TRANSPORT_MODE}, kaseta: {store.db_path} {store.count()}")
+    return Transport(TRANSPORT_MODE, store, simulate_latency=REPLAY_SIMULATE_LATENCY)
+
+_artifact_store_lock = threading.Lock()
+
+def get_artifact_store():
+    """Wspólny magazyn artefaktów (zapis w tle) wg ARTIFACT_STORE; None, jeśli wyłączony."""
+    # Pierwsze wywołanie przychodzi naraz z kilku wątków potoku - bez blokady powstałoby kilka magazynów
+    with _artifact_store_lock:
+        return _open_artifact_store()
+
+@functools.lru_cache(maxsize=None)
+def _open_artifact_store():
+    if ARTIFACT_STORE is None:
+        return None
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    options = dict(batch_size=ARTIFACT_WRITE_BATCH_SIZE, save_intermediate=SAVE_INTERMEDIATE_ARTIFACTS)
+    if ARTIFACT_STORE == "sqlite":
+        store = SqliteArtifactStore(os.path.join(current_dir, ARTIFACT_STORE_PATH), **options)
+    elif ARTIFACT_STORE == "files":
+        store = FileArtifactStore(os.path.join(current_dir, ARTIFACT_FILES_DIR), **options)
+    else:
+        raise ValueError(f"Nieznany ARTIFACT_STORE: {ARTIFACT_STORE}")
+    # Artefakty czekające w kolejce są zapisywane przed zakończeniem procesu
+    atexit.register(store.close)
+    return store
+
+def create_vision_ocr(key_path):
+    """Tworzy klienta Google Vision z konfiguracją równoległości z tego pliku."""
+    return GoogleVisionOCR(key_path, poppler_path=POPPLER_PATH,
+                           batch_size=VISION_BATCH_SIZE, max_concurrency=VISION_MAX_CONCURRENCY,
+                           dpi=VISION_DPI, grayscale=VISION_GRAYSCALE, thread_count=RASTER_THREAD_COUNT,
+                           transport=create_transport())
+
+def create_analyzer():
+    """Tworzy MedicalAnalyzer ze wspólnym transportem."""
+    return MedicalAnalyzer(transport=create_transport())
+
+def current_pipeline_fingerprint(analyzer_instance):
+    """Wersja potoku (prompt, schemat, model, OCR, profil, parser) - zmiana unieważnia cache i manifest."""
+    return pipeline_fingerprint(
+        system_prompt=analyzer_instance.system_prompt,
+        schema=MEDICAL_REPORT_SCHEMA,
+        model_name=analyzer_instance.GEMINI_MODEL + (f"+lab-parser-{LAB_PARSER_VERSION}" if LOCAL_PARSER_ENABLED else ""),
+        ocr_backend=("vision" if USE_GOOGLE_VISION else "tesseract") + ("+text-layer" if USE_PDF_TEXT_LAYER else ""),
+        user_profile=list(USER_PROFILES.values()),
+    )
+
+def create_result_cache(analyzer_instance):
+    """Tworzy cache wyników dla bieżącej konfiguracji (prompt, schemat, model, OCR, profil)."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    fingerprint = current_pipeline_fingerprint(analyzer_instance)
+    return ResultCache(os.path.join(current_dir, RESULT_CACHE_PATH), fingerprint, max_bytes=RESULT_CACHE_MAX_BYTES)
+
+def create_ingest_manifest(analyzer_instance):
+    """Tworzy manifest przetworzonych plików dla bieżącej wersji potoku (None, jeśli wyłączony)."""
+    if not INGEST_MANIFEST_ENABLED:
+        return None
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return IngestManifest(os.path.join(current_dir, INGEST_MANIFEST_PATH), current_pipeline_fingerprint(analyzer_instance),
+                          flush_every=INGEST_MANIFEST_FLUSH_EVERY)
+
+def create_results_store():
+    """Tworzy magazyn wyników w formacie długim (None, jeśli wyłączony)."""
+    if not RESULTS_STORE_ENABLED:
+        return None
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return ResultsStore(os.path.join(current_dir, RESULTS_STORE_PATH))
+
+def _ingest_results(item, results_store):
+    """Dopisuje wyniki dokumentu do magazynu; ponowne przetworzenie pliku zastępuje jego poprzednie wiersze."""
+    data = item["data"]
+    if results_store is None or not data or 'meta' not in data or 'examinations' not in data:
+        return
+
+    file_path = item["file_path"]
+    document_id = item["doc_hash"]
+    if document_id is None:
+        document_id = _document_hash(item) if _source_available(item) else file_path
+    rows = item["lab_rows"] if item["lab_rows"] is not None else _iter_lab_results(data)
+    count = results_store.replace_document(document_id, rows)
+    print(f"   [MAGAZYN] Zapisano {count} wyników z: {os.path.basename(file_path)}")
+
+def _long_to_wide(long_df):
+    """Format długi z magazynu -> tabela szeroka (wiersz = dokument), jak z _flatten_lab_results."""
+    long_df = long_df.fillna({'date': ''}).drop_duplicates(subset=['document_id', 'series_key'], keep='last')
+    wide = long_df.set_index(['document_id', 'date', 'series_key'])[['value', 'flag', 'range_min', 'range_max']].unstack('series_key')
+
+    suffixes = {'value': '', 'flag': '_flag', 'range_min': '_min', 'range_max': '_max'}
+    wide.columns = [f"{series_key}{suffixes[field]}" for field, series_key in wide.columns]
+    wide = wide.dropna(axis=1, how='all').reset_index().drop(columns='document_id')
+    return wide.rename(columns={'date': 'Date'})
+
+def _prepare_report_frame(df):
+    """Konwersja kolumn liczbowych i sortowanie tabeli szerokiej po dacie."""
+    # Konwersja kolumn liczbowych (wszystkie poza datą)
+    for col in df.columns:
+        if col != 'Date' and not col.endswith('_flag'):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Sortowanie po dacie
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'])
+        df = df.sort_values('Date')
+    return df
+
+def load_report_frame(results_store, series_keys=REPORT_SERIES, date_from=REPORT_DATE_FROM, date_to=REPORT_DATE_TO):
+    """Tabela szeroka z magazynu wyników (wybrane serie i zakres dat) albo None, jeśli brak danych."""
+    long_df = results_store.read_frame(series_keys=series_keys, date_from=date_from, date_to=date_to)
+    if long_df.empty:
+        return None
+    return _prepare_report_frame(_long_to_wide(long_df))
+
+def chart_parameters(df):
+    """Lista kolumn do narysowania (wszystkie poza datą i kolumnami pomocniczymi), tylko te z danymi."""
+    parameters = [col for col in df.columns if col != 'Date' and not col.endswith('_flag') and not col.endswith('_min') and not col.endswith('_max')]
+    return [col for col in parameters if df[col].notna().any()]
+
+def create_chart_renderer():
+    """Tworzy renderer wykresów do plików (Agg, pula procesów, cache po skrócie danych)."""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return ChartRenderer(os.path.join(current_dir, CHARTS_DIR), workers=CHART_WORKERS, chart_format=CHART_FORMAT)
+
+def _new_pipeline_item(file_path, content=None):
+    """Stan dokumentu przekazywany między etapami potoku."""
+    return {
+        "file_path": file_path,
+        "content": content,  # Bajty dokumentu przesłanego do serwera (None = plik na dysku)
+        "doc_hash": None,
+        "ocr_pages": None,  # Indeksy stron wymagających OCR (None = wszystkie)
+        "page_images": None,
+        "page_texts": None,
+        "anonymized_text": None,
+        "data": None,
+        "lab_rows": None,  # Wiersze formatu długiego spłaszczone w trakcie streamingu odpowiedzi AI
+        "error": None,  # Błąd etapu, po którym dokument odpadł (np. PageOCRError z numerami stron)
+        "timings": DocumentTimings(document=os.path.basename(file_path)),  # Czasy etapów dokumentu (metrics.span)
+        "started_at": time.perf_counter(),
+    }
+
+def _source_available(item):
+    return item["content"] is not None or os.path.exists(item["file_path"])
+
+def _document_source(item):
+    """Ścieżka pliku albo bajty przesłanego dokumentu - to, co przyjmują funkcje OCR."""
+    return item["file_path"] if item["content"] is None else item["content"]
+
+def _document_hash(item):
+    if item["content"] is not None:
+        return content_sha256(item["content"])
+    return file_sha256(item["file_path"])
+
+def _document_id(item):
+    """Identyfikator dokumentu w magazynach (SHA-256 treści), liczony raz."""
+    if item["doc_hash"] is None:
+        item["doc_hash"] = _document_hash(item)
+    return item["doc_hash"]
+
+def _save_artifact(item, kind, text=None, data=None):
+    """Kolejkuje artefakt dokumentu (tekst albo JSON) do zapisu w tle - potok nie czeka na dysk."""
+    artifact_store = get_artifact_store()
+    if artifact_store is None or not artifact_store.accepts(kind):
+        return
+    name = os.path.basename(item["file_path"])
+    if data is not None:
+        artifact_store.put_json(_document_id(item), kind, name, data)
+    else:
+        artifact_store.put_text(_document_id(item), kind, name, text)
+
+def _stage_rasterize(item, vision_ocr_client, result_cache):
+    """Etap 1: cache po skrócie pliku, warstwa tekstowa PDF, potem rasteryzacja stron bez tekstu (Vision)."""
+    file_path = item["file_path"]
+    timings = item["timings"]
+
+    # Krok 0: Sprawdź cache po skrócie zawartości pliku
+    if result_cache is not None and _source_available(item):
+        with span("cache_lookup", timings) as tags:
+            cached = result_cache.get(_document_id(item))
+            tags["hit"] = cached is not None
+        if cached is not None:
+            print(f"⚡ [CACHE] Trafienie dla: {os.path.basename(file_path)} - pomijam OCR i AI.")
+            item["data"] = cached["data"]
+            return None
+
+    # Krok 0.5: PDF-y generowane przez systemy laboratoryjne mają warstwę tekstową - OCR zbędny
+    if USE_PDF_TEXT_LAYER and file_path.lower().endswith('.pdf') and _source_available(item):
+        try:
+            with span("text_layer", timings) as tags:
+                # pdfplumber czyta przesłany dokument bezpośrednio z bufora, bez zapisu na dysk
+                layer_texts = extract_text_layer(file_path if item["content"] is None else io.BytesIO(item["content"]))
+                tags["pages"] = len(layer_texts) if layer_texts else 0
+        except Exception as e:
+            print(f"⚠️ [TEXT LAYER] Nie udało się odczytać warstwy tekstowej ({e}) - pełny OCR.")
+            layer_texts = None
+
+        if layer_texts:
+            item["page_texts"] = layer_texts
+            item["ocr_pages"] = [i for i, text in enumerate(layer_texts) if text is None]
+            PAGES.inc(len(layer_texts) - len(item["ocr_pages"]), source="text_layer")
+            print(f"📄 [TEXT LAYER] {os.path.basename(file_path)}: {len(layer_texts) - len(item['ocr_pages'])}/{len(layer_texts)} stron z warstwy tekstowej.")
+            if not item["ocr_pages"]:
+                return item
+
     if USE_GOOGLE_VISION and vision_ocr_client:
+        # Generator stron - etap OCR rasteryzuje je pojedynczo w miarę wysyłania do Vision,
+        # więc w pamięci jest najwyżej kilka stron naraz, niezależnie od długości dokumentu
+        try:
+            item["page_images"] = vision_ocr_client.iter_page_images(file_path, pages=item["ocr_pages"], content=item["content"])
+        except Exception as e:
+            print(f"Błąd podczas przetwarzania Vision API: {e}")
+            item["error"] = e
+            return None
+        if item["page_images"] is None:
+            return None
+
+    return item
+
+def _stage_ocr(item, vision_ocr_client):
+    """Etap 2: OCR (Vision lub Tesseract) stron bez warstwy tekstowej i zapis surowego tekstu."""
+    file_path = item["file_path"]
+    ocr_pages = item["ocr_pages"]
+
+    # Krok 1: Wykonaj OCR (Vision lub Tesseract)
+    if ocr_pages == []:
+        ocr_texts = []
+    elif item["page_images"] is not None:
         print(f"Przetwarzanie Google Vision dla: {os.path.basename(file_path)}...")
-        page_texts = vision_ocr_client.extract_text(file_path)
-        
-        # Ręczny zapis surowego wyniku (dla Vision)
-        if page_texts:
-            raw_text = "\n\n--- PAGE BREAK ---\n\n".join(page_texts)
-            output_dir = os.path.join(os.path.dirname(file_path), "../engine-python/ocr_results")
-            os.makedirs(output_dir, exist_ok=True)
-            txt_filename = os.path.splitext(os.path.basename(file_path))[0] + ".txt"
-            txt_path = os.path.join(output_dir, txt_filename)
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(raw_text)
-            print(f"✅ [Vision] Zapisano surowy OCR do: {txt_path}")
+        try:
+            # Czas obejmuje rasteryzację stron (generator), która przeplata się z zapytaniami do Vision
+            with span("ocr", item["timings"], provider="vision") as tags:
+                ocr_texts = vision_ocr_client.ocr_images(item["page_images"])
+                tags["pages"] = len(ocr_texts)
+        except Exception as e:
+            # PageOCRError niesie numery stron - trafia do odpowiedzi /analyze przez item["error"]
+            print(f"Błąd podczas przetwarzania Vision API: {e}")
+            item["error"] = e
+            return None
+        finally:
+            item["page_images"] = None  # Generator stron nie jest już potrzebny
     else:
         # Stara metoda (Tesseract)
-        page_texts = save_ocr_to_txt(file_path)
+        if not _source_available(item):
+            print(f"Błąd: Plik nie istnieje: {file_path}")
+            return None
+        print(f"Przetwarzanie OCR dla: {os.path.basename(file_path)}...")
+        try:
+            with span("ocr", item["timings"], provider="tesseract") as tags:
+                ocr_texts = ocr_pdf_pages(_document_source(item), pages=ocr_pages)
+                tags["pages"] = len(ocr_texts)
+        except Exception as e:
+            print(f"❌ Wystąpił błąd podczas przetwarzania OCR: {e}")
+            item["error"] = e
+            return None
+
+    # Złożenie stron: tekst z warstwy PDF + wyniki OCR w oryginalnej kolejności
+    if ocr_pages is None:
+        page_texts = ocr_texts
+    else:
+        page_texts = list(item["page_texts"])
+        for page, text in zip(ocr_pages, ocr_texts):
+            page_texts[page] = text
 
     if not page_texts:
         return None
+    if ocr_texts:
+        PAGES.inc(len(ocr_texts), source="ocr")
 
-    # Krok 2: Użyj klasy PrivacyGuard do anonimizacji tekstu
+    with span("save_raw_ocr", item["timings"]):
+        _save_artifact(item, ARTIFACT_RAW_OCR, text="\n\n--- PAGE BREAK ---\n\n".join(page_texts))
+    item["page_texts"] = page_texts
+
+    # Bajty przesłanego dokumentu nie są już potrzebne - zostaje tylko skrót (identyfikator w magazynie)
+    if item["content"] is not None:
+        _document_id(item)
+        item["content"] = None
+    return item
+
+def _stage_anonymize(item):
+    """Etap 3: anonimizacja tekstu i zapis oczyszczonej wersji."""
+    file_path = item["file_path"]
+
+    # Krok 2: Użyj klasy PrivacyGuard do anonimizacji tekstu (skompilowany raz, współdzielony między plikami)
     print(f"--- Anonimizacja wyniku dla: {os.path.basename(file_path)} ---")
-    guard = PrivacyGuard(USER_PROFILE)
-    anonymized_text = guard.anonymize(page_texts)
-    
-    # Zapisz oczyszczony tekst do pliku
-    cleaned_output_dir = os.path.join(os.path.dirname(file_path), "../engine-python/cleaned_results")
-    os.makedirs(cleaned_output_dir, exist_ok=True)
-    cleaned_filename = os.path.splitext(os.path.basename(file_path))[0] + "_cleaned.txt"
-    cleaned_path = os.path.join(cleaned_output_dir, cleaned_filename)
-    with open(cleaned_path, "w", encoding="utf-8") as f:
-        f.write(anonymized_text)
-    print(f"✅ Zapisano oczyszczony tekst do: {cleaned_path}")
-
-    # Krok 3: Analiza oczyszczonego tekstu przez AI
-    data = analyzer_instance.analyze_text(anonymized_text, provider='gemini')
-    
-    if data and SAVE_JSON_ENABLED:
-        json_output_dir = os.path.join(os.path.dirname(file_path), "../engine-python/json_results")
-        os.makedirs(json_output_dir, exist_ok=True)
+    guard = get_privacy_guard()
+    with span("anonymize", item["timings"], pages=len(item["page_texts"])):
+        anonymized_text = guard.anonymize(item["page_texts"])
 
-        json_filename = os.path.splitext(os.path.basename(file_path))[0] + ".json"
-        json_path = os.path.join(json_output_dir, json_filename)
+    # Zapisz oczyszczony tekst (w tle)
+    with span("save_cleaned", item["timings"]):
+        _save_artifact(item, ARTIFACT_CLEANED, text=anonymized_text)
 
+    item["anonymized_text"] = anonymized_text
+    return item
+
+def _analyze_locally(item):
+    """Krok 3a: parser regułowy dla znanych układów tabel - milisekundy zamiast zapytania do AI."""
+    if not LOCAL_PARSER_ENABLED:
+        return None
+
+    with span("local_parser", item["timings"]) as tags:
+        parsed, confidence = parse_lab_report(item["anonymized_text"])
+        tags["confidence"] = round(confidence, 3)
+    if parsed and confidence >= LOCAL_PARSER_MIN_CONFIDENCE:
+        print(f"   [PARSER] Rozpoznano tabelę wyników lokalnie (pewność {confidence:.2f}) - pomijam AI")
+        return parsed
+    print(f"   [PARSER] Niska pewność parsera lokalnego ({confidence:.2f}) - analiza przez AI")
+    return None
+
+def _store_analysis(item, data, result_cache):
+    """Zapis JSON wyniku (magazyn artefaktów) i uzupełnienie cache."""
+    if data and SAVE_JSON_ENABLED:
         try:
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            print(f"   [ZAPIS] Zapisano odpowiedź JSON do: {json_path}")
+            with span("save_json", item["timings"]):
+                _save_artifact(item, ARTIFACT_RESULT, data=data)
         except Exception as e:
-            print(f"   [BŁĄD ZAPISU] Nie udało się zapisać pliku JSON: {e}")
-            
+            print(f"   [BŁĄD ZAPISU] Nie udało się zapisać wyniku JSON: {e}")
+
+    if data and result_cache is not None and item["doc_hash"] is not None:
+        result_cache.put(item["doc_hash"], item["page_texts"], item["anonymized_text"], data)
+
+    item["data"] = data
+    return item
+
+def _flatten_streamed_section(sections, index, section, meta):
+    """Sekcja odebrana ze strumienia AI spłaszczana od razu, zanim model skończy resztę odpowiedzi."""
+    date = (meta or {}).get('date_examination')
+    sections[index] = (section, list(_iter_section_results(section, date)))
+    print(f"   [AI] Sekcja {index + 1}: {section.get('examination_name', 'Inne')} "
+          f"({len(sections[index][1])} wyników)")
+
+def _streamed_lab_rows(data, sections):
+    """
+    Wiersze formatu długiego z sekcji spłaszczonych w trakcie streamingu.
+    O wyniku rozstrzyga pełna odpowiedź: sekcje z ponowionego zapytania lub innego dostawcy
+    (inne niż w wyniku) są spłaszczane jeszcze raz, a data pochodzi z "meta" wyniku.
+    """
+    if not sections or not data or 'meta' not in data or 'examinations' not in data:
+        return None
+    date = data.get('meta', {}).get('date_examination')
+    rows = []
+    for index, section in enumerate(data['examinations']):
+        streamed = sections.get(index)
+        if streamed is not None and streamed[0] == section:
+            rows.extend(row if row['date'] == date else dict(row, date=date) for row in streamed[1])
+        else:
+            rows.extend(_iter_section_results(section, date))
+    return rows
+
+def _stage_analyze(item, analyzer_instance, result_cache):
+    """Etap 4: analiza AI, zapis JSON i uzupełnienie cache."""
+    data = _analyze_locally(item)
+
+    # Krok 3b: Analiza oczyszczonego tekstu przez AI (limity RPM/TPM pilnuje MedicalAnalyzer)
+    if data is None:
+        sections = {}  # indeks sekcji -> (sekcja, wiersze), wypełniane w trakcie odbierania odpowiedzi
+        data = analyzer_instance.analyze_text(item["anonymized_text"], provider='gemini', timings=item["timings"],
+                                              on_section=functools.partial(_flatten_streamed_section, sections))
+        item["lab_rows"] = _streamed_lab_rows(data, sections)
+
+    return _store_analysis(item, data, result_cache)
+
+def _stage_analyze_batch(items, analyzer_instance, result_cache):
+    """Etap 4 w trybie wsadowym: dokumenty, których nie odczytał parser lokalny, idą do AI jednym zapytaniem."""
+    local_results = [_analyze_locally(item) for item in items]
+
+    # Neutralne identyfikatory - nazwy plików mogą zawierać dane osobowe
+    documents = {f"doc-{index + 1}": item["anonymized_text"]
+                 for index, (item, data) in enumerate(zip(items, local_results)) if data is None}
+    # Czasy zapytania wsadowego trafiają do dokumentów odczytanych z jego odpowiedzi (oznaczone jako wspólne);
+    # dokument przeanalizowany pojedynczo ma tylko czasy własnego zapytania
+    document_timings = {f"doc-{index + 1}": item["timings"]
+                        for index, (item, data) in enumerate(zip(items, local_results)) if data is None}
+    ai_results = analyzer_instance.analyze_batch(documents, provider='gemini', document_timings=document_timings) if documents else {}
+
+    return [
+        _store_analysis(item, data if data is not None else ai_results.get(f"doc-{index + 1}"), result_cache)
+        for index, (item, data) in enumerate(zip(items, local_results))
+    ]
+
+def build_pipeline_stages(vision_ocr_client, analyzer_instance, result_cache=None):
+    """Buduje etapy potoku: rasteryzacja -> OCR -> anonimizacja -> AI."""
+    stages = [
+        Stage("rasterize", functools.partial(_stage_rasterize, vision_ocr_client=vision_ocr_client, result_cache=result_cache),
+              workers=PIPELINE_WORKERS["rasterize"], queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("ocr", functools.partial(_stage_ocr, vision_ocr_client=vision_ocr_client),
+              workers=PIPELINE_WORKERS["ocr"], queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("anonymize", _stage_anonymize,
+              workers=PIPELINE_WORKERS["anonymize"], queue_size=PIPELINE_QUEUE_SIZE),
+    ]
+    if LLM_BATCH_SIZE > 1:
+        # Krótkie dokumenty zbierane w porcje - jedno zapytanie AI na kilka plików
+        stages.append(Stage("analyze", functools.partial(_stage_analyze_batch, analyzer_instance=analyzer_instance, result_cache=result_cache),
+                            workers=PIPELINE_WORKERS["analyze"], queue_size=PIPELINE_QUEUE_SIZE,
+                            batch_size=LLM_BATCH_SIZE, batch_wait=LLM_BATCH_WAIT_SECONDS))
+    else:
+        stages.append(Stage("analyze", functools.partial(_stage_analyze, analyzer_instance=analyzer_instance, result_cache=result_cache),
+                            workers=PIPELINE_WORKERS["analyze"], queue_size=PIPELINE_QUEUE_SIZE))
+    return stages
+
+def process_single_file(file_path, vision_ocr_client, analyzer_instance, result_cache=None, results_store=None):
+    """
+    Przetwarza pojedynczy plik: OCR -> Anonimizacja -> Analiza AI.
+    Zwraca surowy JSON z wynikami (nie spłaszczony).
+    Jeśli podano result_cache, wynik dla identycznego pliku zwracany jest bez OCR i AI.
+    Jeśli podano results_store, wyniki są dopisywane do magazynu.
+    """
+    item = _new_pipeline_item(file_path)
+    for stage in build_pipeline_stages(vision_ocr_client, analyzer_instance, result_cache):
+        output = stage.func([item])[0] if stage.batch_size > 1 else stage.func(item)
+        if output is None:
+            break
+    if item["error"] is not None:
+        DOCUMENTS.inc(status="error")
+        raise item["error"]
+    with span("ingest", item["timings"]):
+        _ingest_results(item, results_store)
+    DOCUMENTS.inc(status="success" if item["data"] else "empty")
+    return item["data"]
+
+def process_files(file_paths, vision_ocr_client, analyzer_instance, result_cache=None, results_store=None):
+    """
+    Przetwarza wiele plików potokiem etapów (każdy etap z własną pulą wątków).
+    Zwraca generator trójek (ścieżka, dane, błąd) w kolejności zakończenia.
+    """
+    for item, error in process_items(file_paths, vision_ocr_client, analyzer_instance, result_cache, results_store):
+        yield item["file_path"], item["data"], error
+
+def process_items(file_paths, vision_ocr_client, analyzer_instance, result_cache=None, results_store=None):
+    """Jak process_files, ale zwraca pełny stan dokumentu (m.in. czasy etapów): pary (item, błąd)."""
+    items = (_new_pipeline_item(path) for path in file_paths)
+    return _run_pipeline(items, vision_ocr_client, analyzer_instance, result_cache, results_store)
+
+def upload_name(filename):
+    """Sama nazwa przesłanego pliku - bez katalogów (nazwa wyznacza ścieżki plików wynikowych)."""
+    return os.path.basename((filename or "").replace("\\", "/")) or "document.pdf"
+
+def process_uploads(uploads, vision_ocr_client, analyzer_instance, result_cache=None, results_store=None):
+    """
+    Jak process_items, ale dla dokumentów przesłanych bezpośrednio do serwera: pary (nazwa pliku, bajty).
+    Dokument jest przetwarzany z pamięci - bez wspólnego katalogu uploads między backendem a silnikiem.
+    """
+    items = (_new_pipeline_item(upload_name(name), content) for name, content in uploads)
+    return _run_pipeline(items, vision_ocr_client, analyzer_instance, result_cache, results_store)
+
+def _run_pipeline(items, vision_ocr_client, analyzer_instance, result_cache, results_store):
+    pipeline = Pipeline(build_pipeline_stages(vision_ocr_client, analyzer_instance, result_cache))
+    for item, error in pipeline.run(items):
+        if error is None:
+            error = item["error"]  # Etap obsłużył błąd sam i zatrzymał dokument
+        if error is None:
+            with span("ingest", item["timings"]):
+                _ingest_results(item, results_store)
+        DOCUMENTS.inc(status="error" if error is not None else ("success" if item["data"] else "empty"))
+        yield item, error
+
+def document_timings(item):
+    """Podsumowanie czasów dokumentu: łączny czas w potoku (z oczekiwaniem w kolejkach) i lista etapów."""
+    return {
+        "total_seconds": round(time.perf_counter() - item["started_at"], 4),
+        "spans": item["timings"],
+    }
+
+def _load_unchanged_result(manifest, path):
+    """Wynik niezmienionego pliku: JSON wskazany w manifeście albo artefakt o SHA-256 pliku."""
+    data = manifest.load_result(path)
+    artifact_store = get_artifact_store()
+    if data is None and artifact_store is not None:
+        data = artifact_store.get_json(manifest.document_id(path), ARTIFACT_RESULT)
     return data
 
-def main():
+def ingest_files(file_paths, manifest, vision_ocr_client, analyzer_instance, result_cache=None, results_store=None, reload_unchanged=True):
+    """
+    Przetwarza tylko nowe lub zmienione pliki (wg manifestu); wyniki niezmienionych plików
+    są wczytywane z magazynu artefaktów (reload_unchanged=False - pomijane całkowicie).
+    Zwraca generator trójek (ścieżka, dane, błąd).
+    """
+    if manifest is None:
+        yield from process_files(file_paths, vision_ocr_client, analyzer_instance, result_cache, results_store)
+        return
+
+    # Zmiany manifestu zapisywane porcjami - ostatnia porcja także po przerwaniu przebiegu
+    try:
+        yield from _ingest_with_manifest(file_paths, manifest, vision_ocr_client, analyzer_instance,
+                                         result_cache, results_store, reload_unchanged)
+    finally:
+        manifest.flush()
+
+def _ingest_with_manifest(file_paths, manifest, vision_ocr_client, analyzer_instance, result_cache, results_store, reload_unchanged):
+    """Właściwy przebieg ingest_files z manifestem (bez końcowego zapisu manifestu)."""
+    changed = []
+    for path in file_paths:
+        try:
+            unchanged = manifest.is_unchanged(path)
+        except OSError as e:
+            yield path, None, e
+            continue
+
+        if unchanged:
+            if not reload_unchanged:
+                continue
+            data = _load_unchanged_result(manifest, path)
+            if data is not None:
+                print(f"⏭️ [MANIFEST] Bez zmian: {os.path.basename(path)} - wynik z magazynu artefaktów")
+                # Skrót z manifestu - pliku nie czytamy; wiersze już zapisane w magazynie zostają bez zmian
+                document_id = manifest.document_id(path)
+                if results_store is not None and not results_store.has_document(document_id):
+                    item = _new_pipeline_item(path)
+                    item["doc_hash"] = document_id
+                    item["data"] = data
+                    _ingest_results(item, results_store)
+                yield path, data, None
+                continue
+            print(f"[MANIFEST] Brak zapisanego wyniku dla: {os.path.basename(path)} - przetwarzam ponownie.")
+
+        # Stan "pending" przed przetwarzaniem - przerwany proces zostawi plik do ponowienia
+        # (niezapisany wpis daje ten sam efekt: plik nieznany manifestowi jest przetwarzany)
+        # Skrót policzony przez manifest trafia do dokumentu - potok nie czyta pliku drugi raz
+        item = _new_pipeline_item(path)
+        item["doc_hash"] = manifest.mark_pending(path)
+        changed.append(item)
+
+    if changed:
+        print(f"[MANIFEST] Do przetworzenia: {len(changed)} z {len(file_paths)} plików.")
+
+    for item, error in _run_pipeline(changed, vision_ocr_client, analyzer_instance, result_cache, results_store):
+        path, data = item["file_path"], item["data"]
+        # Wynik jest w magazynie artefaktów pod SHA-256 pliku - tym samym, który zapisał manifest
+        if error is None and data:
+            manifest.mark_done(path)
+        else:
+            manifest.mark_failed(path, error)
+        yield path, data, error
+
+def export_json_result(file_path, data, export_dir=None):
+    """Zapisuje wynik dokumentu jako czytelny plik JSON <nazwa pliku>.json (np. dla tests/test_json_comparison.py)."""
+    if export_dir is None:
+        export_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), EXPORT_JSON_DIR)
+    os.makedirs(export_dir, exist_ok=True)
+    json_path = os.path.join(export_dir, os.path.splitext(os.path.basename(file_path))[0] + ".json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    print(f"   [EKSPORT] Zapisano odpowiedź JSON do: {json_path}")
+    return json_path
+
+def _watch_uploads(uploads_dir, manifest, vision_ocr_client, analyzer_instance, result_cache, results_store):
+    """Tryb --watch: co WATCH_INTERVAL_SECONDS przetwarza nowe i zmienione pliki z katalogu uploads."""
+    print(f"👀 Obserwowanie katalogu {uploads_dir} (Ctrl+C kończy)...")
+    try:
+        while True:
+            now = time.time()
+            files = [path for path in glob.glob(os.path.join(uploads_dir, "*.pdf"))
+                     if now - os.path.getmtime(path) >= WATCH_SETTLE_SECONDS]
+            processed = 0
+            for file, data, error in ingest_files(files, manifest, vision_ocr_client, analyzer_instance, result_cache, results_store, reload_unchanged=False):
+                processed += 1
+                if not data:
+                    print(f"Nie udało się pobrać danych z pliku: {os.path.basename(file)}")
+
+            # Po nowych wynikach odświeżamy pliki wykresów (renderowane tylko te ze zmienionymi danymi)
+            if processed and CHART_MODE == "files" and results_store is not None:
+                df = load_report_frame(results_store)
+                if df is not None and len(df) >= 2:
+                    create_chart_renderer().render(df, chart_parameters(df))
+            time.sleep(WATCH_INTERVAL_SECONDS)
+    except KeyboardInterrupt:
+        print("Zakończono obserwowanie katalogu.")
+
+def main(watch=False, uploads_dir=None, export_json=False):
     print("Skanowanie folderu w poszukiwaniu plików PDF...")
     # Zmieniono ścieżkę na katalog uploads w root projektu
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(current_dir)
-    uploads_dir = os.path.join(project_root, "uploads")
+    if uploads_dir is None:
+        uploads_dir = os.path.join(project_root, "uploads")
     
     # Upewnij się, że katalog uploads istnieje
     if not os.path.exists(uploads_dir):
@@ -180,23 +777,38 @@ def main():
         # Ścieżka do klucza GCP względem katalogu engine-python
         key_path = os.path.abspath(os.path.join(current_dir, GCP_KEY_PATH))
         
-        # Sprawdzenie czy plik klucza istnieje
-        if not os.path.exists(key_path):
+        # Sprawdzenie czy plik klucza istnieje (odtwarzanie z kasety go nie potrzebuje)
+        if not os.path.exists(key_path) and TRANSPORT_MODE != TRANSPORT_REPLAY:
             print(f"BŁĄD: Nie znaleziono pliku klucza GCP pod ścieżką: {key_path}")
             print("Upewnij się, że plik gcp_key.json znajduje się w katalogu engine-python.")
             return
 
-        vision_ocr = GoogleVisionOCR(key_path, poppler_path=r'C:\poppler-25.12.0\Library\bin')
+        vision_ocr = create_vision_ocr(key_path)
 
     # Inicjalizacja analizatora
-    analyzer = MedicalAnalyzer()
+    analyzer = create_analyzer()
+    result_cache = create_result_cache(analyzer)
+    results_store = create_results_store()
+    manifest = create_ingest_manifest(analyzer)
+
+    if watch:
+        if manifest is None:
+            print("BŁĄD: Tryb --watch wymaga manifestu (INGEST_MANIFEST_ENABLED = True).")
+            return
+        _watch_uploads(uploads_dir, manifest, vision_ocr, analyzer, result_cache, results_store)
+        return
 
     all_results = []
 
-    for file in files:
-        data = process_single_file(file, vision_ocr, analyzer)
-        
+    # Pliki przechodzą przez potok - OCR kolejnego pliku trwa, gdy poprzedni czeka na AI.
+    # Pliki niezmienione od ostatniego uruchomienia są wczytywane z magazynu artefaktów.
+    for file, data, error in ingest_files(files, manifest, vision_ocr, analyzer, result_cache, results_store):
         if data:
+            if export_json:
+                # Wyniki niezmienionych plików też - ingest_files wczytuje je z magazynu artefaktów
+                export_json_result(file, data)
+            if results_store is not None:
+                continue  # Wyniki są już w magazynie
             # Krok 3.2: Spłaszczenie struktury JSON do formatu tabelarycznego
             flat_data = _flatten_lab_results(data)
             if flat_data:
@@ -205,21 +817,18 @@ def main():
         else:
             print(f"Nie udało się pobrać danych z pliku: {os.path.basename(file)}")
 
-        # Przy tekście limity są luźniejsze, wystarczy krótkie opóźnienie
-        time.sleep(2)
+    # Krok 4: Tworzenie tabeli i wykresów - z magazynu czytamy tylko wybrane serie i zakres dat
+    if results_store is not None:
+        df = load_report_frame(results_store)
+    elif all_results:
+        df = _prepare_report_frame(pd.DataFrame(all_results))
+    else:
+        df = None
 
-    # Krok 4: Tworzenie tabeli i wykresów
-    if not all_results:
+    if df is None:
         print("Brak danych do analizy.")
         return
 
-    df = pd.DataFrame(all_results)
-
-    # Konwersja kolumn liczbowych (wszystkie poza datą)
-    for col in df.columns:
-        if col != 'Date' and not col.endswith('_flag'):
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
     print("\n--- ZESTAWIENIE WYNIKÓW ---")
     print(df.to_string(index=False))
 
@@ -227,16 +836,14 @@ def main():
         print("\n[!] Potrzebne są co najmniej dwa badania z różnymi datami, aby narysować trendy.")
         return
 
-    # Sortowanie po dacie
-    if 'Date' in df.columns:
-        df['Date'] = pd.to_datetime(df['Date'])
-        df = df.sort_values('Date')
+    parameters_to_plot = chart_parameters(df)
 
-    # Lista kolumn do narysowania (wszystkie poza datą)
-    parameters_to_plot = [col for col in df.columns if col != 'Date' and not col.endswith('_flag') and not col.endswith('_min') and not col.endswith('_max')]
-
-    # Filtrujemy tylko te, które mają jakieś dane (nie same NaN)
-    parameters_to_plot = [col for col in parameters_to_plot if df[col].notna().any()]
+    if CHART_MODE == "files":
+        # Bez okna: osobny plik na parametr, renderowane tylko wykresy ze zmienionymi danymi
+        renderer = create_chart_renderer()
+        charts = renderer.render(df, parameters_to_plot)
+        print(f"Wykresy zapisane w: {renderer.output_dir} ({len(charts)} plików)")
+        return
 
     # Tworzymy tyle wykresów, ile mamy parametrów (jeden pod drugim)
     fig, axes = plt.subplots(nrows=len(parameters_to_plot), ncols=1, figsize=(10, 4 * len(parameters_to_plot)))
@@ -246,48 +853,18 @@ def main():
 
     for ax, param in zip(axes, parameters_to_plot):
         # Rysujemy tylko punkty, gdzie są dane (dropna)
-        subset = df.dropna(subset=[param])
-
-        # --- RYSOWANIE ZAKRESU REFERENCYJNEGO (WSTĘGA) ---
-        min_col = f"{param}_min"
-        max_col = f"{param}_max"
-
-        if min_col in df.columns and max_col in df.columns:
-            # Pobieramy wartości norm dla punktów, które rysujemy
-            # fillna(0) dla minimum obsługuje przypadki typu "< 5" (gdzie min to null)
-            vals_min = subset[min_col].fillna(0)
-            vals_max = subset[max_col]
-
-            # Rysujemy wstęgę tylko jeśli mamy dane o maksimum
-            if vals_max.notna().any():
-                ax.fill_between(subset['Date'], vals_min, vals_max, color='green', alpha=0.15, label='Zakres normy')
-                # Opcjonalnie: delikatne linie krawędziowe normy
-                # ax.plot(subset['Date'], vals_max, color='green', linestyle=':', alpha=0.3, linewidth=0.5)
-                # ax.plot(subset['Date'], vals_min, color='green', linestyle=':', alpha=0.3, linewidth=0.5)
-
-        # Główna linia trendu łącząca wszystkie punkty
-        ax.plot(subset['Date'], subset[param], linestyle='-', color='gray', linewidth=1, zorder=1)
-
-        # Domyślne, zielone markery dla wszystkich punktów
-        ax.scatter(subset['Date'], subset[param], color='teal', zorder=2, label='W normie')
-
-        # Sprawdzenie i narysowanie punktów z flagami, które przykryją domyślne markery
-        flag_col_name = f"{param}_flag"
-        if flag_col_name in subset.columns:
-            high_points = subset[subset[flag_col_name] == 'H']
-            low_points = subset[subset[flag_col_name] == 'L']
-            ax.scatter(high_points['Date'], high_points[param], color='red', s=80, zorder=3, edgecolors='black', label='Powyżej normy (H)')
-            ax.scatter(low_points['Date'], low_points[param], color='blue', s=80, zorder=3, edgecolors='black', label='Poniżej normy (L)')
-
-        ax.set_title(f'Trend parametru: {param}', fontsize=12)
-        ax.set_ylabel('Wartość')
-        ax.grid(True, linestyle='--', alpha=0.6)
-        ax.tick_params(axis='x', rotation=30)
-        ax.legend()
+        draw_parameter(ax, chart_slice(df, param), param)
 
     plt.tight_layout()  # Żeby wykresy na siebie nie najeżdżały
     plt.show()
 
-
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="MorfoLog - analiza wyników badań z katalogu uploads")
+    parser.add_argument("--watch", action="store_true", help="Obserwuj katalog uploads i przetwarzaj nowe pliki na bieżąco")
+    parser.add_argument("--transport", choices=TRANSPORT_MODES, default=TRANSPORT_MODE,
+                        help="live, record (nagraj odpowiedzi Vision/AI) lub replay (odtwórz z kasety, offline)")
+    parser.add_argument("--export-json", action="store_true",
+                        help=f"Zapisz wynik każdego pliku z magazynu artefaktów do {EXPORT_JSON_DIR}/<nazwa>.json")
+    args = parser.parse_args()
+    TRANSPORT_MODE = args.transport
+    main(watch=args.watch, export_json=args.export_json)
\ No newline at end of file
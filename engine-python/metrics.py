@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Granice kubełków histogramów czasu (s) - od operacji w pamięci po wolne zapytania do AI
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Licznik rosnący (np. błędy, ponowienia, wysłane bajty) z etykietami."""
+    type_name = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render_samples(self):
+        with self._lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}" for key, value in items]
+
+
+class Histogram:
+    """Histogram czasów (kubełki skumulowane, suma i liczba obserwacji) z etykietami."""
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # klucz etykiet -> [liczniki kubełków (+Inf na końcu), suma, liczba]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self.series.get(key)
+            return series[2] if series else 0
+
+    def render_samples(self):
+        with self._lock:
+            items = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self.series.items())
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [("le", _format_number(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Zbiór metryk procesu, wypisywany w formacie tekstowym Prometheus (GET /metrics)."""
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render_samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "morfolog_span_duration_seconds", "Czas etapów przetwarzania dokumentu", ["span"])
+SPAN_ERRORS = REGISTRY.counter(
+    "morfolog_span_errors_total", "Wyjątki w etapach przetwarzania dokumentu", ["span"])
+DOCUMENTS = REGISTRY.counter(
+    "morfolog_documents_total", "Przetworzone dokumenty wg wyniku", ["status"])
+PAGES = REGISTRY.counter(
+    "morfolog_pages_total", "Strony dokumentów wg źródła tekstu", ["source"])
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "morfolog_llm_request_duration_seconds", "Czas odpowiedzi dostawcy AI (bez oczekiwania w limiterze)", ["provider"])
+LLM_ERRORS = REGISTRY.counter(
+    "morfolog_llm_errors_total", "Nieudane zapytania do dostawcy AI", ["provider"])
+LLM_RETRIES = REGISTRY.counter(
+    "morfolog_llm_retries_total", "Ponowienia zapytań po limicie 429", ["provider"])
+LLM_FALLBACKS = REGISTRY.counter(
+    "morfolog_llm_fallbacks_total", "Przełączenia na zapasowego dostawcę AI", ["from_provider", "to_provider"])
+BYTES_UPLOADED = REGISTRY.counter(
+    "morfolog_uploaded_bytes_total", "Bajty wysłane do usług zewnętrznych", ["target"])
+
+# Funkcje wywoływane po każdym pomiarze: callback(nazwa, sekundy, tagi) - np. benchmark zbierający surowe czasy
+_span_listeners = []
+
+
+def add_span_listener(callback):
+    _span_listeners.append(callback)
+
+
+def remove_span_listener(callback):
+    _span_listeners.remove(callback)
+
+
+class DocumentTimings(list):
+    """
+    Lista czasów etapów jednego dokumentu. Jej tagi (np. document = nazwa pliku) trafiają do każdego
+    wpisu dodanego przez span() i do słuchaczy, więc wolny pomiar da się powiązać z dokumentem.
+    """
+    def __init__(self, entries=(), **tags):
+        super().__init__(entries)
+        self.tags = tags
+
+
+def timings_like(timings):
+    """Nowa, pusta lista czasów z tagami dokumentu z `timings` (np. dla równoległej próby zapytania)."""
+    return DocumentTimings(**getattr(timings, "tags", {}))
+
+
+@contextmanager
+def span(name, timings=None, **tags):
+    """
+    Mierzy czas bloku: obserwacja w histogramie SPAN_SECONDS (etykieta = nazwa etapu)
+    oraz wpis {"span", "seconds", ...tagi} dopisany do listy `timings` dokumentu.
+    Zwraca słownik tagów, który blok może uzupełnić (np. liczba stron, dostawca).
+    Tagi (strony, dostawca, dokument z DocumentTimings) trafiają do wpisu dokumentu i do słuchaczy,
+    ale nie do etykiet metryk - nazwa pliku jako etykieta rozdęłaby liczbę serii histogramu.
+    """
+    tags = dict(getattr(timings, "tags", {}), **tags)
+    started = time.perf_counter()
+    try:
+        yield tags
+    except Exception:
+        SPAN_ERRORS.inc(span=name)
+        tags["error"] = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        SPAN_SECONDS.observe(seconds, span=name)
+        for listener in list(_span_listeners):
+            listener(name, seconds, tags)
+        if timings is not None:
+            timings.append({"span": name, "seconds": round(seconds, 4), **tags})
@@ -1,14 +1,24 @@
 import pytesseract
-from pdf2image import convert_from_path
 import os
 import glob
 import re
+import json
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
+from pdf_raster import count_pdf_pages, iter_pdf_pages, pdf_file_path
 
 # --- KONFIGURACJA ---
 # Te ścieżki muszą być dostosowane do Twojego systemu
 POPPLER_PATH = r'C:\poppler-25.12.0\Library\bin'
 TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+OCR_DPI = 200  # Rozdzielczość rasteryzacji stron dla Tesseracta
+OCR_GRAYSCALE = False  # Rasteryzacja w odcieniach szarości (mniej pamięci na stronę)
+OCR_THREAD_COUNT = 1  # Ile stron pdftoppm renderuje naraz (tyle też trzymamy w pamięci)
+TESSERACT_WORKERS = os.cpu_count() or 1  # Liczba procesów OCR (domyślnie wszystkie rdzenie)
+TESSERACT_OMP_THREAD_LIMIT = 1  # Wątki OpenMP na proces Tesseracta - 1, bo równoległość daje pula procesów
 # --------------------
 
 # Wczytaj zmienne środowiskowe z pliku .env
@@ -23,76 +33,290 @@ USER_PROFILE = {
     "address": os.getenv("USER_ADDRESS")
 }
 
+# Opcjonalny plik JSON z wieloma profilami pacjentów: lista obiektów
+# {"id", "name", "lastname", "pesel", "address"} albo słownik {id: profil}
+USER_PROFILES_PATH = os.getenv("USER_PROFILES_PATH")
+
+# Ogólne reguły anonimizacji (niezależne od profilu) - dopasowywane w tym samym przebiegu co dane z profili
+_PESEL_PATTERN = r'\b\d{11}\b'  # Każdy pozostały 11-cyfrowy ciąg (potencjalny PESEL)
+_ROLE_PATTERN = r'\b(?:Pacjent|Odbiorca|Lekarz)\b\s*:?'  # Słowa-klucze ról (np. "Pacjent:"), a nie całe linie
+_DOB_PATTERN = r'\bData ur[\s.:]*\n?\d{4}-\d{2}-\d{2}'  # Data urodzenia z różnymi separatorami
+
+_REPLACEMENTS = {
+    "direct": "[REDACTED]",
+    "pesel": "[REDACTED_PESEL]",
+    "role": "[REDACTED_ROLE_INFO]",
+    "dob": "[REDACTED_DOB]",
+}
+
+# Linie z metadanymi usuwane z ostatniej strony
+NOISE_REGEX = re.compile('|'.join([
+    r'przyjęcia prób',
+    r'Data wykonania',
+    r'Data/godz\. wydania',
+    r'DIAGNOSTYKA S\.A\.',
+    r'KREW ŻYLNA',
+    r'Strona:? \d+ z \d+'
+]), re.IGNORECASE)
+
+
+def profile_direct_values(user_profile: dict) -> list[str]:
+    """Zwraca wartości z profilu do bezpośredniego, precyzyjnego zastąpienia (imię, nazwisko, PESEL, części adresu)."""
+    values = [
+        user_profile.get("name"),
+        user_profile.get("lastname"),
+        user_profile.get("pesel"),
+    ]
+
+    # Podziel adres na części, aby usunąć np. samą nazwę ulicy lub miasto
+    address = user_profile.get("address") or ""
+    if address:
+        # Usuń przecinki i podziel po spacjach
+        address_parts = re.split(r'[\s,]+', address)
+        values.extend([part for part in address_parts if len(part) > 3 and not part.isdigit()])
+
+    return [v for v in values if v]
+
+
+def _trie_pattern(values) -> str:
+    """
+    Buduje jedno wyrażenie regularne dla wielu słów w postaci drzewa prefiksowego (trie),
+    np. ["jan", "janina", "jasło"] -> "ja(?:n(?:ina)?|sło)".
+    Silnik regex nie sprawdza każdej wartości od nowa, więc koszt dopasowania
+    praktycznie nie rośnie wraz z liczbą profili. Dłuższe warianty mają pierwszeństwo.
+    """
+    trie = {}
+    for value in values:
+        node = trie
+        for char in value:
+            node = node.setdefault(char, {})
+        node[""] = True  # Koniec słowa
+
+    def build(node):
+        is_end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != ""]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Koniec słowa w środku gałęzi: reszta jest opcjonalna (zachłanna, więc najpierw najdłuższe dopasowanie)
+        return "(?:" + body + ")?" if is_end else body
+
+    return build(trie)
+
+
 class PrivacyGuard:
     """
     Klasa do anonimizacji danych osobowych z surowego tekstu OCR, używająca precyzyjnego zastępowania słów.
+    Dane wszystkich profili i ogólne reguły są kompilowane raz do jednego wyrażenia,
+    więc każda strona jest przetwarzana w jednym przebiegu.
     """
-    def __init__(self, user_profile: dict):
-        self.profile = user_profile
+    def __init__(self, user_profile: dict | list[dict]):
+        # Jeden profil (słownik) albo wiele profili obsługiwanych jednocześnie (lista)
+        self.profiles = [user_profile] if isinstance(user_profile, dict) else list(user_profile)
 
-        # Wartości do bezpośredniego, precyzyjnego zastąpienia
-        self.direct_values = [
-            self.profile.get("name"),
-            self.profile.get("lastname"),
-            self.profile.get("pesel"),
-        ]
-        
-        # Podziel adres na części, aby usunąć np. samą nazwę ulicy lub miasto
-        address = self.profile.get("address", "")
-        if address:
-            # Usuń przecinki i podziel po spacjach
-            address_parts = re.split(r'[\s,]+', address)
-            self.direct_values.extend([part for part in address_parts if len(part) > 3 and not part.isdigit()])
+        # Wartości do bezpośredniego, precyzyjnego zastąpienia - bez duplikatów (także różniących się wielkością liter)
+        unique_values = {}
+        for profile in self.profiles:
+            for value in profile_direct_values(profile):
+                unique_values.setdefault(value.lower(), value)
+        self.direct_values = list(unique_values.values())
 
-        # Usuń puste wpisy (None) i ewentualne duplikaty
-        self.direct_values = list(set([v for v in self.direct_values if v]))
+        patterns = []
+        if unique_values:
+            # \b z obu stron, aby uniknąć zastępowania części słów
+            patterns.append(r'(?P<direct>\b' + _trie_pattern(unique_values) + r'\b)')
+        patterns.append(f'(?P<pesel>{_PESEL_PATTERN})')
+        patterns.append(f'(?P<role>{_ROLE_PATTERN})')
+        patterns.append(f'(?P<dob>{_DOB_PATTERN})')
+        self.matcher = re.compile('|'.join(patterns), re.IGNORECASE)
+
+    @staticmethod
+    def _replace(match):
+        return _REPLACEMENTS[match.lastgroup]
 
     def anonymize(self, page_texts: list[str]) -> str:
-        """Działa wieloetapowo, precyzyjnie zastępując słowa i czyszcząc szum tylko na ostatniej stronie."""
-        
+        """Zastępuje dane osobowe w jednym przebiegu na stronę i czyści szum tylko na ostatniej stronie."""
+
         processed_pages = []
         num_pages = len(page_texts)
 
         for i, page_text in enumerate(page_texts):
             is_last_page = (i == num_pages - 1)
-            anonymized_text = page_text
-            
-            # Etap 1: Bezpośrednie zastąpienie precyzyjnych danych (Imię, Nazwisko, PESEL, fragmenty adresu)
-            for value in self.direct_values:
-                # Użyj \b do dopasowania całych słów, aby uniknąć zastępowania części słów
-                pattern = r'\b' + re.escape(value) + r'\b'
-                anonymized_text = re.sub(pattern, '[REDACTED]', anonymized_text, flags=re.IGNORECASE)
-
-            # Etap 2: Czyszczenie za pomocą dodatkowych, ogólnych reguł Regex
-            # Usuń każdy pozostały 11-cyfrowy ciąg (potencjalny PESEL)
-            anonymized_text = re.sub(r'\b\d{11}\b', '[REDACTED_PESEL]', anonymized_text)
-            
-            # Zastąp słowa-klucze ról (np. "Pacjent:"), a nie całe linie
-            anonymized_text = re.sub(r'\b(Pacjent|Odbiorca|Lekarz)\b\s*:?', '[REDACTED_ROLE_INFO]', anonymized_text, flags=re.IGNORECASE)
-
-            # Anonimizuj datę urodzenia - bardziej elastyczny Regex, który obsługuje różne separatory (spacja, kropka, dwukropek)
-            anonymized_text = re.sub(r'\bData ur[\s.:]*\n?\d{4}-\d{2}-\d{2}', '[REDACTED_DOB]', anonymized_text, flags=re.IGNORECASE)
-
-            lines = anonymized_text.split('\n')
-            current_page_processed_lines = lines
+
+            # Etap 1 i 2: dane z profili (Imię, Nazwisko, PESEL, fragmenty adresu) oraz ogólne reguły naraz
+            anonymized_text = self.matcher.sub(self._replace, page_text)
 
             # Etap 3: Usuwanie linii z metadanymi - TYLKO DLA OSTATNIEJ STRONY
             if is_last_page:
-                noise_patterns = [
-                    r'przyjęcia prób',
-                    r'Data wykonania',
-                    r'Data/godz\. wydania',
-                    r'DIAGNOSTYKA S\.A\.',
-                    r'KREW ŻYLNA',
-                    r'Strona:? \d+ z \d+'
-                ]
-                noise_regex = re.compile('|'.join(noise_patterns), re.IGNORECASE)
-                current_page_processed_lines = [line for line in current_page_processed_lines if not noise_regex.search(line)]
-
-            processed_pages.append("\n".join(current_page_processed_lines))
+                lines = [line for line in anonymized_text.split('\n') if not NOISE_REGEX.search(line)]
+                anonymized_text = "\n".join(lines)
+
+            processed_pages.append(anonymized_text)
 
         return "\n".join(processed_pages)
 
+
+def load_user_profiles(path=USER_PROFILES_PATH) -> dict[str, dict]:
+    """
+    Wczytuje profile pacjentów: profil z .env (pod kluczem "default") oraz profile z pliku JSON.
+    Zwraca słownik {id profilu: profil}.
+    """
+    profiles = {}
+    if any(USER_PROFILE.values()):
+        profiles["default"] = USER_PROFILE
+
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+        if isinstance(loaded, dict):
+            loaded = [dict(profile, id=profile_id) for profile_id, profile in loaded.items()]
+        for index, profile in enumerate(loaded):
+            profile_id = str(profile.get("id", index))
+            profiles[profile_id] = {key: profile.get(key) for key in ("name", "lastname", "pesel", "address")}
+        print(f"✅ Wczytano {len(loaded)} profili anonimizacji z: {path}")
+
+    return profiles
+
+
+USER_PROFILES = load_user_profiles()
+
+
+def _profile_key(profile: dict) -> tuple:
+    return tuple(sorted((k, v) for k, v in profile.items() if v))
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_guard(profile_keys: frozenset) -> PrivacyGuard:
+    return PrivacyGuard([dict(key) for key in sorted(profile_keys)])
+
+
+def get_privacy_guard(profile_ids=None) -> PrivacyGuard:
+    """
+    Zwraca skompilowany PrivacyGuard (z pamięci podręcznej) dla wskazanych profili.
+    Domyślnie obejmuje wszystkie wczytane profile - dokument jest czyszczony z danych każdego znanego pacjenta.
+    """
+    if profile_ids is None:
+        profiles = USER_PROFILES.values()
+    else:
+        profiles = [USER_PROFILES[profile_id] for profile_id in profile_ids]
+    return _cached_guard(frozenset(_profile_key(profile) for profile in profiles))
+
+def _init_tesseract_worker(tesseract_cmd, omp_thread_limit):
+    """Inicjalizacja procesu roboczego: ścieżka Tesseracta i limit wątków OpenMP."""
+    # Bez limitu każdy proces Tesseracta uruchamia wątki na wszystkich rdzeniach i procesy się zagłuszają
+    os.environ["OMP_THREAD_LIMIT"] = str(omp_thread_limit)
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+def _ocr_single_page(pdf_path, page, lang):
+    """Zadanie procesu roboczego: rasteryzacja jednej strony i OCR (bitmapa nie opuszcza procesu)."""
+    for _, img in iter_pdf_pages(pdf_path, poppler_path=POPPLER_PATH, dpi=OCR_DPI,
+                                 grayscale=OCR_GRAYSCALE, thread_count=1, pages=[page]):
+        try:
+            return pytesseract.image_to_string(img, lang=lang)
+        finally:
+            img.close()
+    return ""
+
+class TesseractEngine:
+    """
+    Silnik OCR Tesseract oparty na puli procesów.
+    Strony (a w trybie wsadowym strony wielu dokumentów) są rozdzielane na wszystkie rdzenie,
+    a wyniki składane w kolejności stron niezależnie od kolejności zakończenia.
+    """
+    def __init__(self, workers=TESSERACT_WORKERS, lang='pol', omp_thread_limit=TESSERACT_OMP_THREAD_LIMIT):
+        self.workers = max(1, workers)
+        self.lang = lang
+        # Kontekst "spawn": pula powstaje leniwie w wątku roboczym potoku, a fork w chwili,
+        # gdy inne wątki trzymają blokady (logi, klienci HTTP), mógłby zakleszczyć proces potomny
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_tesseract_worker,
+            initargs=(TESSERACT_CMD, omp_thread_limit),
+        )
+
+    def ocr_pages(self, pdf_path, pages=None):
+        """Zwraca listę tekstów wybranych stron (domyślnie wszystkich) w kolejności stron."""
+        result = self.ocr_documents([pdf_path], pages={pdf_path: pages})[pdf_path]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def ocr_documents(self, pdf_paths, pages=None):
+        """
+        Tryb wsadowy: wszystkie strony wszystkich dokumentów trafiają naraz do puli procesów.
+        Zwraca słownik {ścieżka: lista tekstów stron albo wyjątek, jeśli dokument się nie powiódł}.
+        :param pages: Opcjonalny słownik {ścieżka: lista indeksów stron}.
+        """
+        pages = pages or {}
+        futures = {}
+        results = {}
+        for pdf_path in pdf_paths:
+            try:
+                doc_pages = pages.get(pdf_path)
+                if doc_pages is None:
+                    doc_pages = range(count_pdf_pages(pdf_path, poppler_path=POPPLER_PATH))
+            except Exception as e:
+                results[pdf_path] = e
+                continue
+            futures[pdf_path] = [
+                self.executor.submit(_ocr_single_page, pdf_path, page, self.lang) for page in doc_pages
+            ]
+
+        for pdf_path, page_futures in futures.items():
+            try:
+                page_texts = []
+                for i, future in enumerate(page_futures):
+                    page_texts.append(future.result())
+                    print(f"  - {os.path.basename(pdf_path)}: strona {i + 1}/{len(page_futures)} gotowa")
+                results[pdf_path] = page_texts
+            except Exception as e:
+                results[pdf_path] = e
+
+        return {pdf_path: results[pdf_path] for pdf_path in pdf_paths}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_tesseract_engine():
+    """Zwraca współdzieloną instancję TesseractEngine (pula procesów tworzona raz)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TesseractEngine()
+        return _engine
+
+def ocr_pdf_pages(pdf_source, pages=None):
+    """
+    Wykonuje OCR Tesseractem na stronach PDF i zwraca listę tekstów (bez zapisu na dysk).
+    Strony są przetwarzane równolegle we współdzielonej puli procesów.
+
+    Args:
+        pdf_source (str | bytes): Ścieżka do pliku PDF albo jego zawartość (dokument przesłany do serwera).
+        pages (list[int] | None): Indeksy stron (od 0) do przetworzenia; domyślnie wszystkie.
+    """
+    # Procesy robocze dostają ścieżkę, a nie bajty - przesłany dokument trafia raz do pliku tymczasowego
+    with pdf_file_path(pdf_source) as pdf_path:
+        return get_tesseract_engine().ocr_pages(pdf_path, pages=pages)
+
+def _write_raw_ocr(pdf_path, page_texts):
+    """Zapis całego, surowego tekstu do pliku .txt dla celów logowania."""
+    full_raw_text = "\n\n--- PAGE BREAK ---\n\n".join(page_texts)
+    # Stwórz folder 'ocr_results' jeśli nie istnieje
+    output_dir = os.path.join(os.path.dirname(pdf_path), "../ocr_results")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Stwórz ścieżkę do pliku w nowym folderze
+    txt_filename = os.path.splitext(os.path.basename(pdf_path))[0] + ".txt"
+    txt_path = os.path.join(output_dir, txt_filename)
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write(full_raw_text)
+
+    print(f"✅ Pomyślnie zapisano wynik OCR do: {txt_path}")
+
 def save_ocr_to_txt(pdf_path):
     """
     Wykonuje OCR na podanym pliku PDF i zapisuje wynik do pliku .txt
@@ -105,34 +329,10 @@ def save_ocr_to_txt(pdf_path):
         print(f"Błąd: Plik nie istnieje: {pdf_path}")
         return None
 
-    # Ustawienie ścieżki do Tesseracta
-    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
-
     print(f"Przetwarzanie OCR dla: {os.path.basename(pdf_path)}...")
     try:
-        # Konwersja PDF na listę obrazów
-        images = convert_from_path(pdf_path, poppler_path=POPPLER_PATH)
-        
-        page_texts = []
-        # Pętla przez wszystkie strony i wykonanie OCR
-        for i, img in enumerate(images):
-            print(f"  - Przetwarzanie strony {i + 1}/{len(images)}")
-            text = pytesseract.image_to_string(img, lang='pol')
-            page_texts.append(text)
-
-        # Zapis całego, surowego tekstu do pliku .txt dla celów logowania
-        full_raw_text = "\n\n--- PAGE BREAK ---\n\n".join(page_texts)
-        # Stwórz folder 'ocr_results' jeśli nie istnieje
-        output_dir = os.path.join(os.path.dirname(pdf_path), "../ocr_results")
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Stwórz ścieżkę do pliku w nowym folderze
-        txt_filename = os.path.splitext(os.path.basename(pdf_path))[0] + ".txt"
-        txt_path = os.path.join(output_dir, txt_filename)
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(full_raw_text)
-            
-        print(f"✅ Pomyślnie zapisano wynik OCR do: {txt_path}")
+        page_texts = ocr_pdf_pages(pdf_path)
+        _write_raw_ocr(pdf_path, page_texts)
         return page_texts
 
     except Exception as e:
@@ -152,15 +352,24 @@ if __name__ == "__main__":
     pdf_files = glob.glob(os.path.join(current_dir, "*.pdf"))
     
     print(f"Znaleziono {len(pdf_files)} plików PDF do przetworzenia.")
-    
+
+    # Krok 1: OCR wsadowy - strony wszystkich plików rozłożone na wszystkie rdzenie
+    engine = get_tesseract_engine()
+    batch_results = engine.ocr_documents(pdf_files)
+
     for pdf_file in pdf_files:
-        # Krok 1: Wykonaj OCR i zapisz surowy plik .txt
-        page_texts = save_ocr_to_txt(pdf_file)
+        # Zapisz surowy plik .txt
+        page_texts = batch_results.get(pdf_file)
+        if isinstance(page_texts, Exception):
+            print(f"❌ Wystąpił błąd podczas przetwarzania OCR dla {os.path.basename(pdf_file)}: {page_texts}")
+            page_texts = None
+        if page_texts:
+            _write_raw_ocr(pdf_file, page_texts)
         
         # Krok 2: Jeśli OCR się powiódł, zanonimizuj tekst i zapisz go do nowego pliku
         if page_texts:
             print(f"--- Anonimizacja wyniku dla: {os.path.basename(pdf_file)} ---")
-            guard = PrivacyGuard(USER_PROFILE)
+            guard = get_privacy_guard()
             anonymized_text = guard.anonymize(page_texts)
 
             # Stwórz folder 'cleaned_results' jeśli nie istnieje
@@ -173,5 +382,6 @@ if __name__ == "__main__":
             with open(anonymized_txt_path, "w", encoding="utf-8") as f:
                 f.write(anonymized_text)
             print(f"✅ Pomyślnie zapisano zanonimizowany tekst do: {anonymized_txt_path}\n")
-        
+
+    engine.shutdown()
     print("\n--- Zakończono przetwarzanie wszystkich plików. ---")
\ No newline at end of file
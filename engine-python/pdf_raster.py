@@ -0,0 +1,85 @@
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# Domyślna rozdzielczość rasteryzacji (taka sama jak domyślna w pdf2image)
+DEFAULT_DPI = 200
+
+
+@contextmanager
+def pdf_file_path(pdf_source):
+    """
+    Ścieżka PDF dla narzędzi Poppler, które czytają tylko pliki. Dla ścieżki - bez zmian;
+    bajty (dokument przesłany do serwera) są zapisywane raz do pliku tymczasowego na czas renderowania.
+    """
+    if not isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        yield pdf_source
+        return
+
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_source)
+        yield temp_path
+    finally:
+        os.remove(temp_path)
+
+
+def count_pdf_pages(pdf_source, poppler_path=None):
+    """Zwraca liczbę stron PDF (ścieżka lub bajty) bez rasteryzowania dokumentu."""
+    with pdf_file_path(pdf_source) as pdf_path:
+        info = pdfinfo_from_path(pdf_path, poppler_path=poppler_path)
+    return int(info["Pages"])
+
+
+def iter_pdf_pages(pdf_source, poppler_path=None, dpi=DEFAULT_DPI, grayscale=False, thread_count=1, pages=None):
+    """
+    Generator rasteryzujący PDF (ścieżka lub bajty) strona po stronie: zwraca pary (indeks strony od 0, obraz PIL).
+    Naraz renderowanych jest co najwyżej thread_count stron (każda w osobnym wątku pdftoppm),
+    więc zużycie pamięci nie zależy od długości dokumentu.
+    Obraz należy zamknąć po użyciu (patrz encode_page).
+    :param pages: Opcjonalna lista indeksów stron (od 0) do wyrenderowania; domyślnie wszystkie.
+    """
+    with pdf_file_path(pdf_source) as pdf_path:
+        yield from _iter_pdf_file_pages(pdf_path, poppler_path, dpi, grayscale, thread_count, pages)
+
+
+def _iter_pdf_file_pages(pdf_path, poppler_path, dpi, grayscale, thread_count, pages):
+    if pages is None:
+        pages = range(count_pdf_pages(pdf_path, poppler_path=poppler_path))
+    pages = list(pages)
+
+    chunk_size = max(1, thread_count)
+    for start in range(0, len(pages), chunk_size):
+        chunk = pages[start:start + chunk_size]
+        # Kolejne strony renderujemy jednym wywołaniem, jeśli tworzą ciągły zakres
+        if chunk[-1] - chunk[0] == len(chunk) - 1:
+            ranges = [(chunk[0], chunk[-1])]
+        else:
+            ranges = [(page, page) for page in chunk]
+
+        for first, last in ranges:
+            images = convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                first_page=first + 1,
+                last_page=last + 1,
+                grayscale=grayscale,
+                thread_count=min(chunk_size, last - first + 1),
+                poppler_path=poppler_path,
+            )
+            for offset, image in enumerate(images):
+                yield first + offset, image
+            del images
+
+
+def encode_page(image, format='JPEG'):
+    """Koduje obraz strony do bajtów i od razu zwalnia bitmapę."""
+    try:
+        buffer = io.BytesIO()
+        image.save(buffer, format=format)
+        return buffer.getvalue()
+    finally:
+        image.close()
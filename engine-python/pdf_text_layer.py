@@ -0,0 +1,71 @@
+import re
+import pdfplumber
+from pdf_raster import DEFAULT_DPI
+from text_geometry import words_to_lines
+
+# Współrzędne PDF są w punktach (1/72 cala), a tolerancje grupowania wierszy
+# dobrano do pikseli obrazu rasteryzowanego w DEFAULT_DPI (Google Vision).
+POINTS_TO_PIXELS = DEFAULT_DPI / 72
+
+MIN_WORDS_PER_PAGE = 5  # Mniej słów = strona zeskanowana (obraz) lub pusta
+MIN_CLEAN_CHAR_RATIO = 0.9  # Minimalny udział "normalnych" znaków w tekście strony
+
+# Znaki spodziewane w wynikach badań: litery (także polskie), cyfry, interpunkcja, jednostki
+_CLEAN_CHAR_RE = re.compile(r"[\w\s.,:;()\[\]<>=%/*+\-#'\"µμ°^&]", re.UNICODE)
+# Glify bez mapowania na Unicode - pdfminer zwraca je jako "(cid:123)"
+_CID_RE = re.compile(r"\(cid:\d+\)")
+
+
+def is_text_layer_usable(words):
+    """
+    Ocenia, czy warstwa tekstowa strony nadaje się do użycia zamiast OCR.
+    Odrzuca strony puste/zeskanowane oraz takie, w których fonty nie mają mapowania
+    na Unicode (tekst "(cid:..)", znaki zastępcze lub śmieci).
+    """
+    if len(words) < MIN_WORDS_PER_PAGE:
+        return False
+
+    text = "".join(w["text"] for w in words)
+    if not text:
+        return False
+
+    cid_chars = sum(len(match) for match in _CID_RE.findall(text))
+    if cid_chars > len(text) * (1 - MIN_CLEAN_CHAR_RATIO):
+        return False
+
+    if "�" in text:
+        return False
+
+    clean_chars = len(_CLEAN_CHAR_RE.findall(text))
+    return clean_chars / len(text) >= MIN_CLEAN_CHAR_RATIO
+
+
+def extract_text_layer(pdf_source):
+    """
+    Odczytuje tekst z warstwy tekstowej PDF (bez rasteryzacji i bez OCR).
+    Słowa z pozycjami są składane w wiersze tak samo jak wynik Google Vision.
+    Zwraca listę tekstów stron, gdzie None oznacza stronę wymagającą OCR
+    (skan, pusta lub nieczytelna warstwa tekstowa).
+    """
+    page_texts = []
+    with pdfplumber.open(pdf_source) as pdf:
+        for page in pdf.pages:
+            raw_words = page.extract_words(keep_blank_chars=False, use_text_flow=False)
+            page.flush_cache()  # Zwolnij obiekty strony - nie są już potrzebne
+
+            if not is_text_layer_usable(raw_words):
+                page_texts.append(None)
+                continue
+
+            words = [
+                {
+                    "text": w["text"],
+                    "y": (w["top"] + w["bottom"]) / 2 * POINTS_TO_PIXELS,
+                    "x": w["x0"] * POINTS_TO_PIXELS,
+                    "height": (w["bottom"] - w["top"]) * POINTS_TO_PIXELS,
+                }
+                for w in raw_words
+            ]
+            page_texts.append(words_to_lines(words))
+
+    return page_texts
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+
+# Znacznik końca strumienia w kolejkach między etapami
+_STOP = object()
+
+
+class Stage:
+    """
+    Pojedynczy etap potoku.
+    func(item) zwraca element przekazywany do kolejnego etapu albo None,
+    jeśli element jest już zakończony (np. trafienie w cache, pusty OCR).
+    Przy batch_size > 1 etap zbiera do batch_size elementów (czekając najwyżej batch_wait
+    sekund na kolejne) i wywołuje func(lista elementów), która zwraca listę wyników tej samej długości.
+    """
+    def __init__(self, name, func, workers=1, queue_size=4, batch_size=1, batch_wait=0.0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+
+def _next_batch(in_queue, stage):
+    """Pobiera kolejną porcję elementów; zwraca (porcja, czy napotkano koniec strumienia)."""
+    item = in_queue.get()
+    if item is _STOP:
+        return [], True
+
+    batch = [item]
+    deadline = time.monotonic() + stage.batch_wait
+    while len(batch) < stage.batch_size:
+        timeout = deadline - time.monotonic()
+        try:
+            item = in_queue.get(timeout=timeout) if timeout > 0 else in_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+class Pipeline:
+    """
+    Potok etapów połączonych ograniczonymi kolejkami.
+    Każdy etap ma własną pulę wątków, więc plik N+1 może być w OCR,
+    podczas gdy plik N czeka na odpowiedź AI. Pełna kolejka wstrzymuje
+    poprzedni etap (backpressure), więc w pamięci jest ograniczona liczba dokumentów.
+    """
+    def __init__(self, stages):
+        if not stages:
+            raise ValueError("Potok musi mieć co najmniej jeden etap.")
+        self.stages = stages
+
+    def run(self, items):
+        """
+        Przepuszcza elementy przez wszystkie etapy.
+        Zwraca generator par (item, error) w kolejności zakończenia;
+        error to wyjątek z etapu, w którym element odpadł, albo None.
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        results = queue.Queue()
+        threads = []
+
+        def feed():
+            for item in items:
+                queues[0].put(item)
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_STOP)
+
+        threads.append(threading.Thread(target=feed, name="pipeline-feed", daemon=True))
+
+        for index, stage in enumerate(self.stages):
+            is_last = index == len(self.stages) - 1
+            next_queue = None if is_last else queues[index + 1]
+            next_workers = 0 if is_last else self.stages[index + 1].workers
+            remaining = {"count": stage.workers}
+            lock = threading.Lock()
+
+            def work(stage=stage, in_queue=queues[index], next_queue=next_queue,
+                     next_workers=next_workers, remaining=remaining, lock=lock):
+                stopped = False
+                while not stopped:
+                    if stage.batch_size > 1:
+                        batch, stopped = _next_batch(in_queue, stage)
+                        if not batch:
+                            break
+                    else:
+                        item = in_queue.get()
+                        if item is _STOP:
+                            break
+                        batch = [item]
+
+                    try:
+                        outputs = stage.func(batch) if stage.batch_size > 1 else [stage.func(batch[0])]
+                    except Exception as e:
+                        print(f"❌ [POTOK] Błąd w etapie '{stage.name}': {e}")
+                        for item in batch:
+                            results.put((item, e))
+                        continue
+
+                    for item, output in zip(batch, outputs):
+                        if output is None or next_queue is None:
+                            results.put((output if output is not None else item, None))
+                        else:
+                            next_queue.put(output)
+
+                # Ostatni wątek etapu zamyka kolejkę następnego etapu
+                with lock:
+                    remaining["count"] -= 1
+                    last_worker = remaining["count"] == 0
+                if last_worker:
+                    if next_queue is None:
+                        results.put(_STOP)
+                    else:
+                        for _ in range(next_workers):
+                            next_queue.put(_STOP)
+
+            for worker_no in range(stage.workers):
+                threads.append(threading.Thread(target=work, name=f"pipeline-{stage.name}-{worker_no}", daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        while True:
+            result = results.get()
+            if result is _STOP:
+                break
+            yield result
+
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from google.genai import errors as genai_errors
+from rate_limiter import is_rate_limit_error, retry_after_seconds
+
+# Odpowiedzi API oznaczające, że cache dla tego promptu/modelu nie zadziała nigdy (np. prompt poniżej
+# minimalnej liczby tokenów, model bez obsługi cache) - inne błędy są przejściowe
+PERMANENT_ERROR_CODES = (400, 403, 404)
+PERMANENT_ERROR_MARKERS = ("too few tokens", "min_total_token_count", "minimum token", "not supported", "unsupported")
+
+
+class GeminiPromptCache:
+    """
+    Rejestr uchwytów cache kontekstu Gemini (client.caches) dla stałych instrukcji systemowych.
+    Instrukcje są wysyłane do API raz, a kolejne zapytania przekazują tylko nazwę cache
+    (cached_content) i tekst dokumentu. Uchwyty są zapisywane lokalnie (JSON), więc restart
+    serwera nie tworzy nowego cache, a TTL jest przedłużany, zanim cache wygaśnie.
+    Rejestr jest czytany z dysku raz (przy starcie) i zapisywany tylko po zmianie.
+    Przejściowy błąd API (429, 5xx, sieć) wyłącza cache tylko na okres przerwy (retry_backoff_seconds,
+    podwajany przy kolejnych błędach); na stałe - wyłącznie błąd typu "prompt za krótki / model bez cache".
+    """
+
+    def __init__(self, client, model, system_instruction, registry_path, ttl_seconds=3600, renew_margin_seconds=300,
+                 retry_backoff_seconds=60, max_retry_backoff_seconds=1800):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.registry_path = registry_path
+        self.ttl_seconds = ttl_seconds
+        self.renew_margin_seconds = renew_margin_seconds
+        self.key = hashlib.sha256(f"{model}\n{system_instruction}".encode("utf-8")).hexdigest()
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.max_retry_backoff_seconds = max_retry_backoff_seconds
+        self.disabled = False  # Np. prompt poniżej minimalnej liczby tokenów dla cache danego modelu
+        self.retry_at = 0.0  # Po przejściowym błędzie: do tej chwili zapytania idą bez cache
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._registry = self._load_registry()
+
+    def _load_registry(self):
+        try:
+            with open(self.registry_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_registry(self, registry):
+        os.makedirs(os.path.dirname(os.path.abspath(self.registry_path)), exist_ok=True)
+        tmp_path = self.registry_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(registry, f, indent=2)
+        os.replace(tmp_path, self.registry_path)
+
+    @staticmethod
+    def is_permanent_error(error):
+        """Czy błąd tworzenia cache wyklucza cache dla tego promptu/modelu na stałe."""
+        if is_rate_limit_error(error):
+            return False
+        if isinstance(error, genai_errors.ClientError) and error.code in PERMANENT_ERROR_CODES:
+            return True
+        message = str(error).lower()
+        return any(marker in message for marker in PERMANENT_ERROR_MARKERS)
+
+    def _back_off(self, error):
+        """Przejściowy błąd: przerwa w używaniu cache, potem kolejna próba."""
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(self.max_retry_backoff_seconds, self.retry_backoff_seconds * 2 ** self._failures)
+        self._failures += 1
+        self.retry_at = time.time() + delay
+        print(f"⚠️ Cache instrukcji chwilowo niedostępny ({error}) - ponowna próba za {delay:.0f}s.")
+
+    def _expire_at(self, cached_content):
+        expire_time = getattr(cached_content, "expire_time", None)
+        if expire_time is not None:
+            return expire_time.timestamp()
+        return time.time() + self.ttl_seconds
+
+    def get_name(self):
+        """Zwraca nazwę aktywnego cache (tworzy go lub przedłuża TTL) albo None, jeśli cache jest niedostępny."""
+        if self.disabled or time.time() < self.retry_at:
+            return None
+
+        with self._lock:
+            now = time.time()
+            # Usuń wpisy, które już wygasły (także dla starych wersji promptu)
+            registry = {key: entry for key, entry in self._registry.items() if entry["expire_at"] > now}
+            if len(registry) != len(self._registry):
+                self._set_registry(registry)
+            entry = registry.get(self.key)
+
+            if entry and entry["expire_at"] - now > self.renew_margin_seconds:
+                return entry["name"]
+
+            try:
+                if entry:
+                    # Cache jeszcze istnieje - wystarczy przedłużyć TTL
+                    cached = self.client.caches.update(name=entry["name"], config={"ttl": f"{self.ttl_seconds}s"})
+                    print(f"   [AI CACHE] Przedłużono cache instrukcji: {entry['name']}")
+                else:
+                    cached = self.client.caches.create(
+                        model=self.model,
+                        config={
+                            "system_instruction": self.system_instruction,
+                            "display_name": "morfolog-system-prompt",
+                            "ttl": f"{self.ttl_seconds}s",
+                        },
+                    )
+                    print(f"   [AI CACHE] Utworzono cache instrukcji: {cached.name}")
+            except Exception as e:
+                if entry:
+                    # Nieudane przedłużenie - przy następnym zapytaniu spróbujemy utworzyć nowy cache
+                    registry.pop(self.key, None)
+                    self._set_registry(registry)
+                    print(f"⚠️ Nie udało się przedłużyć cache instrukcji: {e}")
+                    return None
+                if not self.is_permanent_error(e):
+                    self._back_off(e)
+                    return None
+                self.disabled = True
+                print(f"⚠️ Cache kontekstu Gemini niedostępny ({e}) - instrukcje będą wysyłane jako system_instruction.")
+                return None
+
+            self._failures = 0
+            registry[self.key] = {"name": cached.name, "model": self.model, "expire_at": self._expire_at(cached)}
+            self._set_registry(registry)
+            return cached.name
+
+    def _set_registry(self, registry):
+        """Podmienia rejestr w pamięci i zapisuje go na dysk (wywoływane pod blokadą)."""
+        self._registry = registry
+        self._save_registry(registry)
+
+    def invalidate(self):
+        """Usuwa uchwyt z rejestru (np. gdy API nie znajduje już cache)."""
+        with self._lock:
+            if self.key in self._registry:
+                registry = dict(self._registry)
+                registry.pop(self.key)
+                self._set_registry(registry)
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class ProviderStats:
+    """
+    Ruchome statystyki dostawcy AI: czasy odpowiedzi i błędy z ostatnich `window` zapytań.
+    Po serii błędów (lub zbyt dużym udziale błędów) dostawca jest pomijany przez `cooldown_seconds`.
+    """
+
+    def __init__(self, window=50, cooldown_seconds=120, max_consecutive_failures=3,
+                 max_error_rate=0.5, min_samples=10):
+        self.cooldown_seconds = cooldown_seconds
+        self.max_consecutive_failures = max_consecutive_failures
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)  # Tylko udane zapytania
+        self.outcomes = deque(maxlen=window)  # True = sukces, False = błąd
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            error_rate = self.outcomes.count(False) / len(self.outcomes)
+            if self.consecutive_failures >= self.max_consecutive_failures or \
+                    (len(self.outcomes) >= self.min_samples and error_rate >= self.max_error_rate):
+                self.cooldown_until = time.monotonic() + self.cooldown_seconds
+                self.consecutive_failures = 0
+                self.outcomes.clear()  # Po przerwie dostawca zaczyna z czystą historią błędów
+
+    def is_available(self):
+        """False, jeśli dostawca jest w okresie przerwy po serii błędów."""
+        return time.monotonic() >= self.cooldown_until
+
+    def latency_percentile(self, percentile):
+        """Percentyl czasu odpowiedzi (s) albo None, jeśli próbek jest za mało."""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            return float(np.percentile(self.latencies, percentile))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "samples": len(self.latencies),
+                "error_rate": round(self.outcomes.count(False) / len(self.outcomes), 3) if self.outcomes else 0.0,
+                "p50_seconds": round(float(np.percentile(self.latencies, 50)), 3) if self.latencies else None,
+                "available": time.monotonic() >= self.cooldown_until,
+            }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_provider_stats(provider, **config):
+    """Zwraca współdzielone statystyki dostawcy (tworzone przy pierwszym użyciu)."""
+    with _stats_lock:
+        stats = _stats.get(provider)
+        if stats is None:
+            stats = ProviderStats(**config)
+            _stats[provider] = stats
+        return stats
@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Wiadro tokenów: pojemność `capacity`, uzupełniane równomiernie w tempie `refill_per_second`.
+    Pozwala wykorzystać limit "na minutę" w całości, zamiast sztywnego odstępu między zapytaniami.
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Ile sekund trzeba poczekać na `amount` tokenów (0 = dostępne od razu)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # Większe zapytanie i tak musi kiedyś przejść
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class ProviderRateLimiter:
+    """
+    Limiter jednego dostawcy AI: budżet zapytań (RPM) i tokenów (TPM) na minutę.
+    Wspólny dla wszystkich wątków procesu (potok w main.py, zadania i endpointy server.py).
+    Po sygnale 429 od dostawcy wszystkie wątki wstrzymują się do końca przerwy.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens=0):
+        """Blokuje do czasu, aż zapytanie zmieści się w budżecie RPM i TPM, po czym je rezerwuje."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(estimated_tokens, now),
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Wstrzymuje wszystkie zapytania do dostawcy na `seconds` sekund (np. po 429)."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider, requests_per_minute, tokens_per_minute):
+    """Zwraca współdzielony limiter dostawcy (tworzony przy pierwszym użyciu)."""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = ProviderRateLimiter(requests_per_minute, tokens_per_minute)
+            _limiters[provider] = limiter
+        return limiter
+
+
+def is_rate_limit_error(error):
+    """Rozpoznaje błąd limitu/quota (HTTP 429) z google-genai (APIError.code) i openai (status_code)."""
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    return getattr(error, "status", None) == "RESOURCE_EXHAUSTED"
+
+
+def retry_after_seconds(error):
+    """Czas oczekiwania sugerowany przez dostawcę (nagłówek Retry-After albo RetryInfo.retryDelay) lub None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []):
+            delay = str(detail.get("retryDelay", ""))
+            if delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    pass
+    return None
+
+
+def backoff_delay(attempt, base_seconds, max_seconds, retry_after=None):
+    """Wykładnicze opóźnienie z pełnym losowym rozrzutem (jitter), nie krótsze niż sugerowane przez dostawcę."""
+    if retry_after is not None:
+        # Rozrzut ponad sugerowany czas, aby wątki nie wróciły do dostawcy w tej samej chwili
+        return retry_after + random.uniform(0, base_seconds)
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
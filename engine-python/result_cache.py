@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+# Podbij, jeśli zmieni się format zapisywanych wpisów
+CACHE_FORMAT_VERSION = 1
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Liczy SHA-256 zawartości pliku (czytanie porcjami, bez ładowania całego pliku)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_sha256(content):
+    """Liczy SHA-256 dokumentu trzymanego w pamięci (przesłanego bezpośrednio do serwera)."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def pipeline_fingerprint(system_prompt, schema, model_name, ocr_backend, user_profile=None):
+    """
+    Odcisk konfiguracji potoku. Zmiana promptu, schematu, modelu, silnika OCR
+    albo profilu anonimizacji daje inny odcisk, a więc unieważnia stare wpisy.
+    Profil trafia do odcisku wyłącznie jako skrót - nie zapisujemy danych osobowych.
+    :param user_profile: Słownik profilu albo lista profili (anonimizacja wieloma profilami naraz).
+    """
+    profiles = user_profile if isinstance(user_profile, list) else [user_profile or {}]
+    payload = {
+        "format": CACHE_FORMAT_VERSION,
+        "system_prompt": system_prompt,
+        "schema": schema,
+        "model": model_name,
+        "ocr": ocr_backend,
+        "profile": sorted(sorted((k, v) for k, v in profile.items() if v) for profile in profiles),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Trwały cache wyników przetwarzania dokumentu (SQLite).
+    Klucz: SHA-256 bajtów pliku + odcisk konfiguracji potoku.
+    Wartość: teksty stron z OCR, tekst zanonimizowany i końcowy JSON (skompresowane zlib).
+    Rozmiar ograniczony przez max_bytes - najdawniej używane wpisy są usuwane (LRU).
+    """
+    def __init__(self, db_path, fingerprint, max_bytes=200 * 1024 * 1024):
+        self.db_path = db_path
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    doc_hash TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (doc_hash, fingerprint)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+
+        # Jawne unieważnienie: wpisy policzone przy innym prompcie/schemacie są bezużyteczne
+        removed = self.invalidate_stale()
+        if removed:
+            print(f"🗑️ [CACHE] Zmieniono konfigurację potoku - usunięto {removed} nieaktualnych wpisów.")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, doc_hash):
+        """Zwraca słownik {page_texts, anonymized_text, data} albo None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload FROM entries WHERE doc_hash = ? AND fingerprint = ?",
+                (doc_hash, self.fingerprint),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE doc_hash = ? AND fingerprint = ?",
+                (time.time(), doc_hash, self.fingerprint),
+            )
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, doc_hash, page_texts, anonymized_text, data):
+        """Zapisuje wynik dokumentu i w razie potrzeby zwalnia miejsce (LRU)."""
+        entry = {
+            "page_texts": page_texts,
+            "anonymized_text": anonymized_text,
+            "data": data,
+        }
+        payload = zlib.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_hash, self.fingerprint, payload, len(payload), now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT doc_hash, fingerprint, size FROM entries ORDER BY last_access ASC").fetchall()
+        for doc_hash, fingerprint, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE doc_hash = ? AND fingerprint = ?", (doc_hash, fingerprint))
+            total -= size
+
+    def invalidate(self, doc_hash=None):
+        """Usuwa wpis konkretnego dokumentu, a bez argumentu - cały cache."""
+        with self._lock, self._connect() as conn:
+            if doc_hash is None:
+                cursor = conn.execute("DELETE FROM entries")
+            else:
+                cursor = conn.execute("DELETE FROM entries WHERE doc_hash = ?", (doc_hash,))
+            return cursor.rowcount
+
+    def invalidate_stale(self):
+        """Usuwa wpisy policzone przy innej konfiguracji potoku niż bieżąca."""
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute("DELETE FROM entries WHERE fingerprint != ?", (self.fingerprint,))
+            return cursor.rowcount
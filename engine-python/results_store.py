@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Kolumny wiersza wyniku w formacie długim (jeden parametr jednego badania = jeden wiersz)
+RESULT_COLUMNS = ["date", "section", "parameter", "unit", "series_key", "value", "range_min", "range_max", "flag"]
+# Podbij przy zmianie sposobu zapisu wierszy - dokumenty zapisane starszą wersją zostaną zapisane ponownie
+ROWS_FORMAT_VERSION = 1
+
+
+class ResultsStore:
+    """
+    Trwały magazyn wyników badań w formacie długim (SQLite).
+    Wyniki dokumentu są dopisywane przy każdym przetworzeniu (ponowne przetworzenie
+    tego samego dokumentu zastępuje jego wiersze), a raporty i wykresy czytają
+    tylko potrzebne wycinki: wybrane parametry i zakres dat (indeksy po series_key i dacie).
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS lab_results (
+                    document_id TEXT NOT NULL,
+                    date TEXT,
+                    section TEXT NOT NULL,
+                    parameter TEXT NOT NULL,
+                    unit TEXT,
+                    series_key TEXT NOT NULL,
+                    value REAL,
+                    range_min REAL,
+                    range_max REAL,
+                    flag TEXT,
+                    ingested_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lab_results_series ON lab_results(series_key, date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lab_results_date ON lab_results(date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lab_results_document ON lab_results(document_id)")
+            # Dokumenty już zapisane (także te bez wyników) i wersja formatu ich wierszy
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    document_id TEXT PRIMARY KEY,
+                    rows_version INTEGER NOT NULL,
+                    ingested_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def replace_document(self, document_id, rows):
+        """Zapisuje wiersze wyników dokumentu (słowniki z kluczami RESULT_COLUMNS), zastępując poprzednie."""
+        now = time.time()
+        records = [
+            (document_id, *(row.get(column) for column in RESULT_COLUMNS), now)
+            for row in rows
+        ]
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM lab_results WHERE document_id = ?", (document_id,))
+            conn.executemany(
+                f"INSERT INTO lab_results (document_id, {', '.join(RESULT_COLUMNS)}, ingested_at) "
+                f"VALUES ({', '.join('?' * (len(RESULT_COLUMNS) + 2))})",
+                records,
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (document_id, rows_version, ingested_at) VALUES (?, ?, ?)",
+                (document_id, ROWS_FORMAT_VERSION, now),
+            )
+        return len(records)
+
+    def has_document(self, document_id):
+        """True, jeśli wiersze dokumentu są już zapisane w bieżącej wersji formatu."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT rows_version FROM documents WHERE document_id = ?", (document_id,)).fetchone()
+        return row is not None and row[0] == ROWS_FORMAT_VERSION
+
+    def _where(self, series_keys=None, parameters=None, date_from=None, date_to=None):
+        clauses, params = [], []
+        if series_keys:
+            clauses.append(f"series_key IN ({', '.join('?' * len(series_keys))})")
+            params.extend(series_keys)
+        if parameters:
+            clauses.append(f"parameter IN ({', '.join('?' * len(parameters))})")
+            params.extend(parameters)
+        if date_from:
+            clauses.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("date <= ?")
+            params.append(date_to)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, series_keys=None, parameters=None, date_from=None, date_to=None):
+        """
+        Zwraca listę wierszy (słowniki) posortowanych po serii i dacie.
+        Filtry: lista kluczy serii (np. "Morfologia krwi - Leukocyty [tys/ul]"), nazw parametrów
+        i zakres dat w formacie YYYY-MM-DD (włącznie).
+        """
+        where, params = self._where(series_keys, parameters, date_from, date_to)
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                f"SELECT document_id, {', '.join(RESULT_COLUMNS)} FROM lab_results{where} "
+                f"ORDER BY series_key, date, document_id",
+                params,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def read_frame(self, series_keys=None, parameters=None, date_from=None, date_to=None):
+        """To samo co query(), ale jako DataFrame w formacie długim."""
+        where, params = self._where(series_keys, parameters, date_from, date_to)
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                f"SELECT document_id, {', '.join(RESULT_COLUMNS)} FROM lab_results{where} ORDER BY date, document_id",
+                conn,
+                params=params,
+            )
+
+    def series_keys(self):
+        """Lista wszystkich serii (parametr + jednostka w sekcji) z liczbą pomiarów."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT series_key, COUNT(*) FROM lab_results GROUP BY series_key ORDER BY series_key"
+            ).fetchall()
+        return dict(rows)
+
+    def remove_document(self, document_id):
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM lab_results WHERE document_id = ?", (document_id,)).rowcount
@@ -1,11 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import os
+import re
+import json
+import time
+import queue
+import itertools
+import threading
 import uvicorn
-from main import process_single_file, GCP_KEY_PATH, USE_GOOGLE_VISION
-from google_vision_ocr import GoogleVisionOCR
-from analyzer import MedicalAnalyzer
+from python_multipart.multipart import MultipartParser, parse_options_header
+from main import process_single_file, process_items, process_uploads, document_timings, create_result_cache, create_results_store, create_vision_ocr, GCP_KEY_PATH, USE_GOOGLE_VISION
+from main import create_chart_renderer, load_report_frame, chart_parameters, create_analyzer, get_artifact_store, TRANSPORT_MODE
+from jobs import JobManager, JobQueueFullError
+from google_vision_ocr import PageOCRError
+from chart_renderer import shutdown_render_pool
+from trends import build_trends
+from metrics import REGISTRY
+
+# --- KONFIGURACJA ZADAŃ ---
+JOB_WORKERS = 2  # Ile plików przetwarzamy równolegle w tle
+JOB_MAX_PENDING_FILES = 200  # Powyżej tej liczby oczekujących plików POST /jobs zwraca 429
+TRENDS_DEFAULT_MAX_POINTS = 200  # Domyślna liczba punktów na serię w GET /trends (dłuższe historie są zmniejszane)
+
+CHART_NAME_PATTERN = re.compile(r"^[0-9a-f]{32}\.(png|svg)$")  # Nazwy plików wykresów (bez ścieżek)
+CHART_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024  # Limit rozmiaru jednego dokumentu w POST /analyze/upload (powyżej - 413)
+UPLOAD_FIELD_NAME = "files"  # Nazwa pola z plikami w żądaniu multipart/form-data
+UPLOAD_MAX_REQUEST_BYTES = 200 * 1024 * 1024  # Limit całego żądania multipart/form-data (wszystkie pliki razem)
+
+# Odpowiedź strumieniowa /analyze (?stream= albo nagłówek Accept): wynik każdego pliku zaraz po zakończeniu
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+STREAM_FORMAT_PATTERN = "^(ndjson|sse)$"
 
 app = FastAPI(title="Morfolog Analysis Service")
 
@@ -16,54 +45,115 @@ class AnalyzeRequest(BaseModel):
 # Zmienne globalne na instancje usług
 vision_ocr = None
 analyzer = None
+result_cache = None
+results_store = None
+chart_renderer = None
+job_manager = None
 
 @app.on_event("startup")
 async def startup_event():
-    global vision_ocr, analyzer
-    
+    global vision_ocr, analyzer, result_cache, results_store, chart_renderer, job_manager
+
     # Inicjalizacja ścieżek
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    
+
     # Inicjalizacja OCR
     if USE_GOOGLE_VISION:
         key_path = os.path.abspath(os.path.join(current_dir, GCP_KEY_PATH))
-        if os.path.exists(key_path):
+        if os.path.exists(key_path) or TRANSPORT_MODE == "replay":
             print(f"Inicjalizacja Google Vision z kluczem: {key_path}")
-            vision_ocr = GoogleVisionOCR(key_path, poppler_path=r'C:\poppler-25.12.0\Library\bin')
+            vision_ocr = create_vision_ocr(key_path)
         else:
             print(f"BŁĄD: Nie znaleziono klucza GCP: {key_path}")
-    
+
     # Inicjalizacja Analyzera
     print("Inicjalizacja MedicalAnalyzer...")
-    analyzer = MedicalAnalyzer()
+    analyzer = create_analyzer()
+    result_cache = create_result_cache(analyzer)
+    results_store = create_results_store()
+    chart_renderer = create_chart_renderer()
 
-@app.post("/analyze")
-async def analyze_files(request: AnalyzeRequest):
-    results = []
-    errors = []
+    # Pula wątków dla zadań w tle - przetwarzanie nie blokuje pętli zdarzeń
+    job_manager = JobManager(_process_path, max_workers=JOB_WORKERS, max_pending_files=JOB_MAX_PENDING_FILES)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if job_manager:
+        job_manager.shutdown()
+    shutdown_render_pool()
+    # Dokończ zapis artefaktów czekających w kolejce
+    artifact_store = get_artifact_store()
+    if artifact_store is not None:
+        artifact_store.close()
+
+def _process_path(path):
+    """Przetwarza jeden plik i zwraca słownik wyniku w formacie odpowiedzi /analyze."""
+    if not os.path.exists(path):
+        return {"file": path, "status": "error", "error": "File not found"}
+
+    try:
+        # Używamy funkcji z main.py
+        print(f"Przetwarzanie pliku: {path}")
+        result = process_single_file(path, vision_ocr, analyzer, result_cache, results_store)
 
-    for path in request.file_paths:
+        if result:
+            return {"file": path, "status": "success", "data": result}
+        return {"file": path, "status": "error", "error": "Analysis returned empty result"}
+
+    except Exception as e:
+        print(f"Błąd przy przetwarzaniu {path}: {str(e)}")
+        return dict(_error_entry(path, e), status="error")
+
+def _error_entry(path, error, timings=None):
+    """Wpis błędu dokumentu; przy błędzie OCR części stron także ich numery (od 1)."""
+    entry = {"file": path, "error": str(error)}
+    if isinstance(error, PageOCRError):
+        entry["failed_pages"] = [page + 1 for page in sorted(error.errors)]
+    if timings is not None:
+        entry["timings"] = timings
+    return entry
+
+def _split_paths(file_paths):
+    """Dzieli ścieżki na istniejące pliki i wpisy błędów dla brakujących."""
+    existing_paths = []
+    errors = []
+    for path in file_paths:
         if not os.path.exists(path):
             errors.append({"file": path, "error": "File not found"})
-            continue
-        
-        try:
-            # Używamy funkcji z main.py
-            print(f"Przetwarzanie pliku: {path}")
-            result = process_single_file(path, vision_ocr, analyzer)
-            
-            if result:
-                results.append({
-                    "file": path,
-                    "status": "success",
-                    "data": result
-                })
-            else:
-                errors.append({"file": path, "error": "Analysis returned empty result"})
-                
-        except Exception as e:
-            print(f"Błąd przy przetwarzaniu {path}: {str(e)}")
-            errors.append({"file": path, "error": str(e)})
+        else:
+            existing_paths.append(path)
+    return existing_paths, errors
+
+def _process_paths(existing_paths):
+    # Pliki przechodzą przez potok etapów (OCR kolejnego pliku w trakcie analizy AI poprzedniego)
+    return process_items(existing_paths, vision_ocr, analyzer, result_cache, results_store)
+
+def _analyze_paths(file_paths):
+    existing_paths, errors = _split_paths(file_paths)
+    return _collect_results(_process_paths(existing_paths), errors)
+
+def _analyze_uploads(uploads):
+    """Jak _analyze_paths, ale dla dokumentów przesłanych w treści żądania: pary (nazwa pliku, bajty)."""
+    processed = process_uploads(uploads, vision_ocr, analyzer, result_cache, results_store)
+    return _collect_results(processed, [])
+
+def _result_entry(item, error):
+    """Wpis odpowiedzi dla przetworzonego dokumentu: (True, wynik) albo (False, błąd)."""
+    path, data = item["file_path"], item["data"]
+    # Rozbicie czasu dokumentu na etapy (rasteryzacja, OCR, anonimizacja, AI, zapis)
+    timings = document_timings(item)
+    if error is not None:
+        print(f"Błąd przy przetwarzaniu {path}: {str(error)}")
+        return False, _error_entry(path, error, timings)
+    if data:
+        return True, {"file": path, "status": "success", "data": data, "timings": timings}
+    return False, {"file": path, "error": "Analysis returned empty result", "timings": timings}
+
+def _collect_results(processed, errors):
+    results = []
+    for item, error in processed:
+        success, entry = _result_entry(item, error)
+        (results if success else errors).append(entry)
 
     # Zwracamy raport zbiorczy
     return {
@@ -73,5 +163,265 @@ async def analyze_files(request: AnalyzeRequest):
         "errors": errors
     }
 
+def _stream_format(request: Request, stream):
+    """Format odpowiedzi strumieniowej z parametru ?stream= albo z nagłówka Accept; None = zwykły JSON."""
+    if stream:
+        return stream
+    accept = request.headers.get("accept", "")
+    for stream_format, media_type in STREAM_MEDIA_TYPES.items():
+        if media_type in accept:
+            return stream_format
+    return None
+
+def _encode_event(stream_format, event, payload, event_id):
+    if stream_format == "sse":
+        return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+    return (json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _stream_results(processed, errors, stream_format):
+    """
+    Zdarzenia odpowiedzi strumieniowej: "result" albo "error" dla każdego pliku zaraz po jego zakończeniu,
+    na końcu "summary" z licznikami. Potok działa we własnym wątku - rozłączenie klienta nie przerywa
+    przetwarzania, a wyniki i tak trafiają do magazynu.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            for item, error in processed:
+                events.put(_result_entry(item, error))
+        except Exception as e:
+            print(f"❌ Błąd odpowiedzi strumieniowej: {e}")
+            events.put((False, {"file": None, "error": str(e)}))
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run, name="analyze-stream", daemon=True).start()
+
+    started = time.perf_counter()
+    counts = {True: 0, False: 0}
+    event_ids = itertools.count(1)
+    for entry in errors:
+        counts[False] += 1
+        yield _encode_event(stream_format, "error", entry, next(event_ids))
+
+    while (event := events.get()) is not None:
+        success, entry = event
+        counts[success] += 1
+        yield _encode_event(stream_format, "result" if success else "error", entry, next(event_ids))
+
+    summary = {"processed_count": counts[True], "error_count": counts[False],
+               "total_seconds": round(time.perf_counter() - started, 4)}
+    yield _encode_event(stream_format, "summary", summary, next(event_ids))
+
+def _streaming_response(processed, errors, stream_format):
+    return StreamingResponse(
+        _stream_results(processed, errors, stream_format),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        # Bez buforowania po drodze (proxy), inaczej zdarzenia dotrą dopiero na końcu
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/analyze")
+async def analyze_files(request: AnalyzeRequest, http_request: Request,
+                        stream: Optional[str] = Query(None, pattern=STREAM_FORMAT_PATTERN)):
+    """
+    Analiza plików wskazanych ścieżkami. Domyślnie jeden raport JSON po przetworzeniu wszystkich plików;
+    ?stream=ndjson|sse (lub Accept: application/x-ndjson / text/event-stream) - wynik każdego pliku osobno, zaraz po zakończeniu.
+    """
+    stream_format = _stream_format(http_request, stream)
+    if stream_format:
+        existing_paths, errors = _split_paths(request.file_paths)
+        return _streaming_response(_process_paths(existing_paths), errors, stream_format)
+
+    # Synchroniczne przetwarzanie w puli wątków, aby nie blokować innych klientów
+    return await run_in_threadpool(_analyze_paths, request.file_paths)
+
+def _check_upload_size(size, filename):
+    if size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large: {filename} (limit {UPLOAD_MAX_BYTES} bytes)")
+
+def _check_content_length(request: Request, limit):
+    """Odrzuca żądanie na podstawie nagłówka Content-Length, zanim zostanie odczytany choćby bajt treści."""
+    try:
+        length = int(request.headers.get("content-length", ""))
+    except ValueError:
+        return  # Brak nagłówka (chunked) - limit pilnowany w trakcie odczytu
+    if length > limit:
+        raise HTTPException(status_code=413, detail=f"Request too large (limit {limit} bytes)")
+
+async def _read_body(request: Request, filename):
+    """Czyta treść żądania porcjami, przerywając po przekroczeniu limitu rozmiaru."""
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        _check_upload_size(size, filename)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def _read_multipart_uploads(request: Request):
+    """
+    Czyta pliki z pola UPLOAD_FIELD_NAME żądania multipart/form-data porcjami, prosto z gniazda.
+    Część przekraczająca UPLOAD_MAX_BYTES (albo całe żądanie ponad UPLOAD_MAX_REQUEST_BYTES) przerywa
+    odczyt od razu - bez buforowania całej części na dysku, jak robi to request.form().
+    Zwraca listę (nazwa pliku, bajty).
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Missing multipart boundary")
+
+    uploads = []
+    part = {}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, field=b"", value=b"", filename=None, chunks=[], size=0)
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"], part["value"] = b"", b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        # Pola tekstowe i inne pola niż UPLOAD_FIELD_NAME są pomijane
+        if disposition.get(b"name") == UPLOAD_FIELD_NAME.encode() and b"filename" in disposition:
+            part["filename"] = disposition[b"filename"].decode("utf-8", errors="replace")
+
+    def on_part_data(data, start, end):
+        if part["filename"] is None:
+            return
+        part["size"] += end - start
+        _check_upload_size(part["size"], part["filename"])
+        part["chunks"].append(data[start:end])
+
+    def on_part_end():
+        if part["filename"] is not None:
+            uploads.append((part["filename"], b"".join(part["chunks"])))
+
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end,
+    })
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > UPLOAD_MAX_REQUEST_BYTES:
+            raise HTTPException(status_code=413, detail=f"Request too large (limit {UPLOAD_MAX_REQUEST_BYTES} bytes)")
+        parser.write(chunk)
+    parser.finalize()
+    return uploads
+
+@app.post("/analyze/upload")
+async def analyze_uploaded_files(request: Request, filename: Optional[str] = Query(None),
+                                 stream: Optional[str] = Query(None, pattern=STREAM_FORMAT_PATTERN)):
+    """
+    Analiza dokumentów przesłanych w treści żądania - bez wspólnego katalogu z backendem.
+    multipart/form-data: pliki w polu "files" (nazwa pliku z nagłówka części);
+    inny Content-Type (np. application/pdf): treść żądania to jeden dokument, nazwa w parametrze ?filename=.
+    Odpowiedź ma format /analyze (także strumieniowy), a pole "file" zawiera nazwę przesłanego pliku.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        _check_content_length(request, UPLOAD_MAX_REQUEST_BYTES)
+        uploads = await _read_multipart_uploads(request)
+        if not uploads:
+            raise HTTPException(status_code=400, detail=f"No files in form field '{UPLOAD_FIELD_NAME}'")
+    else:
+        if not filename:
+            raise HTTPException(status_code=400, detail="Query parameter 'filename' is required for a raw request body")
+        _check_content_length(request, UPLOAD_MAX_BYTES)
+        body = await _read_body(request, filename)
+        if not body:
+            raise HTTPException(status_code=400, detail="Empty request body")
+        uploads = [(filename, body)]
+
+    stream_format = _stream_format(request, stream)
+    if stream_format:
+        processed = process_uploads(uploads, vision_ocr, analyzer, result_cache, results_store)
+        return _streaming_response(processed, [], stream_format)
+
+    return await run_in_threadpool(_analyze_uploads, uploads)
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: AnalyzeRequest):
+    """Przyjmuje listę ścieżek i natychmiast zwraca identyfikator zadania."""
+    if not request.file_paths:
+        raise HTTPException(status_code=400, detail="file_paths must not be empty")
+    try:
+        job_id = job_manager.submit(request.file_paths)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Zwraca stan zadania oraz wyniki plików, które już zostały przetworzone."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/trends")
+async def get_trends(
+    series: Optional[List[str]] = Query(None, description="Klucze serii, np. 'Morfologia krwi - Leukocyty [tys/ul]' (domyślnie wszystkie)"),
+    date_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    max_points: int = Query(TRENDS_DEFAULT_MAX_POINTS, ge=3, le=5000),
+):
+    """Zwraca gotowe, znormalizowane serie czasowe parametrów z magazynu wyników."""
+    if results_store is None:
+        raise HTTPException(status_code=503, detail="Results store is disabled")
+    return await run_in_threadpool(build_trends, results_store, series, date_from, date_to, max_points)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metryki w formacie tekstowym Prometheus: czasy etapów, błędy, przełączenia, ponowienia, wysłane bajty."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _render_charts(series, date_from, date_to):
+    df = load_report_frame(results_store, series_keys=series, date_from=date_from, date_to=date_to)
+    if df is None:
+        return {"charts": []}
+    charts = chart_renderer.render(df, chart_parameters(df))
+    return {
+        "charts": [
+            {"series_key": param, "url": f"/charts/{name}"}
+            for param, name in charts.items()
+        ]
+    }
+
+@app.get("/charts")
+async def get_charts(
+    series: Optional[List[str]] = Query(None, description="Klucze serii (domyślnie wszystkie)"),
+    date_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+):
+    """Renderuje (lub bierze z cache) wykresy parametrów i zwraca adresy obrazów."""
+    if results_store is None:
+        raise HTTPException(status_code=503, detail="Results store is disabled")
+    return await run_in_threadpool(_render_charts, series, date_from, date_to)
+
+@app.get("/charts/{chart_name}")
+async def get_chart_image(chart_name: str):
+    """Zwraca wyrenderowany obraz wykresu. Nazwa zależy od danych, więc obraz można cache'ować bez końca."""
+    match = CHART_NAME_PATTERN.match(chart_name)
+    path = chart_renderer.path_for(chart_name) if match else None
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Chart not found")
+    return FileResponse(
+        path,
+        media_type=CHART_MEDIA_TYPES[match.group(1)],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8088)
@@ -0,0 +1,72 @@
+import unittest
+import json
+import os
+import sys
+import time
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+from main import _new_pipeline_item
+
+RESULT = {"meta": {"date_examination": "2025-12-31"}, "examinations": []}
+
+
+def fake_process_items(file_paths, *args):
+    """Zastępuje potok: pierwszy plik kończy się wynikiem, drugi błędem etapu."""
+    for index, path in enumerate(file_paths):
+        item = _new_pipeline_item(path)
+        if index == 0:
+            item["data"] = RESULT
+            yield item, None
+        else:
+            time.sleep(0.01)
+            yield item, ValueError("zepsuty plik")
+
+
+class TestAnalyzeStream(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(server, "process_items", fake_process_items)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(server.app)
+        self.paths = [os.path.abspath(__file__), os.path.join(os.path.dirname(__file__), "test_pipeline.py")]
+
+    def test_ndjson_event_per_file_and_summary(self):
+        response = self.client.post("/analyze", params={"stream": "ndjson"},
+                                    json={"file_paths": ["brak.pdf"] + self.paths})
+
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        events = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([event["event"] for event in events], ["error", "result", "error", "summary"])
+        self.assertEqual(events[0]["error"], "File not found")
+        self.assertEqual(events[1]["file"], self.paths[0])
+        self.assertEqual(events[1]["data"], RESULT)
+        self.assertIn("timings", events[1])
+        self.assertEqual(events[2]["error"], "zepsuty plik")
+        self.assertEqual(events[3]["processed_count"], 1)
+        self.assertEqual(events[3]["error_count"], 2)
+
+    def test_sse_selected_by_accept_header(self):
+        response = self.client.post("/analyze", json={"file_paths": self.paths[:1]},
+                                    headers={"Accept": "text/event-stream"})
+
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        blocks = [block.split("\n") for block in response.text.strip().split("\n\n")]
+        self.assertEqual([block[1] for block in blocks], ["event: result", "event: summary"])
+        self.assertEqual(json.loads(blocks[0][2][len("data: "):])["data"], RESULT)
+
+    def test_plain_json_by_default(self):
+        response = self.client.post("/analyze", json={"file_paths": self.paths})
+
+        report = response.json()
+        self.assertEqual(report["processed_count"], 1)
+        self.assertEqual(report["error_count"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import export_json_result
+from artifact_store import (SqliteArtifactStore, FileArtifactStore,
+                            ARTIFACT_RAW_OCR, ARTIFACT_CLEANED, ARTIFACT_RESULT)
+
+DOC_ID = "ab" + "0" * 62
+RESULT = {"meta": {"date_examination": "2025-12-31"}, "examinations": [{"name": "Leukocyty", "value": 5.53}]}
+
+
+class TestArtifactStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _stores(self, **kwargs):
+        return [
+            SqliteArtifactStore(os.path.join(self.tmp_dir.name, "artifacts.sqlite"), **kwargs),
+            FileArtifactStore(os.path.join(self.tmp_dir.name, "artifacts"), **kwargs),
+        ]
+
+    def test_artifacts_readable_by_document_id_after_restart(self):
+        for store in self._stores(batch_size=2, flush_interval=0.01):
+            store.put_text(DOC_ID, ARTIFACT_RAW_OCR, "wyniki.pdf", "Leukocyty 5,53")
+            store.put_json(DOC_ID, ARTIFACT_RESULT, "wyniki.pdf", RESULT)
+            # Zakolejkowany artefakt jest widoczny od razu, jeszcze przed zapisem
+            self.assertEqual(store.get_json(DOC_ID, ARTIFACT_RESULT), RESULT)
+            store.close()
+
+            reopened = type(store)(store.db_path if hasattr(store, "db_path") else store.root_dir)
+            self.assertEqual(reopened.get_text(DOC_ID, ARTIFACT_RAW_OCR), "Leukocyty 5,53")
+            self.assertEqual(reopened.get_json(DOC_ID, ARTIFACT_RESULT), RESULT)
+            self.assertIsNone(reopened.get(DOC_ID, ARTIFACT_CLEANED))
+            reopened.close()
+
+    def test_intermediate_artifacts_can_be_skipped(self):
+        for store in self._stores(save_intermediate=False):
+            store.put_text(DOC_ID, ARTIFACT_CLEANED, "wyniki.pdf", "[PACJENT]")
+            store.put_json(DOC_ID, ARTIFACT_RESULT, "wyniki.pdf", RESULT)
+            store.flush()
+
+            self.assertIsNone(store.get(DOC_ID, ARTIFACT_CLEANED))
+            self.assertEqual(store.get_json(DOC_ID, ARTIFACT_RESULT), RESULT)
+            store.close()
+
+    def test_export_writes_result_by_file_name(self):
+        store = SqliteArtifactStore(os.path.join(self.tmp_dir.name, "artifacts.sqlite"))
+        store.put_json(DOC_ID, ARTIFACT_RESULT, "wyniki.pdf", RESULT)
+        export_dir = os.path.join(self.tmp_dir.name, "json_results")
+
+        path = export_json_result("/uploads/wyniki-31_12_25.pdf", store.get_json(DOC_ID, ARTIFACT_RESULT), export_dir)
+        store.close()
+
+        self.assertEqual(path, os.path.join(export_dir, "wyniki-31_12_25.json"))
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), RESULT)
+
+
+if __name__ == '__main__':
+    unittest.main()
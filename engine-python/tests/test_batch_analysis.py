@@ -0,0 +1,80 @@
+import unittest
+import json
+import os
+import re
+import sys
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import provider_health
+import rate_limiter
+from analyzer import MedicalAnalyzer, BATCH_REPORT_SCHEMA
+
+
+def report(date):
+    return {"meta": {"date_examination": date}, "examinations": []}
+
+
+class TestBatchAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [mock.patch.dict(provider_health._stats, clear=True),
+                    mock.patch.dict(rate_limiter._limiters, clear=True)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.analyzer = MedicalAnalyzer.__new__(MedicalAnalyzer)
+        self.analyzer.system_prompt = "instrukcje"
+        self.analyzer._query_xai = mock.Mock(side_effect=RuntimeError("xAI wyłączone w teście"))
+        self.calls = []
+
+    def test_results_split_per_document(self):
+        """Jedno zapytanie dla porcji; brakujący w odpowiedzi dokument jest analizowany osobno."""
+        def fake_gemini(text, response_schema=None):
+            self.calls.append(response_schema)
+            if response_schema is BATCH_REPORT_SCHEMA:
+                ids = re.findall(r"=== DOKUMENT (\S+) ===", text)
+                # Model "gubi" ostatni dokument
+                return json.dumps({"documents": [{"document_id": i, "report": report(f"2025-01-0{i[-1]}")} for i in ids[:-1]]})
+            return json.dumps(report("2025-02-01"))
+
+        self.analyzer._query_gemini = fake_gemini
+        document_timings = {"doc-1": [], "doc-2": [], "doc-3": []}
+        results = self.analyzer.analyze_batch({"doc-1": "A" * 10, "doc-2": "B" * 10, "doc-3": "C" * 10},
+                                              document_timings=document_timings)
+
+        self.assertEqual(results["doc-1"]["meta"]["date_examination"], "2025-01-01")
+        self.assertEqual(results["doc-2"]["meta"]["date_examination"], "2025-01-02")
+        self.assertEqual(results["doc-3"]["meta"]["date_examination"], "2025-02-01")
+        self.assertEqual(self.calls, [BATCH_REPORT_SCHEMA, None])
+
+        # Czas zapytania wsadowego jest wspólny; dokument z analizy pojedynczej ma tylko własne czasy
+        for doc_id in ("doc-1", "doc-2"):
+            self.assertTrue(document_timings[doc_id])
+            self.assertTrue(all(entry["shared"] and entry["batch_size"] == 3 for entry in document_timings[doc_id]))
+        self.assertTrue(document_timings["doc-3"])
+        self.assertFalse(any(entry.get("shared") for entry in document_timings["doc-3"]))
+
+    def test_failed_batch_falls_back_to_single_calls(self):
+        def fake_gemini(text, response_schema=None):
+            if response_schema is BATCH_REPORT_SCHEMA:
+                raise RuntimeError("odpowiedź ucięta")
+            return json.dumps(report("2025-03-01"))
+
+        self.analyzer._query_gemini = fake_gemini
+        results = self.analyzer.analyze_batch({"doc-1": "A", "doc-2": "B"})
+
+        self.assertEqual(set(results), {"doc-1", "doc-2"})
+        self.assertTrue(all(data is not None for data in results.values()))
+
+    def test_token_budget_splits_batches(self):
+        self.analyzer.BATCH_MAX_TOKENS = 100
+        batches = self.analyzer._pack_batches({"a": "x" * 150, "b": "x" * 150, "c": "x" * 600})
+
+        self.assertEqual(batches, [["a", "b"], ["c"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart_renderer
+from chart_renderer import ChartRenderer
+
+
+class TestChartRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.renderer = ChartRenderer(self.tmp_dir.name, workers=2)
+        self.df = pd.DataFrame({
+            "Date": pd.to_datetime(["2025-01-10", "2025-06-10", "2025-12-31"]),
+            "Morfologia krwi - Leukocyty [tys/ul]": [5.1, 11.2, 6.0],
+            "Morfologia krwi - Leukocyty [tys/ul]_flag": [None, "H", None],
+            "Morfologia krwi - Leukocyty [tys/ul]_min": [4.0, 4.0, 4.0],
+            "Morfologia krwi - Leukocyty [tys/ul]_max": [10.0, 10.0, 10.0],
+            "Morfologia krwi - Hemoglobina [g/dl]": [13.5, 12.9, 14.1],
+        })
+        self.parameters = ["Morfologia krwi - Leukocyty [tys/ul]", "Morfologia krwi - Hemoglobina [g/dl]"]
+
+    def tearDown(self):
+        chart_renderer.shutdown_render_pool()
+        self.tmp_dir.cleanup()
+
+    def test_renders_one_image_per_parameter(self):
+        charts = self.renderer.render(self.df, self.parameters)
+
+        self.assertEqual(set(charts), set(self.parameters))
+        for name in charts.values():
+            with open(self.renderer.path_for(name), "rb") as f:
+                self.assertEqual(f.read(8), b"\x89PNG\r\n\x1a\n")
+
+    def test_only_changed_parameters_are_rerendered(self):
+        first = self.renderer.render(self.df, self.parameters)
+        mtimes = {param: os.stat(self.renderer.path_for(name)).st_mtime_ns for param, name in first.items()}
+
+        self.df.loc[2, "Morfologia krwi - Hemoglobina [g/dl]"] = 11.0
+        second = self.renderer.render(self.df, self.parameters)
+
+        leukocytes = "Morfologia krwi - Leukocyty [tys/ul]"
+        hemoglobin = "Morfologia krwi - Hemoglobina [g/dl]"
+        self.assertEqual(first[leukocytes], second[leukocytes])
+        self.assertEqual(os.stat(self.renderer.path_for(second[leukocytes])).st_mtime_ns, mtimes[leukocytes])
+        self.assertNotEqual(first[hemoglobin], second[hemoglobin])
+        self.assertTrue(os.path.exists(self.renderer.path_for(second[hemoglobin])))
+
+    def test_pool_is_shared_between_renders(self):
+        self.renderer.render(self.df, self.parameters)
+        pool = chart_renderer._render_pool
+        self.assertIsNotNone(pool)
+
+        self.df.loc[2, "Morfologia krwi - Hemoglobina [g/dl]"] = 11.0
+        self.df.loc[2, "Morfologia krwi - Leukocyty [tys/ul]"] = 7.0
+        self.renderer.render(self.df, self.parameters)
+        self.assertIs(chart_renderer._render_pool, pool)
+
+        chart_renderer.shutdown_render_pool()
+        self.assertIsNone(chart_renderer._render_pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
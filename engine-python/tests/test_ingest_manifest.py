@@ -0,0 +1,161 @@
+import unittest
+import io
+import json
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from unittest import mock
+
+import matplotlib
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest_manifest
+import main
+from artifact_store import SqliteArtifactStore
+from ingest_manifest import IngestManifest
+from result_cache import ResultCache, file_sha256
+from results_store import ResultsStore
+
+RESULT = {"meta": {"date_examination": "2025-12-31"},
+          "examinations": [{"examination_name": "Glukoza", "code_icd": "L43",
+                            "results": [{"name": "Glukoza", "value": 92, "unit": "mg/dl",
+                                         "range_min": 70, "range_max": 99, "flag": None}]}]}
+
+
+def write_text_layer_pdf(path, line):
+    """PDF z warstwą tekstową - potok odczytuje go bez OCR."""
+    with matplotlib.rc_context({"pdf.fonttype": 42}), PdfPages(path) as pdf:
+        fig = Figure(figsize=(8.27, 11.69))
+        fig.text(0.07, 0.9, line, fontsize=9)
+        pdf.savefig(fig)
+
+
+class TestIngestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manifest_path = os.path.join(self.tmp_dir.name, "manifest.json")
+        self.pdf_path = os.path.join(self.tmp_dir.name, "wyniki.pdf")
+        self.json_path = os.path.join(self.tmp_dir.name, "wyniki.json")
+        with open(self.pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4 wyniki")
+        with open(self.json_path, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"date_examination": "2025-12-31"}, "examinations": []}, f)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _process(self, manifest):
+        manifest.mark_pending(self.pdf_path)
+        manifest.mark_done(self.pdf_path, self.json_path)
+        manifest.flush()
+
+    def test_unchanged_file_is_skipped_after_restart(self):
+        self._process(IngestManifest(self.manifest_path, "v1"))
+
+        manifest = IngestManifest(self.manifest_path, "v1")
+        self.assertTrue(manifest.is_unchanged(self.pdf_path))
+        self.assertEqual(manifest.load_result(self.pdf_path)["meta"]["date_examination"], "2025-12-31")
+
+    def test_touched_file_with_same_content_is_unchanged(self):
+        manifest = IngestManifest(self.manifest_path, "v1")
+        self._process(manifest)
+
+        stat = os.stat(self.pdf_path)
+        os.utime(self.pdf_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertTrue(manifest.is_unchanged(self.pdf_path))
+
+        with open(self.pdf_path, "ab") as f:
+            f.write(b" poprawka")
+        self.assertFalse(manifest.is_unchanged(self.pdf_path))
+
+    def test_pipeline_version_change_reprocesses(self):
+        self._process(IngestManifest(self.manifest_path, "v1"))
+        self.assertFalse(IngestManifest(self.manifest_path, "v2").is_unchanged(self.pdf_path))
+
+    def test_interrupted_file_stays_pending(self):
+        manifest = IngestManifest(self.manifest_path, "v1", flush_every=1)
+        manifest.mark_pending(self.pdf_path)
+
+        manifest = IngestManifest(self.manifest_path, "v1")
+        self.assertFalse(manifest.is_unchanged(self.pdf_path))
+        self.assertEqual(manifest.pending_files(), [os.path.abspath(self.pdf_path)])
+
+    def test_changes_are_written_in_batches(self):
+        manifest = IngestManifest(self.manifest_path, "v1", flush_every=3)
+        manifest.mark_pending(self.pdf_path)
+        manifest.mark_done(self.pdf_path, self.json_path)
+        self.assertFalse(os.path.exists(self.manifest_path))
+
+        manifest.mark_failed(self.pdf_path, "błąd")  # Trzecia zmiana - zapis porcji
+        self.assertEqual(IngestManifest(self.manifest_path, "v1").entries[os.path.abspath(self.pdf_path)]["status"], "failed")
+
+        manifest.mark_done(self.pdf_path, self.json_path)
+        manifest.flush()
+        self.assertTrue(IngestManifest(self.manifest_path, "v1").is_unchanged(self.pdf_path))
+
+
+class TestIngestFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.paths = []
+        for index in range(3):
+            path = os.path.join(self.tmp_dir.name, f"wyniki-{index}.pdf")
+            write_text_layer_pdf(path, f"Glukoza {90 + index} mg/dl 70 - 99")
+            self.paths.append(path)
+
+        self.artifact_store = SqliteArtifactStore(os.path.join(self.tmp_dir.name, "artifacts.sqlite"))
+        self.addCleanup(self.artifact_store.close)
+        self.results_store = ResultsStore(os.path.join(self.tmp_dir.name, "results.sqlite"))
+        self.result_cache = ResultCache(os.path.join(self.tmp_dir.name, "cache.sqlite"), "v1")
+        self.manifest_path = os.path.join(self.tmp_dir.name, "manifest.json")
+        self.analyzer = mock.Mock()
+        self.analyzer.analyze_text.return_value = RESULT
+        patchers = [
+            mock.patch.object(main, "LOCAL_PARSER_ENABLED", False),
+            mock.patch.object(main, "USE_GOOGLE_VISION", False),
+            mock.patch.object(main, "get_artifact_store", lambda: self.artifact_store),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _ingest(self):
+        """Jedno uruchomienie: nowy manifest wczytany z dysku, jak w kolejnym wywołaniu main()."""
+        manifest = IngestManifest(self.manifest_path, "v1")
+        with redirect_stdout(io.StringIO()):
+            results = list(main.ingest_files(self.paths, manifest, None, self.analyzer, self.result_cache, self.results_store))
+        self.artifact_store.flush()
+        return results
+
+    def test_new_files_are_hashed_once(self):
+        counted = mock.Mock(side_effect=file_sha256)
+        with mock.patch.object(ingest_manifest, "file_sha256", counted), mock.patch.object(main, "file_sha256", counted):
+            results = self._ingest()
+
+        self.assertTrue(all(data == RESULT and error is None for _, data, error in results))
+        self.assertEqual(counted.call_count, len(self.paths))
+
+    def test_second_run_does_not_read_unchanged_files(self):
+        self._ingest()
+        self.assertEqual(self.analyzer.analyze_text.call_count, len(self.paths))
+
+        failing = mock.Mock(side_effect=AssertionError("plik bez zmian nie powinien być czytany"))
+        with mock.patch.object(ingest_manifest, "file_sha256", failing), mock.patch.object(main, "file_sha256", failing), \
+                mock.patch.object(main, "extract_text_layer", failing), \
+                mock.patch.object(self.results_store, "replace_document", failing):
+            results = self._ingest()
+
+        self.assertEqual([data for _, data, _ in results], [RESULT] * len(self.paths))
+        self.assertEqual(self.analyzer.analyze_text.call_count, len(self.paths))
+        self.assertEqual(len(self.results_store.query()), len(self.paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
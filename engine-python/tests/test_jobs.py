@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+from jobs import JobManager, JobQueueFullError
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class GatedProcess:
+    """Funkcja przetwarzania pliku, która czeka na zwolnienie bramki danego pliku."""
+    def __init__(self):
+        self.gates = {}
+
+    def release(self, path):
+        self.gates.setdefault(path, threading.Event()).set()
+
+    def release_all(self):
+        for gate in list(self.gates.values()):
+            gate.set()
+
+    def __call__(self, path):
+        self.gates.setdefault(path, threading.Event()).wait(5)
+        if path.endswith("zepsuty.pdf"):
+            raise ValueError("uszkodzony PDF")
+        return {"file": path, "status": "success", "data": {"meta": {}, "examinations": []}}
+
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self):
+        self.process = GatedProcess()
+        self.manager = JobManager(self.process, max_workers=2, max_pending_files=3, max_finished_jobs=1)
+        self.addCleanup(self.manager.shutdown)
+        self.addCleanup(self.process.release_all)
+
+    def test_progress_and_completion(self):
+        job_id = self.manager.submit(["a.pdf", "zepsuty.pdf", "a.pdf"])
+        self.assertEqual(self.manager.get(job_id)["total_count"], 2)
+
+        self.process.release("a.pdf")
+        self.assertTrue(wait_for(lambda: self.manager.get(job_id)["processed_count"] == 1))
+        job = self.manager.get(job_id)
+        self.assertEqual(job["status"], "running")
+        self.assertIsNone(job["finished_at"])
+
+        self.process.release("zepsuty.pdf")
+        self.assertTrue(wait_for(lambda: self.manager.get(job_id)["status"] == "completed"))
+        job = self.manager.get(job_id)
+        self.assertEqual(job["error_count"], 1)
+        self.assertEqual(job["files"][1], {"file": "zepsuty.pdf", "status": "error", "error": "uszkodzony PDF"})
+        self.assertIsNotNone(job["finished_at"])
+
+    def test_empty_job_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.manager.submit([])
+
+    def test_queue_limit(self):
+        self.manager.submit(["a.pdf", "b.pdf"])
+        with self.assertRaises(JobQueueFullError):
+            self.manager.submit(["c.pdf", "d.pdf"])
+
+    def test_finished_jobs_are_pruned(self):
+        for path in ("a.pdf", "b.pdf", "c.pdf"):
+            self.process.release(path)
+        first = self.manager.submit(["a.pdf"])
+        self.assertTrue(wait_for(lambda: self.manager.get(first)["status"] == "completed"))
+        second = self.manager.submit(["b.pdf"])
+        self.assertTrue(wait_for(lambda: self.manager.get(second)["status"] == "completed"))
+
+        # Nowe zadanie usuwa najstarsze zakończone ponad limit max_finished_jobs=1
+        third = self.manager.submit(["c.pdf"])
+        self.assertIsNone(self.manager.get(first))
+        self.assertIsNotNone(self.manager.get(second))
+        self.assertIsNotNone(self.manager.get(third))
+
+
+class TestJobEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.process = GatedProcess()
+        manager = JobManager(self.process, max_workers=2)
+        self.addCleanup(manager.shutdown)
+        self.addCleanup(self.process.release_all)
+        patcher = mock.patch.object(server, "job_manager", manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(server.app)
+
+    def test_submit_and_poll(self):
+        response = self.client.post("/jobs", json={"file_paths": ["a.pdf", "zepsuty.pdf"]})
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()["status_url"]
+
+        self.assertEqual(self.client.get(status_url).json()["processed_count"], 0)
+        self.process.release("a.pdf")
+        self.process.release("zepsuty.pdf")
+        self.assertTrue(wait_for(lambda: self.client.get(status_url).json()["status"] == "completed"))
+        job = self.client.get(status_url).json()
+        self.assertEqual((job["processed_count"], job["error_count"]), (1, 1))
+
+    def test_empty_file_list_is_rejected(self):
+        response = self.client.post("/jobs", json={"file_paths": []})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get("/jobs/brak").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,7 +14,7 @@ class TestJsonComparison(unittest.TestCase):
         # Zakładamy, że main.py przetworzył 'sample_ocr.pdf' i zapisał 'sample_ocr.json'
         self.filename = "wyniki-31_12_25_morfologia.json"
         
-        # Ścieżka do wygenerowanego pliku (przez main.py)
+        # Ścieżka do wygenerowanego pliku (przez main.py --export-json)
         self.generated_path = os.path.join(self.project_root, "json_results", self.filename)
         
         # Ścieżka do oczekiwanego pliku (wzorzec)
@@ -29,7 +29,7 @@ class TestJsonComparison(unittest.TestCase):
         # 1. Sprawdź czy pliki istnieją
         if not os.path.exists(self.generated_path):
             self.fail(f"Nie znaleziono wygenerowanego pliku: {self.generated_path}.\n"
-                      f"Uruchom najpierw main.py, aby wygenerować wyniki.")
+                      f"Uruchom najpierw main.py --export-json, aby wyeksportować wyniki z magazynu artefaktów.")
             
         if not os.path.exists(self.expected_path):
             self.fail(f"Nie znaleziono pliku wzorcowego: {self.expected_path}")
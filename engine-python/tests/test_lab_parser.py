@@ -0,0 +1,102 @@
+import unittest
+import io
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import ocr_cleaner
+from lab_parser import parse_lab_report, parse_result_line, normalize_unit
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+PAGE_BREAK = "\n\n--- PAGE BREAK ---\n\n"  # Separator stron w surowym OCR (_write_raw_ocr)
+
+# Fikcyjna pacjentka z surowych próbek OCR - profil anonimizacji jak z .env / USER_PROFILES_PATH
+PROFILE = {
+    "name": "Anna",
+    "lastname": "Wiśniewska",
+    "pesel": "85070512345",
+    "address": "ul. Kwiatowa 7, 30-001 Kraków",
+}
+
+
+def read_test_data(name):
+    with open(os.path.join(TEST_DATA, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def cleaned_ocr(name):
+    """
+    Surowy OCR z test_data przepuszczony przez etap anonimizacji potoku (get_privacy_guard z profilem pacjentki)
+    - dokładnie ten tekst dostaje parser lokalny w produkcji.
+    """
+    item = main._new_pipeline_item(name)
+    item["page_texts"] = read_test_data(name).split(PAGE_BREAK)
+    with mock.patch.dict(ocr_cleaner.USER_PROFILES, {"test": PROFILE}, clear=True), \
+            mock.patch.object(main, "get_artifact_store", lambda: None), redirect_stdout(io.StringIO()):
+        main._stage_anonymize(item)
+    return item["anonymized_text"]
+
+
+def analyze_locally(text):
+    """Decyzja potoku dla zanonimizowanego tekstu: wynik parsera lokalnego albo None (dokument idzie do AI)."""
+    item = main._new_pipeline_item("dokument.pdf")
+    item["anonymized_text"] = text
+    with redirect_stdout(io.StringIO()):
+        return main._analyze_locally(item)
+
+
+class TestLabParser(unittest.TestCase):
+    """
+    Wejście parsera to surowy tekst OCR wydruków laboratoriów (format _write_raw_ocr) po anonimizacji
+    prawdziwym PrivacyGuard; wzorcowy JSON morfologii sprawdzono ręcznie z wydrukiem.
+    """
+
+    def setUp(self):
+        self.morphology_ocr = cleaned_ocr("raw-ocr-31_12_25_morfologia.txt")
+        self.expected = json.loads(read_test_data("expected-31_12_25_morfologia.json"))
+
+    def test_fixture_is_anonymized(self):
+        for secret in ("Anna", "Wiśniewska", "85070512345", "Kwiatowa", "1985-07-05", "Pacjent"):
+            self.assertNotIn(secret, self.morphology_ocr)
+
+    def test_matches_expected_morphology(self):
+        """Dwustronicowa morfologia (kontynuacja, stopka "Strona 1 z 2", artefakty jednostek) daje wzorcowy JSON bez AI."""
+        data, confidence = parse_lab_report(self.morphology_ocr)
+
+        self.assertEqual(data, self.expected)
+        self.assertEqual(confidence, 1.0)
+        self.assertEqual(analyze_locally(self.morphology_ocr), self.expected)
+
+    def test_low_confidence_scan_falls_back_to_llm(self):
+        """Skan z błędami OCR (rozbite cyfry, "l" zamiast "1") - parser odczytuje tylko część wierszy."""
+        text = cleaned_ocr("raw-ocr-14_03_25_biochemia.txt")
+        data, confidence = parse_lab_report(text)
+
+        self.assertLess(confidence, main.LOCAL_PARSER_MIN_CONFIDENCE)
+        self.assertEqual([result["name"] for result in data["examinations"][0]["results"]], ["Glukoza", "ALT"])
+        self.assertIsNone(analyze_locally(text))
+
+    def test_damaged_range_lowers_confidence(self):
+        """Zgubiony przecinek w normie (13,5 -> 135) i wiersz spoza znanego układu - dokument trafia do AI."""
+        text = self.morphology_ocr.replace("Hemoglobina 16,0 g/dl 13,5 - 18,0", "Hemoglobina 16,0 g/dl 135 - 18,0")
+        text = text.replace("P - LCR 39,2 % 19,3 - 47,1", "P - LCR 39,2 % 19,3 - 47,1\nOB 1 h 12 mm/h 0 - 15")
+        _, confidence = parse_lab_report(text)
+
+        self.assertLess(confidence, main.LOCAL_PARSER_MIN_CONFIDENCE)
+        self.assertEqual(parse_lab_report("Zwykły tekst bez tabel"), (None, 0.0))
+
+    def test_result_line_variants(self):
+        self.assertEqual(parse_result_line("Glukoza 2 105 H mg/dl 70 99"),
+                         {"name": "Glukoza", "value": 105.0, "unit": "mg/dl", "range_min": 70.0, "range_max": 99.0, "flag": "H"})
+        self.assertEqual(parse_result_line("IgE całkowite < 15,7 IU/l < 100")["range_max"], 100.0)
+        self.assertEqual(normalize_unit("tys/µl*"), "tys/ul")
+        self.assertIsNone(parse_result_line("Materiał: krew żylna"))
+
+
+if __name__ == '__main__':
+    unittest.main()
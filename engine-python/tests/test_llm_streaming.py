@@ -0,0 +1,142 @@
+import unittest
+import io
+import json
+import os
+import sys
+import threading
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import provider_health
+import rate_limiter
+from analyzer import MedicalAnalyzer
+from json_stream import ExaminationStream
+from main import _flatten_streamed_section, _streamed_lab_rows, _iter_lab_results
+
+REPORT = {
+    "meta": {"date_examination": "2025-12-31"},
+    "examinations": [
+        {"examination_name": "Morfologia krwi {ICD-9: C55}", "code_icd": "C55",
+         "results": [{"name": "Leukocyty \"WBC\"", "value": 5.53, "unit": "tys/ul",
+                      "range_min": 4.0, "range_max": 10.0, "flag": None}]},
+        {"examination_name": "Glukoza", "code_icd": "L43",
+         "results": [{"name": "Glukoza", "value": 92, "unit": "mg/dl", "range_min": 70, "range_max": 99, "flag": None}]},
+    ],
+}
+RAW = json.dumps(REPORT, ensure_ascii=False, indent=2)
+
+
+def make_analyzer():
+    analyzer = MedicalAnalyzer.__new__(MedicalAnalyzer)
+    analyzer.system_prompt = "instrukcje"
+    analyzer.gemini_prompt_cache = None
+    analyzer.token_usage = {"gemini": {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}}
+    analyzer._usage_lock = threading.Lock()
+    return analyzer
+
+
+class TestLLMStreaming(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [mock.patch.dict(provider_health._stats, clear=True),
+                    mock.patch.dict(rate_limiter._limiters, clear=True)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_sections_emitted_as_soon_as_they_close(self):
+        sections = []
+        stream = ExaminationStream(lambda index, section, meta: sections.append((index, section, meta)))
+        first_end = RAW.index('"Glukoza"')
+
+        # Kawałki po 7 znaków - granice wypadają w środku napisów i liczb
+        for start in range(0, first_end, 7):
+            stream.feed(RAW[start:min(start + 7, first_end)])
+        self.assertEqual(sections, [(0, REPORT["examinations"][0], REPORT["meta"])])
+
+        stream.finish(RAW)
+        self.assertEqual([section for _, section, _ in sections], REPORT["examinations"])
+
+    def test_single_character_chunks(self):
+        """Klucze i sekcje rozcięte na każdej granicy są sklejane z fragmentów."""
+        sections = []
+        stream = ExaminationStream(lambda index, section, meta: sections.append(section))
+        for ch in RAW:
+            stream.feed(ch)
+        self.assertEqual(sections, REPORT["examinations"])
+        self.assertEqual(stream.meta, REPORT["meta"])
+        self.assertEqual(stream.received, RAW)
+
+    def test_finish_parses_response_that_was_not_streamed(self):
+        sections = []
+        stream = ExaminationStream(lambda index, section, meta: sections.append(index))
+        stream.feed('{"meta": {"date_examination": "2024')  # Przerwana próba, potem ponowienie
+        stream.finish("```json\n" + RAW + "\n```")
+        self.assertEqual(sections, [0, 1])
+
+    def test_analyzer_delivers_sections_before_response_ends(self):
+        analyzer = make_analyzer()
+        delivered = []
+
+        def fake_gemini(text, response_schema=None, on_chunk=None):
+            middle = RAW.index('"Glukoza"')
+            on_chunk(RAW[:middle])
+            # Pierwsza sekcja dotarła, zanim "model" skończył odpowiedź
+            self.assertEqual(delivered, [0])
+            on_chunk(RAW[middle:])
+            return RAW
+
+        analyzer._query_gemini = fake_gemini
+        analyzer._query_xai = mock.Mock(side_effect=AssertionError("nie powinno przełączyć na xAI"))
+        timings = []
+        with redirect_stdout(io.StringIO()):
+            data = analyzer.analyze_text("tekst", timings=timings, on_section=lambda index, section, meta: delivered.append(index))
+
+        self.assertEqual(data, REPORT)
+        self.assertEqual(delivered, [0, 1])
+        llm_span = next(entry for entry in timings if entry["span"] == "llm")
+        self.assertEqual(llm_span["sections"], 2)
+
+    def test_gemini_stream_reads_chunks(self):
+        analyzer = make_analyzer()
+        candidate = SimpleNamespace(finish_reason="STOP", safety_ratings=None)
+        chunks = [SimpleNamespace(text=RAW[i:i + 50], candidates=[candidate], usage_metadata=None)
+                  for i in range(0, len(RAW), 50)]
+        chunks[-1].usage_metadata = SimpleNamespace(prompt_token_count=120, cached_content_token_count=0)
+        analyzer.gemini_client = mock.Mock()
+        analyzer.gemini_client.models.generate_content_stream.return_value = iter(chunks)
+
+        received = []
+        with redirect_stdout(io.StringIO()):
+            raw = analyzer._query_gemini("tekst", on_chunk=received.append)
+
+        self.assertEqual(raw, RAW)
+        self.assertEqual(len(received), len(chunks))
+        self.assertEqual(analyzer.token_usage["gemini"]["prompt_tokens"], 120)
+        analyzer.gemini_client.models.generate_content.assert_not_called()
+
+    def test_long_raw_response_is_truncated_in_log(self):
+        analyzer = make_analyzer()
+        analyzer.RAW_RESPONSE_PRINT_LIMIT = 40
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(analyzer._process_response(RAW), REPORT)
+        self.assertNotIn("Glukoza", output.getvalue())
+        self.assertIn(f"pominięto {len(RAW) - 40} znaków", output.getvalue())
+
+    def test_streamed_rows_match_full_flattening(self):
+        sections = {}
+        with redirect_stdout(io.StringIO()):
+            # Sekcja 0 bez daty (meta jeszcze nie dotarło), sekcja 1 z nieaktualnej próby
+            _flatten_streamed_section(sections, 0, REPORT["examinations"][0], None)
+            _flatten_streamed_section(sections, 1, {"examination_name": "Stara", "results": []}, REPORT["meta"])
+
+        self.assertEqual(_streamed_lab_rows(REPORT, sections), list(_iter_lab_results(REPORT)))
+        self.assertIsNone(_streamed_lab_rows(REPORT, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
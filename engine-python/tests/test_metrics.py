@@ -0,0 +1,79 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MetricsRegistry, SPAN_SECONDS, SPAN_ERRORS, DocumentTimings, add_span_listener, remove_span_listener, span, timings_like
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        fallbacks = registry.counter("test_fallbacks_total", "Przełączenia", ["from_provider", "to_provider"])
+        latency = registry.histogram("test_latency_seconds", "Czas", ["provider"], buckets=(0.1, 1))
+
+        fallbacks.inc(from_provider="gemini", to_provider="xai")
+        fallbacks.inc(from_provider="gemini", to_provider="xai")
+        latency.observe(0.05, provider="gemini")
+        latency.observe(0.5, provider="gemini")
+        latency.observe(3.0, provider="gemini")
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_fallbacks_total counter", lines)
+        self.assertIn('test_fallbacks_total{from_provider="gemini",to_provider="xai"} 2', lines)
+        self.assertIn("# TYPE test_latency_seconds histogram", lines)
+        self.assertIn('test_latency_seconds_bucket{provider="gemini",le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{provider="gemini",le="1.0"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{provider="gemini",le="+Inf"} 3', lines)
+        self.assertIn('test_latency_seconds_sum{provider="gemini"} 3.55', lines)
+        self.assertIn('test_latency_seconds_count{provider="gemini"} 3', lines)
+
+    def test_span_records_document_timings_and_histogram(self):
+        timings = []
+        observed = SPAN_SECONDS.count(span="test_ocr")
+
+        with span("test_ocr", timings, provider="vision") as tags:
+            tags["pages"] = 2
+
+        self.assertEqual(len(timings), 1)
+        self.assertEqual(timings[0]["span"], "test_ocr")
+        self.assertEqual(timings[0]["provider"], "vision")
+        self.assertEqual(timings[0]["pages"], 2)
+        self.assertGreaterEqual(timings[0]["seconds"], 0)
+        self.assertEqual(SPAN_SECONDS.count(span="test_ocr"), observed + 1)
+
+    def test_span_counts_errors(self):
+        timings = []
+        errors = SPAN_ERRORS.value(span="test_llm")
+
+        with self.assertRaises(ValueError):
+            with span("test_llm", timings, provider="gemini"):
+                raise ValueError("błąd dostawcy")
+
+        self.assertTrue(timings[0]["error"])
+        self.assertEqual(SPAN_ERRORS.value(span="test_llm"), errors + 1)
+
+    def test_span_carries_document_tag(self):
+        timings = DocumentTimings(document="wyniki.pdf")
+        heard = []
+
+        def listener(name, seconds, tags):
+            if name == "test_tagged":
+                heard.append(tags)
+
+        add_span_listener(listener)
+        self.addCleanup(remove_span_listener, listener)
+        with span("test_tagged", timings, provider="vision"):
+            pass
+        with span("test_tagged", timings_like(timings)):  # Np. równoległa próba zapytania
+            pass
+
+        self.assertEqual(timings[0]["document"], "wyniki.pdf")
+        self.assertEqual([tags["document"] for tags in heard], ["wyniki.pdf", "wyniki.pdf"])
+        self.assertEqual(heard[0]["provider"], "vision")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import io
+import os
+import sys
+import threading
+from contextlib import redirect_stdout
+from unittest import mock
+
+from google.cloud import vision
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import pdf_raster
+from google_vision_ocr import GoogleVisionOCR
+from transport import Transport
+
+
+def vision_response(text):
+    """Odpowiedź Vision z jednym słowem (struktura jak z DOCUMENT_TEXT_DETECTION)."""
+    vertices = [{"x": 10, "y": 10}, {"x": 60, "y": 10}, {"x": 60, "y": 30}, {"x": 10, "y": 30}]
+    word = {"symbols": [{"text": ch} for ch in text], "bounding_box": {"vertices": vertices}}
+    page = {"blocks": [{"paragraphs": [{"words": [word]}]}]}
+    return vision.AnnotateImageResponse(full_text_annotation={"pages": [page], "text": text})
+
+
+class CountingPages:
+    """Generator stron, który zapamiętuje, ile stron już oddał."""
+    def __init__(self, count):
+        self.count = count
+        self.produced = 0
+
+    def __iter__(self):
+        for page in range(self.count):
+            self.produced += 1
+            yield f"strona-{page}".encode()
+
+
+class TestPageStreaming(unittest.TestCase):
+
+    def test_pdf_pages_are_rendered_on_demand(self):
+        """Poppler renderuje kolejną stronę dopiero, gdy konsument po nią sięgnie."""
+        rendered = []
+
+        def fake_convert(pdf_path, first_page, last_page, **kwargs):
+            rendered.extend(range(first_page - 1, last_page))
+            return [Image.new("L", (4, 4)) for _ in range(first_page, last_page + 1)]
+
+        with mock.patch.object(pdf_raster, "convert_from_path", fake_convert), \
+                mock.patch.object(pdf_raster, "count_pdf_pages", return_value=50):
+            pages = pdf_raster.iter_pdf_pages("dokument.pdf", thread_count=2)
+            first = [next(pages) for _ in range(3)]
+
+        self.assertEqual([index for index, _ in first], [0, 1, 2])
+        self.assertEqual(rendered, [0, 1, 2, 3])  # Dwie porcje po thread_count stron, nie 50 stron
+
+    def test_ocr_pulls_pages_as_batches_complete(self):
+        """ocr_images nie wyprzedza Vision o więcej niż limit zapytań w locie."""
+        client = mock.Mock()
+        pages = CountingPages(40)
+        ahead = []
+        lock = threading.Lock()
+        completed = [0]
+
+        def annotate(requests):
+            with lock:
+                ahead.append(pages.produced - completed[0])
+                completed[0] += len(requests)
+            return vision.BatchAnnotateImagesResponse(responses=[vision_response("Wynik") for _ in requests])
+
+        client.batch_annotate_images.side_effect = annotate
+        with mock.patch.object(vision.ImageAnnotatorClient, "from_service_account_json", return_value=client):
+            ocr = GoogleVisionOCR("klucz.json", batch_size=2, max_concurrency=2, transport=Transport())
+        texts = ocr.ocr_images(iter(pages))
+
+        self.assertEqual(len(texts), 40)
+        # W locie najwyżej max_concurrency * 2 porcji plus porcja w budowie
+        self.assertLessEqual(max(ahead), (2 * 2 + 1) * 2)
+
+    def test_pipeline_passes_page_generator_to_ocr(self):
+        """Etap rasteryzacji przekazuje generator stron; strony konsumuje dopiero etap OCR."""
+        pages = CountingPages(5)
+        vision_client = mock.Mock()
+        vision_client.iter_page_images.return_value = iter(pages)
+        vision_client.ocr_images.side_effect = lambda contents: [content.decode() for content in contents]
+
+        item = main._new_pipeline_item("skan.pdf", content=b"%PDF-1.4")
+        with mock.patch.object(main, "USE_GOOGLE_VISION", True), mock.patch.object(main, "USE_PDF_TEXT_LAYER", False), \
+                mock.patch.object(main, "get_artifact_store", lambda: None), redirect_stdout(io.StringIO()):
+            self.assertIs(main._stage_rasterize(item, vision_client, None), item)
+            self.assertEqual(pages.produced, 0)
+            main._stage_ocr(item, vision_client)
+
+        self.assertEqual(pages.produced, 5)
+        self.assertEqual(item["page_texts"], [f"strona-{page}" for page in range(5)])
+        self.assertIsNone(item["page_images"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+from unittest import mock
+
+import matplotlib
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from pdf_text_layer import extract_text_layer, is_text_layer_usable
+
+MORPHOLOGY_LINES = [
+    "Morfologia krwi (ICD-9: C55)",
+    "Leukocyty 5,53 tys/ul 4,00 - 10,00",
+    "Hemoglobina 16,0 g/dl 13,5 - 18,0",
+]
+
+
+def pdf_with_pages(pages):
+    """PDF w pamięci: każda strona to lista wierszy tekstu (pusta lista = strona bez warstwy tekstowej, jak skan)."""
+    buffer = io.BytesIO()
+    with matplotlib.rc_context({"pdf.fonttype": 42}), PdfPages(buffer) as pdf:
+        for lines in pages:
+            fig = Figure(figsize=(8.27, 11.69))
+            for row, line in enumerate(lines):
+                fig.text(0.07, 0.95 - row * 0.025, line, fontsize=9)
+            pdf.savefig(fig)
+    return buffer.getvalue()
+
+
+def words(texts):
+    return [{"text": text} for text in texts]
+
+
+class TestPdfTextLayer(unittest.TestCase):
+
+    def test_text_layer_page_is_read_in_rows(self):
+        page_texts = extract_text_layer(io.BytesIO(pdf_with_pages([MORPHOLOGY_LINES])))
+
+        self.assertEqual(len(page_texts), 1)
+        self.assertEqual(page_texts[0].split("\n"), MORPHOLOGY_LINES)
+
+    def test_page_without_text_needs_ocr(self):
+        self.assertEqual(extract_text_layer(io.BytesIO(pdf_with_pages([[]]))), [None])
+        self.assertFalse(is_text_layer_usable(words(["Strona", "1"])))  # Kilka słów (np. stopka na skanie)
+
+    def test_garbled_text_layer_needs_ocr(self):
+        """Fonty bez mapowania na Unicode: glify "(cid:..)", znaki zastępcze albo śmieci zamiast liter."""
+        self.assertTrue(is_text_layer_usable(words("Leukocyty 5,53 tys/ul 4,00 10,00".split())))
+        self.assertFalse(is_text_layer_usable(words(["(cid:41)(cid:72)(cid:88)", "(cid:78)(cid:82)", "5,53", "tys/ul", "4,00"])))
+        self.assertFalse(is_text_layer_usable(words(["Leuko�yty", "5,53", "tys/ul", "4,00", "10,00"])))
+        self.assertFalse(is_text_layer_usable(words(["░▒▓", "■□", "⌂⌐", "5,53", "─│"])))
+
+    def test_mixed_pages_keep_order_after_ocr(self):
+        """Strony z warstwą tekstową i skany (OCR) składają się w kolejności stron dokumentu."""
+        content = pdf_with_pages([MORPHOLOGY_LINES, [], ["Glukoza 92 mg/dl 70 - 99", "Materiał: krew żylna (EDTA)"], []])
+        self.assertEqual([text is None for text in extract_text_layer(io.BytesIO(content))], [False, True, False, True])
+
+        ocr = mock.Mock(side_effect=lambda source, pages: [f"OCR strony {page + 1}" for page in pages])
+        item = main._new_pipeline_item("mieszany.pdf", content=content)
+        with mock.patch.object(main, "USE_GOOGLE_VISION", False), mock.patch.object(main, "USE_PDF_TEXT_LAYER", True), \
+                mock.patch.object(main, "ocr_pdf_pages", ocr), mock.patch.object(main, "get_artifact_store", lambda: None), \
+                redirect_stdout(io.StringIO()):
+            main._stage_rasterize(item, None, None)
+            main._stage_ocr(item, None)
+
+        self.assertEqual(ocr.call_args.kwargs["pages"], [1, 3])
+        self.assertEqual(item["page_texts"][0].split("\n"), MORPHOLOGY_LINES)
+        self.assertEqual(item["page_texts"][1], "OCR strony 2")
+        self.assertTrue(item["page_texts"][2].startswith("Glukoza 92 mg/dl"))
+        self.assertEqual(item["page_texts"][3], "OCR strony 4")
+
+
+if __name__ == '__main__':
+    unittest.main()
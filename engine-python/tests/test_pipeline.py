@@ -0,0 +1,77 @@
+import unittest
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import Pipeline, Stage
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_all_items_pass_through_stages(self):
+        """Każdy element przechodzi przez wszystkie etapy dokładnie raz."""
+        pipeline = Pipeline([
+            Stage("plus", lambda x: x + 1, workers=2),
+            Stage("razy", lambda x: x * 10, workers=3),
+        ])
+        results = list(pipeline.run(range(20)))
+
+        self.assertEqual(sorted(item for item, _ in results), [(i + 1) * 10 for i in range(20)])
+        self.assertTrue(all(error is None for _, error in results))
+
+    def test_stages_overlap(self):
+        """Czas potoku zbliża się do najwolniejszego etapu, a nie do sumy etapów."""
+        def slow(x):
+            time.sleep(0.05)
+            return x
+
+        pipeline = Pipeline([Stage("a", slow), Stage("b", slow), Stage("c", slow)])
+        start = time.monotonic()
+        list(pipeline.run(range(10)))
+        elapsed = time.monotonic() - start
+
+        # Sekwencyjnie: 10 * 3 * 0.05 = 1.5 s; potokowo ok. (10 + 2) * 0.05 = 0.6 s
+        self.assertLess(elapsed, 1.0)
+
+    def test_error_and_early_finish(self):
+        """Błąd etapu jest zwracany razem z elementem, a None kończy element wcześniej."""
+        def first(item):
+            if item["id"] == 1:
+                raise ValueError("zepsuty plik")
+            if item["id"] == 2:
+                item["cached"] = True
+                return None
+            return item
+
+        def second(item):
+            item["done"] = True
+            return item
+
+        pipeline = Pipeline([Stage("first", first), Stage("second", second)])
+        results = {item["id"]: (item, error) for item, error in pipeline.run({"id": i} for i in range(3))}
+
+        self.assertIsInstance(results[1][1], ValueError)
+        self.assertTrue(results[2][0]["cached"])
+        self.assertNotIn("done", results[2][0])
+        self.assertTrue(results[0][0]["done"])
+
+    def test_micro_batching(self):
+        """Etap z batch_size dostaje listy elementów, a wyniki wracają pojedynczo."""
+        batch_sizes = []
+
+        def batched(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        pipeline = Pipeline([Stage("plus", lambda x: x + 1), Stage("wsad", batched, batch_size=4, batch_wait=0.2)])
+        results = list(pipeline.run(range(10)))
+
+        self.assertEqual(sorted(item for item, _ in results), [(i + 1) * 2 for i in range(10)])
+        self.assertTrue(all(size <= 4 for size in batch_sizes))
+        self.assertLess(len(batch_sizes), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
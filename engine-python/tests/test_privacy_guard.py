@@ -0,0 +1,79 @@
+import unittest
+import os
+import sys
+import re
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_cleaner import PrivacyGuard, profile_direct_values, _trie_pattern
+
+PROFILE = {
+    "name": "Jan",
+    "lastname": "Kowalski",
+    "pesel": "90010112345",
+    "address": "ul. Długa 15, 00-950 Warszawa",
+}
+
+PAGES = [
+    "Pacjent: Jan KOWALSKI PESEL 90010112345\n"
+    "Adres: Długa 15, Warszawa\n"
+    "Data ur.: 1990-01-01\n"
+    "Janina Kowalska, Lekarz: dr Nowak, nr 12345678901\n"
+    "Leukocyty 5,53 tys/ul 4,00 10,00",
+    "Hemoglobina 14,2 g/dl 12,00 16,00\n"
+    "Data ur\n1990-01-01\n"
+    "Data wykonania: 2025-12-31\n"
+    "DIAGNOSTYKA S.A.\n"
+    "Strona 2 z 2",
+]
+
+
+def reference_anonymize(profile, page_texts):
+    """Pierwotny algorytm (osobne re.sub dla każdej wartości i reguły) - wzorzec zgodności."""
+    values = set(profile_direct_values(profile))
+    noise_regex = re.compile(r'przyjęcia prób|Data wykonania|Data/godz\. wydania|DIAGNOSTYKA S\.A\.|KREW ŻYLNA|Strona:? \d+ z \d+', re.IGNORECASE)
+    pages = []
+    for i, text in enumerate(page_texts):
+        for value in values:
+            text = re.sub(r'\b' + re.escape(value) + r'\b', '[REDACTED]', text, flags=re.IGNORECASE)
+        text = re.sub(r'\b\d{11}\b', '[REDACTED_PESEL]', text)
+        text = re.sub(r'\b(Pacjent|Odbiorca|Lekarz)\b\s*:?', '[REDACTED_ROLE_INFO]', text, flags=re.IGNORECASE)
+        text = re.sub(r'\bData ur[\s.:]*\n?\d{4}-\d{2}-\d{2}', '[REDACTED_DOB]', text, flags=re.IGNORECASE)
+        lines = text.split('\n')
+        if i == len(page_texts) - 1:
+            lines = [line for line in lines if not noise_regex.search(line)]
+        pages.append("\n".join(lines))
+    return "\n".join(pages)
+
+
+class TestPrivacyGuard(unittest.TestCase):
+
+    def test_matches_reference_algorithm(self):
+        """Jednoprzebiegowe dopasowanie daje ten sam wynik co pierwotne, wieloetapowe."""
+        self.assertEqual(PrivacyGuard(PROFILE).anonymize(PAGES), reference_anonymize(PROFILE, PAGES))
+
+    def test_redacts_personal_data(self):
+        result = PrivacyGuard(PROFILE).anonymize(PAGES)
+
+        for secret in ("Jan ", "KOWALSKI", "90010112345", "Długa", "Warszawa", "1990-01-01", "Strona 2"):
+            self.assertNotIn(secret, result)
+        # Całe słowa: "Janina" i "Kowalska" to inne osoby
+        self.assertIn("Janina Kowalska", result)
+        self.assertIn("[REDACTED_PESEL]", result)
+        self.assertIn("Leukocyty 5,53 tys/ul 4,00 10,00", result)
+
+    def test_multiple_profiles(self):
+        """Dane wszystkich profili są usuwane w jednym przebiegu."""
+        other = {"name": "Anna", "lastname": "Nowak", "pesel": None, "address": None}
+        result = PrivacyGuard([PROFILE, other]).anonymize(["Jan Kowalski i Anna Nowak, Annapurna"])
+
+        self.assertEqual(result, "[REDACTED] [REDACTED] i [REDACTED] [REDACTED], Annapurna")
+
+    def test_trie_prefers_longest_match(self):
+        pattern = re.compile(r'\b' + _trie_pattern(["jan", "janina", "jasło"]) + r'\b', re.IGNORECASE)
+
+        self.assertEqual(pattern.findall("Janina, Jan i Jasło; Janek"), ["Janina", "Jan", "Jasło"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_cache import GeminiPromptCache
+
+
+class FakeCaches:
+    """Atrapa client.caches: zlicza utworzenia i przedłużenia cache."""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.created = 0
+        self.updated = 0
+
+    def _handle(self, name):
+        expire = datetime.fromtimestamp(time.time() + self.ttl_seconds, tz=timezone.utc)
+        return SimpleNamespace(name=name, expire_time=expire)
+
+    def create(self, model, config):
+        self.created += 1
+        return self._handle(f"cachedContents/{self.created}")
+
+    def update(self, name, config):
+        self.updated += 1
+        return self._handle(name)
+
+
+class TestGeminiPromptCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.registry_path = os.path.join(self.tmp_dir.name, "prompt_cache.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _cache(self, caches, renew_margin_seconds=60):
+        client = SimpleNamespace(caches=caches)
+        return GeminiPromptCache(client, "model", "instrukcje", self.registry_path,
+                                 ttl_seconds=3600, renew_margin_seconds=renew_margin_seconds)
+
+    def test_handle_reused_across_instances(self):
+        """Uchwyt jest tworzony raz i odczytywany z lokalnego rejestru (także po restarcie)."""
+        caches = FakeCaches(ttl_seconds=3600)
+        first = self._cache(caches).get_name()
+        second = self._cache(caches).get_name()
+
+        self.assertEqual(first, second)
+        self.assertEqual(caches.created, 1)
+        self.assertEqual(caches.updated, 0)
+
+    def test_ttl_renewed_near_expiry(self):
+        """Gdy do wygaśnięcia zostało mniej niż margines, TTL jest przedłużany zamiast tworzenia nowego cache."""
+        caches = FakeCaches(ttl_seconds=30)
+        cache = self._cache(caches, renew_margin_seconds=60)
+        name = cache.get_name()
+
+        self.assertEqual(cache.get_name(), name)
+        self.assertEqual((caches.created, caches.updated), (1, 1))
+
+    def test_disabled_after_create_failure(self):
+        caches = FakeCaches(ttl_seconds=3600)
+        caches.create = lambda model, config: (_ for _ in ()).throw(RuntimeError("too few tokens"))
+        cache = self._cache(caches)
+
+        self.assertIsNone(cache.get_name())
+        self.assertTrue(cache.disabled)
+
+    def test_transient_failure_backs_off_and_retries(self):
+        """Błąd przejściowy (np. 503) nie wyłącza cache na stałe - po przerwie jest kolejna próba."""
+        caches = FakeCaches(ttl_seconds=3600)
+        create = caches.create
+        caches.create = mock.Mock(side_effect=RuntimeError("503 UNAVAILABLE"))
+        cache = self._cache(caches)
+
+        self.assertIsNone(cache.get_name())
+        self.assertFalse(cache.disabled)
+        self.assertIsNone(cache.get_name())  # W trakcie przerwy bez zapytania do API
+        self.assertEqual(caches.create.call_count, 1)
+
+        caches.create = create
+        cache.retry_at = 0.0  # Przerwa minęła
+        self.assertEqual(cache.get_name(), "cachedContents/1")
+
+    def test_registry_read_from_disk_once(self):
+        caches = FakeCaches(ttl_seconds=3600)
+        cache = self._cache(caches)
+        with mock.patch.object(cache, "_load_registry", side_effect=AssertionError("rejestr czytany ponownie")):
+            name = cache.get_name()
+            self.assertEqual(cache.get_name(), name)
+        # Zapisany rejestr jest widoczny dla nowej instancji (restart)
+        self.assertEqual(self._cache(caches).get_name(), name)
+        self.assertEqual(caches.created, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
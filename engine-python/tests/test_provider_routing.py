@@ -0,0 +1,107 @@
+import unittest
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import provider_health
+import rate_limiter
+from analyzer import MedicalAnalyzer
+
+RESULT = '{"meta": {"date_examination": "2025-12-31"}, "examinations": []}'
+
+
+def make_analyzer(gemini, xai, hedging=False):
+    analyzer = MedicalAnalyzer.__new__(MedicalAnalyzer)
+    analyzer.system_prompt = "instrukcje"
+    analyzer.HEDGING_ENABLED = hedging
+    analyzer.HEDGE_DEFAULT_DELAY_SECONDS = 0.05
+    analyzer._hedge_executor = ThreadPoolExecutor(max_workers=4)
+    analyzer._query_gemini = gemini
+    analyzer._query_xai = xai
+    return analyzer
+
+
+class TestProviderRouting(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [mock.patch.dict(provider_health._stats, clear=True),
+                    mock.patch.dict(rate_limiter._limiters, clear=True)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_hedge_returns_faster_provider(self):
+        """Wolny główny dostawca nie wyznacza czasu odpowiedzi - wygrywa szybszy zapasowy."""
+        def slow_gemini(text):
+            time.sleep(1.0)
+            return RESULT
+
+        analyzer = make_analyzer(slow_gemini, lambda text: RESULT, hedging=True)
+        start = time.monotonic()
+        result = analyzer.analyze_text("tekst")
+
+        self.assertEqual(result["meta"]["date_examination"], "2025-12-31")
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_hedge_forwards_only_winner_sections(self):
+        """Sekcje i czasy przegranej próby nie mieszają się z wynikiem zwycięzcy."""
+        def report(name):
+            return json.dumps({"meta": {"date_examination": "2025-12-31"},
+                               "examinations": [{"examination_name": name, "code_icd": "", "results": []}]})
+
+        def slow_gemini(text, on_chunk=None):
+            on_chunk(report("Gemini"))  # Sekcja gotowa, ale odpowiedź kończy się za późno
+            time.sleep(0.5)
+            return report("Gemini")
+
+        def fast_xai(text, on_chunk=None):
+            on_chunk(report("xAI"))
+            return report("xAI")
+
+        analyzer = make_analyzer(slow_gemini, fast_xai, hedging=True)
+        sections, timings = [], []
+        result = analyzer.analyze_text("tekst", timings=timings,
+                                       on_section=lambda index, section, meta: sections.append(section["examination_name"]))
+
+        self.assertEqual(result["examinations"][0]["examination_name"], "xAI")
+        self.assertEqual(sections, ["xAI"])
+        self.assertEqual({entry["provider"] for entry in timings}, {"xai"})
+
+    def test_hedge_falls_back_after_error(self):
+        def broken_gemini(text):
+            raise RuntimeError("500")
+
+        analyzer = make_analyzer(broken_gemini, lambda text: RESULT, hedging=True)
+        self.assertIsNotNone(analyzer.analyze_text("tekst"))
+
+    def test_degraded_provider_skipped_during_cooldown(self):
+        """Po serii błędów dostawca jest pomijany, zanim w ogóle zostanie zapytany."""
+        gemini = mock.Mock(side_effect=RuntimeError("503"))
+        analyzer = make_analyzer(gemini, lambda text: RESULT)
+
+        for _ in range(3):
+            self.assertIsNotNone(analyzer.analyze_text("tekst"))
+        self.assertEqual(gemini.call_count, 3)
+
+        analyzer.analyze_text("tekst")
+        self.assertEqual(gemini.call_count, 3)
+        self.assertFalse(provider_health._stats["gemini"].is_available())
+
+    def test_invalid_json_counted_once(self):
+        """Niepoprawny JSON to jeden błąd dostawcy - bez wcześniejszego wpisu sukcesu."""
+        analyzer = make_analyzer(lambda text: "to nie jest JSON", lambda text: RESULT)
+        self.assertIsNotNone(analyzer.analyze_text("tekst"))
+
+        gemini = provider_health._stats["gemini"]
+        self.assertEqual(list(gemini.outcomes), [False])
+        self.assertEqual(len(gemini.latencies), 0)
+        self.assertEqual(list(provider_health._stats["xai"].outcomes), [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
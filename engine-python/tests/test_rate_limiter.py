@@ -0,0 +1,63 @@
+import unittest
+import os
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_limiter
+from rate_limiter import ProviderRateLimiter, is_rate_limit_error, backoff_delay
+from analyzer import MedicalAnalyzer
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_burst_then_refill(self):
+        """Pojemność wiadra jest dostępna od razu, kolejne zapytanie czeka na uzupełnienie."""
+        limiter = ProviderRateLimiter(requests_per_minute=600, tokens_per_minute=1_000_000)  # 10 zapytań/s
+        limiter.requests.capacity = limiter.requests.tokens = 3
+
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.acquire(estimated_tokens=100)
+        elapsed = time.monotonic() - start
+
+        self.assertGreaterEqual(elapsed, 0.08)
+        self.assertLess(elapsed, 0.5)
+
+    def test_backoff_respects_retry_after(self):
+        self.assertGreaterEqual(backoff_delay(0, 1, 60, retry_after=5), 5)
+        self.assertLessEqual(backoff_delay(3, 1, 4), 4)
+        self.assertTrue(is_rate_limit_error(RateLimitError()))
+        self.assertFalse(is_rate_limit_error(ValueError()))
+
+    def test_retries_same_provider_before_fallback(self):
+        """Po 429 zapytanie jest ponawiane u tego samego dostawcy, bez przełączania na zapasowego."""
+        analyzer = MedicalAnalyzer.__new__(MedicalAnalyzer)
+        analyzer.system_prompt = "instrukcje"
+        analyzer.RATE_LIMIT_BACKOFF_SECONDS = 0.01
+        responses = [RateLimitError(), RateLimitError(), '{"meta": {}, "examinations": []}']
+
+        def fake_gemini(text):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        analyzer._query_gemini = fake_gemini
+        analyzer._query_xai = mock.Mock(side_effect=AssertionError("nie powinno przełączyć na xAI"))
+
+        with mock.patch.dict(rate_limiter._limiters, clear=True):
+            result = analyzer.analyze_text("tekst", provider='gemini')
+
+        self.assertEqual(result, {"meta": {}, "examinations": []})
+        self.assertEqual(responses, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache, file_sha256, pipeline_fingerprint
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        """Każdy test dostaje własną, pustą bazę cache."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "results.sqlite")
+        self.fingerprint = pipeline_fingerprint("prompt", {"type": "OBJECT"}, "model", "vision")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_put_and_get_roundtrip(self):
+        """Zapisany wynik wraca w niezmienionej postaci."""
+        cache = ResultCache(self.db_path, self.fingerprint)
+        data = {"meta": {"date_examination": "2025-12-31"}, "examinations": []}
+        cache.put("abc", ["strona 1", "strona 2"], "tekst", data)
+
+        entry = cache.get("abc")
+        self.assertEqual(entry["page_texts"], ["strona 1", "strona 2"])
+        self.assertEqual(entry["anonymized_text"], "tekst")
+        self.assertEqual(entry["data"], data)
+        self.assertIsNone(cache.get("inny"))
+
+    def test_fingerprint_change_invalidates_entries(self):
+        """Zmiana promptu (innego odcisku) usuwa stare wpisy przy otwarciu cache."""
+        ResultCache(self.db_path, self.fingerprint).put("abc", ["a"], "a", {"x": 1})
+
+        new_fingerprint = pipeline_fingerprint("nowy prompt", {"type": "OBJECT"}, "model", "vision")
+        self.assertNotEqual(new_fingerprint, self.fingerprint)
+        self.assertIsNone(ResultCache(self.db_path, new_fingerprint).get("abc"))
+
+    def test_lru_eviction_respects_size_limit(self):
+        """Po przekroczeniu limitu znika najdawniej używany wpis."""
+        cache = ResultCache(self.db_path, self.fingerprint, max_bytes=10 ** 9)
+        big_text = os.urandom(2000).hex()
+        cache.put("stary", [big_text], "", {})
+        cache.put("nowy", [big_text], "", {})
+        cache.get("stary")  # "stary" staje się ostatnio używany
+
+        cache.max_bytes = 5000
+        cache.put("trzeci", [big_text], "", {})
+
+        self.assertIsNotNone(cache.get("stary"))
+        self.assertIsNone(cache.get("nowy"))
+
+    def test_file_sha256(self):
+        """Skrót pliku zależy wyłącznie od jego zawartości."""
+        path_a = os.path.join(self.tmp_dir.name, "a.pdf")
+        path_b = os.path.join(self.tmp_dir.name, "b.pdf")
+        for path in (path_a, path_b):
+            with open(path, "wb") as f:
+                f.write(b"%PDF-1.4 test")
+        self.assertEqual(file_sha256(path_a), file_sha256(path_b))
+
+
+if __name__ == '__main__':
+    unittest.main()
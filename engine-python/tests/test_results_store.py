@@ -0,0 +1,71 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import results_store
+from results_store import ResultsStore
+from main import _iter_lab_results, _flatten_lab_results, _long_to_wide
+
+
+class TestResultsStore(unittest.TestCase):
+
+    def setUp(self):
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(project_root, "tests", "test_data", "expected-31_12_25_morfologia.json"), encoding="utf-8") as f:
+            self.report = json.load(f)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ResultsStore(os.path.join(self.tmp_dir.name, "lab_results.sqlite"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _report_for(self, date, leukocytes):
+        report = json.loads(json.dumps(self.report))
+        report["meta"]["date_examination"] = date
+        report["examinations"][0]["results"][0]["value"] = leukocytes
+        return report
+
+    def test_reingest_replaces_document(self):
+        """Ponowne przetworzenie dokumentu nie dubluje wierszy."""
+        self.store.replace_document("doc-a", _iter_lab_results(self.report))
+        self.store.replace_document("doc-a", _iter_lab_results(self.report))
+
+        self.assertEqual(len(self.store.query()), len(self.report["examinations"][0]["results"]))
+
+    def test_has_document_tracks_rows_version(self):
+        self.assertFalse(self.store.has_document("doc-a"))
+        self.store.replace_document("doc-a", _iter_lab_results(self.report))
+        self.assertTrue(self.store.has_document("doc-a"))
+
+        # Nowy format wierszy - dokument trzeba zapisać ponownie
+        with mock.patch.object(results_store, "ROWS_FORMAT_VERSION", results_store.ROWS_FORMAT_VERSION + 1):
+            self.assertFalse(self.store.has_document("doc-a"))
+
+    def test_filtered_reads(self):
+        for index, (date, value) in enumerate([("2025-01-10", 5.1), ("2025-06-10", 6.2), ("2025-12-31", 7.3)]):
+            self.store.replace_document(f"doc-{index}", _iter_lab_results(self._report_for(date, value)))
+
+        rows = self.store.query(series_keys=["Morfologia krwi - Leukocyty [tys/ul]"], date_from="2025-03-01")
+
+        self.assertEqual([(row["date"], row["value"]) for row in rows], [("2025-06-10", 6.2), ("2025-12-31", 7.3)])
+        self.assertEqual(self.store.series_keys()["Morfologia krwi - Leukocyty [tys/ul]"], 3)
+
+    def test_wide_frame_matches_flattened_results(self):
+        """Tabela odtworzona z magazynu ma te same wartości co spłaszczony JSON."""
+        self.store.replace_document("doc-a", _iter_lab_results(self.report))
+        wide = _long_to_wide(self.store.read_frame()).iloc[0].to_dict()
+        flat = _flatten_lab_results(self.report)
+
+        self.assertEqual(set(wide), set(flat))
+        for key, value in flat.items():
+            self.assertEqual(wide[key], value, key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+import time
+from unittest import mock
+
+import pytesseract
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_cleaner
+from ocr_cleaner import TesseractEngine
+
+PAGE_COUNT = 8
+
+
+class FakePageImage:
+    def close(self):
+        pass
+
+
+def fake_image_to_string(image, lang):
+    return f"strona {image.page} ({lang}), OMP_THREAD_LIMIT={os.environ.get('OMP_THREAD_LIMIT')}"
+
+
+def stub_ocr_single_page(pdf_path, page, lang):
+    """
+    Zadanie procesu roboczego: prawdziwe _ocr_single_page z atrapą Popplera i pytesseract.image_to_string.
+    Wcześniejsze strony kończą się później - kolejność wyników nie może zależeć od kolejności zakończenia.
+    """
+    def fake_pages(pdf_path, pages, **kwargs):
+        image = FakePageImage()
+        image.page = pages[0]
+        yield pages[0], image
+
+    time.sleep((PAGE_COUNT - page) * 0.02)
+    with mock.patch.object(ocr_cleaner, "iter_pdf_pages", fake_pages), \
+            mock.patch.object(pytesseract, "image_to_string", fake_image_to_string):
+        return ocr_cleaner._ocr_single_page(pdf_path, page, lang)
+
+
+class TestTesseractEngine(unittest.TestCase):
+
+    def setUp(self):
+        # Zadanie trafia do procesów roboczych przez referencję do funkcji z tego modułu
+        patcher = mock.patch.object(ocr_cleaner, "_ocr_single_page", stub_ocr_single_page)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages_keep_order_across_workers(self):
+        engine = TesseractEngine(workers=3, lang="pol", omp_thread_limit=2)
+        self.addCleanup(engine.shutdown)
+        self.assertEqual(engine.executor._max_workers, 3)
+
+        texts = engine.ocr_pages("dokument.pdf", pages=list(range(PAGE_COUNT)))
+
+        self.assertEqual(texts, [f"strona {page} (pol), OMP_THREAD_LIMIT=2" for page in range(PAGE_COUNT)])
+
+    def test_documents_are_returned_per_path(self):
+        engine = TesseractEngine(workers=2)
+        self.addCleanup(engine.shutdown)
+
+        results = engine.ocr_documents(["a.pdf", "b.pdf"], pages={"a.pdf": [2, 0], "b.pdf": [1]})
+
+        self.assertEqual(list(results), ["a.pdf", "b.pdf"])
+        self.assertEqual([text.split(" (")[0] for text in results["a.pdf"]], ["strona 2", "strona 0"])
+        self.assertEqual([text.split(" (")[0] for text in results["b.pdf"]], ["strona 1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
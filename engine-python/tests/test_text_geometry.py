@@ -0,0 +1,48 @@
+import unittest
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_geometry import words_to_lines, _words_to_lines_py
+
+
+class TestTextGeometry(unittest.TestCase):
+
+    def _random_words(self, rng, count, rows):
+        words = []
+        for _ in range(count):
+            row = rng.randrange(rows)
+            height = rng.choice([0, 8, 14, 16.5, 20, 33])
+            words.append({
+                "text": f"w{len(words)}",
+                "y": 40 + row * 25 + rng.choice([-6, -2.5, 0, 0, 3, 6.5]),
+                "x": rng.choice([10, 10, 55, 120, 120.5, 300]),  # celowe remisy po X
+                "height": height,
+            })
+        return words
+
+    def test_matches_reference_on_random_pages(self):
+        """Wersja NumPy daje dokładnie ten sam tekst co pierwotna pętla w Pythonie."""
+        rng = random.Random(1234)
+        for _ in range(300):
+            words = self._random_words(rng, rng.randint(1, 400), rng.randint(1, 40))
+            self.assertEqual(words_to_lines(words), _words_to_lines_py(words))
+
+    def test_boundary_distance_stays_in_line(self):
+        """Odległość równa tolerancji (10 px) nie zaczyna nowego wiersza."""
+        words = [
+            {"text": "B", "y": 110, "x": 5, "height": 10},
+            {"text": "A", "y": 100, "x": 50, "height": 10},
+            {"text": "C", "y": 120.5, "x": 0, "height": 10},
+        ]
+        self.assertEqual(words_to_lines(words), "B A\nC")
+        self.assertEqual(words_to_lines(words), _words_to_lines_py(words))
+
+    def test_empty(self):
+        self.assertEqual(words_to_lines([]), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from google.cloud import vision
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import provider_health
+import rate_limiter
+from analyzer import MedicalAnalyzer
+from google_vision_ocr import GoogleVisionOCR, PageOCRError
+from transport import Transport, CassetteStore, CassetteMissError, cassette_key
+
+RESULT = '{"meta": {"date_examination": "2025-12-31"}, "examinations": []}'
+
+
+def vision_response(text):
+    """Odpowiedź Vision z jednym słowem (struktura jak z DOCUMENT_TEXT_DETECTION)."""
+    vertices = [{"x": 10, "y": 10}, {"x": 60, "y": 10}, {"x": 60, "y": 30}, {"x": 10, "y": 30}]
+    word = {"symbols": [{"text": ch} for ch in text], "bounding_box": {"vertices": vertices}}
+    page = {"blocks": [{"paragraphs": [{"words": [word]}]}]}
+    return vision.AnnotateImageResponse(full_text_annotation={"pages": [page], "text": text})
+
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = CassetteStore(os.path.join(self.tmp_dir.name, "cassettes.sqlite"))
+        patchers = [mock.patch.dict(provider_health._stats, clear=True),
+                    mock.patch.dict(rate_limiter._limiters, clear=True)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cassette_key_separates_parts(self):
+        self.assertNotEqual(cassette_key("ab", "c"), cassette_key("a", "bc"))
+        self.assertEqual(cassette_key("gemini", b"\x00\x01"), cassette_key("gemini", b"\x00\x01"))
+
+    def test_llm_response_is_replayed_without_provider(self):
+        recorder = MedicalAnalyzer(transport=Transport("record", self.store))
+        recorder._query_gemini = mock.Mock(return_value=RESULT)
+        recorded = recorder.analyze_text("Leukocyty 5,53 tys/ul")
+
+        player = MedicalAnalyzer(transport=Transport("replay", self.store))
+        player._query_gemini = mock.Mock(side_effect=AssertionError("replay nie może pytać dostawcy"))
+        player._query_xai = mock.Mock(side_effect=AssertionError("replay nie może pytać dostawcy"))
+
+        self.assertEqual(player.analyze_text("Leukocyty 5,53 tys/ul"), recorded)
+        with self.assertRaises(CassetteMissError):
+            player._call_provider('gemini', "inny dokument")
+
+    def test_vision_pages_are_replayed_by_image_hash(self):
+        client = mock.Mock()
+        client.batch_annotate_images.return_value = vision.BatchAnnotateImagesResponse(
+            responses=[vision_response("Leukocyty"), vision_response("Hemoglobina")])
+        with mock.patch.object(vision.ImageAnnotatorClient, "from_service_account_json", return_value=client):
+            recorder = GoogleVisionOCR("klucz.json", batch_size=2, transport=Transport("record", self.store))
+        recorded = recorder.ocr_images([b"strona-1", b"strona-2"])
+
+        # Inny podział na porcje i brak klucza API - odpowiedzi per strona z kasety
+        player = GoogleVisionOCR("brak-klucza.json", batch_size=1, transport=Transport("replay", self.store))
+        self.assertIsNone(player.client)
+        self.assertEqual(player.ocr_images([b"strona-1", b"strona-2"]), recorded)
+        self.assertEqual(recorded, ["Leukocyty", "Hemoglobina"])
+
+        with self.assertRaises(PageOCRError):
+            player.ocr_images([b"strona-3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results_store import ResultsStore
+from trends import build_trends, lttb_indices
+
+SERIES = "Morfologia krwi - Leukocyty [tys/ul]"
+
+
+class TestTrends(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.store = ResultsStore(os.path.join(cls.tmp_dir.name, "lab_results.sqlite"))
+        start = date(2020, 1, 1)
+        for day in range(500):
+            value = 5.0 + (8.0 if day == 250 else 0.0) + np.sin(day / 20)
+            cls.store.replace_document(f"doc-{day}", [{
+                "date": (start + timedelta(days=day)).isoformat(),
+                "section": "Morfologia krwi",
+                "parameter": "Leukocyty",
+                "unit": "tys/ul",
+                "series_key": SERIES,
+                "value": float(value),
+                "range_min": 4.0,
+                "range_max": 10.0,
+                "flag": "H" if value > 10 else None,
+            }])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_downsampling_keeps_shape(self):
+        """Zmniejszona seria ma zadaną liczbę punktów, końce i skrajny wynik (pik)."""
+        trends = build_trends(self.store, series_keys=[SERIES], max_points=50)
+        series = trends["series"][0]
+
+        self.assertEqual(series["total_points"], 500)
+        self.assertEqual(len(series["points"]), 50)
+        self.assertEqual(series["points"][0]["date"], "2020-01-01")
+        self.assertIn("H", [p["flag"] for p in series["points"]])
+
+    def test_date_filter(self):
+        trends = build_trends(self.store, date_from="2020-02-01", date_to="2020-02-10")
+
+        self.assertEqual([p["date"][-2:] for p in trends["series"][0]["points"]], [f"{d:02d}" for d in range(1, 11)])
+
+    def test_lttb_short_series_unchanged(self):
+        self.assertEqual(list(lttb_indices([1, 2, 3], [1, 5, 2], 10)), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
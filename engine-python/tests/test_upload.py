@@ -0,0 +1,153 @@
+import unittest
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import matplotlib
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import server
+from artifact_store import SqliteArtifactStore, ARTIFACT_RESULT
+from google_vision_ocr import PageOCRError
+
+RESULT = {"meta": {"date_examination": "2025-12-31"}, "examinations": [{"name": "Leukocyty", "value": 5.53}]}
+
+
+def text_layer_pdf(lines):
+    """PDF z warstwą tekstową zbudowany w pamięci (bez zapisu na dysk)."""
+    buffer = io.BytesIO()
+    with matplotlib.rc_context({"pdf.fonttype": 42}), PdfPages(buffer) as pdf:
+        fig = Figure(figsize=(8.27, 11.69))
+        for row, line in enumerate(lines):
+            fig.text(0.07, 0.95 - row * 0.025, line, fontsize=9)
+        pdf.savefig(fig)
+    return buffer.getvalue()
+
+
+def multipart_body(files, boundary="granica"):
+    """Treść multipart/form-data z plikami [(pole, nazwa, bajty)]."""
+    body = b""
+    for field, name, content in files:
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{name}\"\r\n"
+                 f"Content-Type: application/pdf\r\n\r\n").encode() + content + b"\r\n"
+    return body + f"--{boundary}--\r\n".encode()
+
+
+class TestUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.artifact_store = SqliteArtifactStore(os.path.join(self.tmp_dir.name, "artifacts.sqlite"))
+        self.analyzer = mock.Mock()
+        self.analyzer.analyze_text.return_value = RESULT
+        patchers = [
+            mock.patch.object(server, "analyzer", self.analyzer),
+            mock.patch.object(server, "vision_ocr", None),
+            mock.patch.object(server, "result_cache", None),
+            mock.patch.object(server, "results_store", None),
+            mock.patch.object(main, "LOCAL_PARSER_ENABLED", False),
+            mock.patch.object(main, "get_artifact_store", lambda: self.artifact_store),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = TestClient(server.app)
+
+    def tearDown(self):
+        self.artifact_store.close()
+        self.tmp_dir.cleanup()
+
+    def test_raw_body_is_analyzed_from_memory(self):
+        pdf = text_layer_pdf(["Morfologia krwi", "Leukocyty 5,53 tys/ul 4,00 - 10,00"])
+
+        response = self.client.post("/analyze/upload", params={"filename": "../../wynik.pdf"}, content=pdf,
+                                    headers={"Content-Type": "application/pdf"})
+
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report["processed_count"], 1)
+        # Nazwa bez katalogów - tak backend dopasowuje wynik
+        self.assertEqual(report["results"][0]["file"], "wynik.pdf")
+        self.assertEqual(report["results"][0]["data"], RESULT)
+        self.assertIn("Leukocyty", self.analyzer.analyze_text.call_args[0][0])
+        # Wynik zapisany w magazynie artefaktów pod SHA-256 przesłanych bajtów
+        self.artifact_store.flush()
+        self.assertEqual(self.artifact_store.get_json(hashlib.sha256(pdf).hexdigest(), ARTIFACT_RESULT), RESULT)
+
+    def test_failed_ocr_pages_are_reported(self):
+        """Błąd OCR części stron trafia do odpowiedzi z numerami stron, a nie jako pusty wynik."""
+        vision = mock.Mock()
+        vision.iter_page_images.side_effect = lambda file_path, pages=None, content=None: iter([b"strona"] * len(pages))
+        vision.ocr_images.side_effect = PageOCRError({0: "DEADLINE_EXCEEDED"}, [None])
+        scanned = text_layer_pdf([])  # Strona bez warstwy tekstowej - idzie do OCR
+
+        with mock.patch.object(server, "vision_ocr", vision), mock.patch.object(main, "USE_PDF_TEXT_LAYER", True):
+            response = self.client.post("/analyze/upload", params={"filename": "skan.pdf"}, content=scanned,
+                                        headers={"Content-Type": "application/pdf"})
+
+        report = response.json()
+        self.assertEqual(report["error_count"], 1)
+        self.assertEqual(report["errors"][0]["failed_pages"], [1])
+        self.assertIn("strona 1: DEADLINE_EXCEEDED", report["errors"][0]["error"])
+        self.analyzer.analyze_text.assert_not_called()
+
+    def test_raw_body_requires_filename(self):
+        response = self.client.post("/analyze/upload", content=b"%PDF-1.4", headers={"Content-Type": "application/pdf"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_size_limit(self):
+        with mock.patch.object(server, "UPLOAD_MAX_BYTES", 4):
+            response = self.client.post("/analyze/upload", params={"filename": "duzy.pdf"}, content=b"%PDF-1.4",
+                                        headers={"Content-Type": "application/pdf"})
+        self.assertEqual(response.status_code, 413)
+        self.analyzer.analyze_text.assert_not_called()
+
+    def test_multipart_upload(self):
+        pdf = text_layer_pdf(["Morfologia krwi", "Leukocyty 5,53 tys/ul 4,00 - 10,00"])
+        body = multipart_body([("files", "wynik.pdf", pdf), ("inne", "pominiety.pdf", b"%PDF-1.4")])
+        response = self.client.post("/analyze/upload", content=body,
+                                    headers={"Content-Type": "multipart/form-data; boundary=granica"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry["file"] for entry in response.json()["results"]], ["wynik.pdf"])
+
+    def test_multipart_content_length_checked_up_front(self):
+        body = multipart_body([("files", "duzy.pdf", b"%PDF-1.4" * 10)])
+        with mock.patch.object(server, "UPLOAD_MAX_REQUEST_BYTES", 16):
+            response = self.client.post("/analyze/upload", content=body,
+                                        headers={"Content-Type": "multipart/form-data; boundary=granica"})
+        self.assertEqual(response.status_code, 413)
+        self.analyzer.analyze_text.assert_not_called()
+
+    def test_multipart_part_reading_stops_at_limit(self):
+        head = multipart_body([("files", "duzy.pdf", b"")])[:-len(b"\r\n--granica--\r\n")]
+        chunks = [head] + [b"x" * 1024] * 100
+        received = []
+
+        async def receive():
+            received.append(1)
+            return {"type": "http.request", "body": chunks[len(received) - 1], "more_body": len(received) < len(chunks)}
+
+        request = Request({"type": "http", "method": "POST", "path": "/analyze/upload",
+                           "headers": [(b"content-type", b"multipart/form-data; boundary=granica")]}, receive)
+        with mock.patch.object(server, "UPLOAD_MAX_BYTES", 4096):
+            with self.assertRaises(HTTPException) as ctx:
+                asyncio.run(server._read_multipart_uploads(request))
+
+        self.assertEqual(ctx.exception.status_code, 413)
+        self.assertLess(len(received), 10)  # Reszta części nie została odczytana
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+from operator import itemgetter
+import numpy as np
+
+def words_to_lines(words, y_tolerance=10):
+    """
+    Składa słowa w wiersze tekstu na podstawie ich fizycznego położenia.
+    words: lista słowników {"text", "y" (środek w pionie), "x" (lewa krawędź), "height"}.
+    Wspólne dla Google Vision i warstwy tekstowej PDF, aby oba źródła dawały ten sam układ wierszy.
+    """
+    if not words: return ""
+
+    return lines_from_arrays(
+        [w["text"] for w in words],
+        np.array([w["x"] for w in words], dtype=np.float64),
+        np.array([w["y"] for w in words], dtype=np.float64),
+        np.array([w["height"] for w in words], dtype=np.float64),
+        y_tolerance=y_tolerance,
+    )
+
+
+def lines_from_arrays(texts, xs, ys, heights, y_tolerance=10):
+    """
+    Wektorowa wersja grupowania słów w wiersze (NumPy).
+    Daje identyczny wynik jak _words_to_lines_py: słowa sortowane stabilnie po Y,
+    nowy wiersz zaczyna się od pierwszego słowa, którego odległość od początku wiersza
+    przekracza max(y_tolerance, 0.6 * wysokość słowa); w wierszu sortowanie stabilne po X.
+    """
+    count = len(texts)
+    if count == 0: return ""
+
+    # 2. Sortowanie zgrubne po Y (stabilne, jak list.sort)
+    order = np.argsort(ys, kind="stable")
+    y = ys[order]
+    tolerance = np.maximum(y_tolerance, heights[order] * 0.6)
+
+    # 3. Grupowanie w wiersze.
+    # Słowo j zaczyna nowy wiersz względem początku a, gdy y[j] - tolerancja[j] > y[a].
+    # Dla k <= a zawsze y[k] - tolerancja[k] < y[a], więc pierwsze takie j > a to pierwszy
+    # indeks, w którym narastające maksimum (y - tolerancja) przekracza y[a] - searchsorted
+    # wyznacza koniec wiersza dla każdego możliwego początku naraz.
+    running_max = np.maximum.accumulate(y - tolerance)
+    line_end = np.searchsorted(running_max, y, side="right").tolist()
+
+    starts = []
+    start = 0
+    while start < count:
+        starts.append(start)
+        start = line_end[start]
+
+    is_start = np.zeros(count, dtype=bool)
+    is_start[starts] = True
+    line_ids = np.cumsum(is_start) - 1
+
+    # Kontrola dokładna (te same operacje zmiennoprzecinkowe co w wersji pythonowej):
+    # przestawienie nierówności może się różnić na granicy precyzji - wtedy liczymy wzorcowo.
+    start_y = y[starts]
+    distance = y - start_y[line_ids]
+    if np.any(distance[~is_start] > tolerance[~is_start]) or \
+            np.any(np.diff(start_y) <= tolerance[starts][1:]):
+        words = [{"text": texts[i], "x": float(xs[i]), "y": float(ys[i]), "height": float(heights[i])}
+                 for i in range(count)]
+        return _words_to_lines_py(words, y_tolerance=y_tolerance)
+
+    # 4. Sortowanie w obrębie wierszy po X (lexsort jest stabilny)
+    word_order = order[np.lexsort((xs[order], line_ids))].tolist()
+    sorted_texts = [texts[i] for i in word_order] if count == 1 else list(itemgetter(*word_order)(texts))
+
+    lines = []
+    position = 0
+    for length in np.bincount(line_ids).tolist():
+        lines.append(" ".join(sorted_texts[position:position + length]))
+        position += length
+    return "\n".join(lines)
+
+
+def _words_to_lines_py(words, y_tolerance=10):
+    """
+    Pierwotna (czysto pythonowa) implementacja grupowania wierszy.
+    Zostaje jako wzorzec dla testów zgodności i benchmarku.
+    """
+    if not words: return ""
+
+    # 2. Sortowanie zgrubne po Y
+    words = sorted(words, key=lambda w: w["y"])
+
+    # 3. Grupowanie w wiersze (Line Clustering)
+    lines = []
+    current_line = [words[0]]
+    current_line_y = words[0]["y"]
+
+    for word in words[1:]:
+        tolerance = max(y_tolerance, word["height"] * 0.6)
+        if abs(word["y"] - current_line_y) <= tolerance:
+            current_line.append(word)
+        else:
+            current_line.sort(key=lambda w: w["x"])
+            lines.append(" ".join([w["text"] for w in current_line]))
+            current_line = [word]
+            current_line_y = word["y"]
+
+    if current_line:
+        current_line.sort(key=lambda w: w["x"])
+        lines.append(" ".join([w["text"] for w in current_line]))
+
+    return "\n".join(lines)
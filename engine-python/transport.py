@@ -0,0 +1,132 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+TRANSPORT_LIVE = "live"  # Zapytania do usług, bez kasety
+TRANSPORT_RECORD = "record"  # Zapytania do usług + zapis par zapytanie/odpowiedź do kasety
+TRANSPORT_REPLAY = "replay"  # Odpowiedzi wyłącznie z kasety - bez sieci i bez kluczy API
+TRANSPORT_MODES = (TRANSPORT_LIVE, TRANSPORT_RECORD, TRANSPORT_REPLAY)
+
+
+class CassetteMissError(KeyError):
+    """Tryb replay: w kasecie nie ma odpowiedzi na to zapytanie."""
+    def __init__(self, service, key):
+        self.service = service
+        self.key = key
+        super().__init__(f"Brak nagrania {service} dla klucza {key[:16]}... (nagraj w trybie 'record')")
+
+
+def cassette_key(*parts):
+    """
+    Klucz nagrania: SHA-256 części zapytania (bajty obrazu strony, tekst promptu, model, schemat...).
+    Długość każdej części jest doliczana, więc ("ab", "c") i ("a", "bc") dają różne klucze.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class CassetteStore:
+    """Kaseta w SQLite: skompresowana (zlib) odpowiedź i czas jej otrzymania dla (usługa, klucz)."""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    service TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    latency REAL NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    PRIMARY KEY (service, key)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, service, keys):
+        """Zwraca {klucz: (odpowiedź w bajtach, czas odpowiedzi)} dla nagranych kluczy."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT key, payload, latency FROM recordings WHERE service = ? AND key IN ({', '.join('?' * len(keys))})",
+                [service, *keys],
+            ).fetchall()
+        return {key: (zlib.decompress(payload), latency) for key, payload, latency in rows}
+
+    def put(self, service, key, payload, latency):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?)",
+                (service, key, zlib.compress(payload), latency, time.time()),
+            )
+
+    def count(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT service, COUNT(*) FROM recordings GROUP BY service").fetchall())
+
+
+class Transport:
+    """
+    Warstwa między potokiem a usługami zewnętrznymi (Google Vision, Gemini, xAI).
+    live - bez zmian; record - odpowiedzi zapisywane do kasety; replay - odpowiedzi z kasety,
+    opcjonalnie z nagranym opóźnieniem (simulate_latency), bez sieci, limitów i kluczy API.
+    Odpowiedzi są bajtami - serializację (protobuf Vision, tekst JSON z AI) robi wywołujący.
+    """
+    def __init__(self, mode=TRANSPORT_LIVE, store=None, simulate_latency=False):
+        if mode not in TRANSPORT_MODES:
+            raise ValueError(f"Nieznany tryb transportu: {mode}")
+        if mode != TRANSPORT_LIVE and store is None:
+            raise ValueError(f"Tryb '{mode}' wymaga kasety (CassetteStore).")
+        self.mode = mode
+        self.store = store
+        self.simulate_latency = simulate_latency
+
+    @property
+    def active(self):
+        """False w trybie live - wtedy nie ma potrzeby liczyć kluczy nagrań."""
+        return self.mode != TRANSPORT_LIVE
+
+    @property
+    def replaying(self):
+        return self.mode == TRANSPORT_REPLAY
+
+    def record(self, service, key, payload, latency):
+        """Zapisuje odpowiedź (tylko w trybie record)."""
+        if self.mode == TRANSPORT_RECORD:
+            self.store.put(service, key, payload, latency)
+
+    def replay_many(self, service, keys):
+        """
+        Odpowiedzi dla wielu kluczy (np. stron jednego zapytania wsadowego Vision), w kolejności kluczy.
+        Przy simulate_latency czeka najdłuższy nagrany czas - strony wsadu szły jednym zapytaniem.
+        """
+        found = self.store.get_many(service, list(set(keys)))
+        for key in keys:
+            if key not in found:
+                raise CassetteMissError(service, key)
+        if self.simulate_latency:
+            time.sleep(max(found[key][1] for key in keys))
+        return [found[key][0] for key in keys]
+
+    def replay(self, service, key):
+        return self.replay_many(service, [key])[0]
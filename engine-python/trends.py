@@ -0,0 +1,87 @@
+from datetime import date as date_type
+from itertools import groupby
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: wybiera `threshold` punktów, które najlepiej zachowują
+    kształt wykresu (pierwszy i ostatni punkt zawsze zostają). Zwraca posortowane indeksy.
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Granice kubełków dla punktów środkowych (bez pierwszego i ostatniego)
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Średnia następnego kubełka (dla ostatniego - ostatni punkt)
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else count
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Pole trójkąta (poprzedni wybrany, kandydat, średnia następnego kubełka)
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _day_number(iso_date):
+    try:
+        return date_type.fromisoformat(iso_date).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def build_trends(results_store, series_keys=None, date_from=None, date_to=None, max_points=None):
+    """
+    Gotowe serie czasowe parametrów z magazynu wyników (ten sam klucz serii i normalizacja
+    co _flatten_lab_results). Długie historie są zmniejszane do max_points punktów (LTTB),
+    więc rozmiar odpowiedzi zależy od tego, co jest wyświetlane, a nie od całej historii.
+    """
+    rows = results_store.query(series_keys=series_keys, date_from=date_from, date_to=date_to)
+
+    series = []
+    for series_key, group in groupby(rows, key=lambda row: row["series_key"]):
+        points = [row for row in group if row["value"] is not None and _day_number(row["date"]) is not None]
+        if not points:
+            continue
+
+        total = len(points)
+        if max_points and total > max_points:
+            indices = lttb_indices([_day_number(p["date"]) for p in points], [p["value"] for p in points], max_points)
+            points = [points[i] for i in indices]
+
+        first = points[0]
+        series.append({
+            "series_key": series_key,
+            "section": first["section"],
+            "parameter": first["parameter"],
+            "unit": first["unit"],
+            "total_points": total,
+            "points": [
+                {
+                    "date": p["date"],
+                    "value": p["value"],
+                    "range_min": p["range_min"],
+                    "range_max": p["range_max"],
+                    "flag": p["flag"],
+                }
+                for p in points
+            ],
+        })
+
+    return {"date_from": date_from, "date_to": date_to, "series": series}